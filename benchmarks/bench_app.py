@@ -0,0 +1,177 @@
+"""Drives a synthetic routes/ tree through the Flask test client and a local WSGI server.
+
+Runs in its own process (the router and engine keep module-level state), prints
+one JSON object with the results. Usually started through
+`python -m benchmarks.run`.
+"""
+import argparse
+import http.client
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from flask import Flask, Response, g, request
+from werkzeug.serving import BaseWSGIServer, make_server
+from benchmarks.common import ROOT_DIR, summarize
+from benchmarks.synth import generate_routes
+
+SCENARIOS = ("static", "dynamic", "nested", "asset", "not_found")
+ALLOC_SAMPLES = 200
+
+
+def build_app(root: str) -> Flask:
+    """Creates an app over root/routes configured like main.py."""
+    # core.logger creates logs/ in the working directory on import
+    os.chdir(root)
+    from core import logger as core_logger
+
+    # Console output would dominate the numbers; the file handler stays as in production
+    for handler in list(core_logger.logger.handlers):
+        if type(handler) is logging.StreamHandler:
+            core_logger.logger.removeHandler(handler)
+
+    from core.logger import log_debug, log_request
+    from core.metrics import finish_request
+    from core.engine import setup
+    from core.router import register_routes
+
+    app = Flask("benchmark", root_path=root, static_folder="routes",
+                static_url_path="", template_folder="routes")
+    app.config["SECRET_KEY"] = "benchmark"
+
+    @app.before_request
+    def log_before_request() -> None:
+        g.request_started = time.perf_counter()
+        log_debug(f"Request received: {request.method} {request.path} from {request.remote_addr}")
+
+    @app.after_request
+    def log_after_request(response: Response) -> Response:
+        started: Optional[float] = g.get('request_started')
+        elapsed = time.perf_counter() - started if started else None
+        finish_request(response.status_code, elapsed)
+        latency_ms = round(elapsed * 1000, 3) if elapsed is not None else None
+        log_request(request.path, request.method, response.status_code, latency_ms)
+        return response
+
+    setup(app)
+    register_routes(app)
+    return app
+
+
+def measure(send: Callable[[str], int], paths: List[str], requests: int,
+            track_allocations: bool) -> Dict[str, Any]:
+    for path in paths[:20]:
+        send(path)
+
+    errors = 0
+    latencies: List[float] = []
+    started = time.perf_counter()
+    for i in range(requests):
+        path = paths[i % len(paths)]
+        t0 = time.perf_counter()
+        status = send(path)
+        latencies.append(time.perf_counter() - t0)
+        if status >= 500:
+            errors += 1
+    elapsed = time.perf_counter() - started
+
+    peaks: List[int] = []
+    if track_allocations:
+        tracemalloc.start()
+        for i in range(min(requests, ALLOC_SAMPLES)):
+            tracemalloc.reset_peak()
+            current = tracemalloc.get_traced_memory()[0]
+            send(paths[i % len(paths)])
+            peaks.append(tracemalloc.get_traced_memory()[1] - current)
+        tracemalloc.stop()
+
+    summary = summarize(latencies, elapsed, peaks)
+    summary["errors"] = errors
+    return summary
+
+
+def test_client_sender(app: Flask) -> Callable[[str], int]:
+    client = app.test_client()
+
+    def send(path: str) -> int:
+        response = client.get(path)
+        response.get_data()
+        return response.status_code
+    return send
+
+
+def wsgi_server_sender(app: Flask) -> Tuple[Callable[[str], int], BaseWSGIServer]:
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    port = server.server_port
+
+    def send(path: str) -> int:
+        connection = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+        try:
+            connection.request("GET", path)
+            response = connection.getresponse()
+            response.read()
+            status: int = response.status
+            return status
+        finally:
+            connection.close()
+    return send, server
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--routes", type=int, default=100,
+                        help="number of generated route directories")
+    parser.add_argument("--requests", type=int, default=2000, help="requests per scenario")
+    parser.add_argument("--no-layout", action="store_true",
+                        help="generate routes without _layout.html")
+    parser.add_argument("--no-server", action="store_true", help="skip the local WSGI server runs")
+    parser.add_argument("--no-alloc", action="store_true", help="skip allocation tracking")
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix="router_bench_")
+    paths = generate_routes(root, args.routes, layout=not args.no_layout)
+    paths["not_found"] = [f"/missing/{i}/x" for i in range(50)]
+
+    started = time.perf_counter()
+    app = build_app(root)
+    startup_ms = round((time.perf_counter() - started) * 1000, 2)
+
+    results: Dict[str, Any] = {
+        "routes": args.routes,
+        "layout": not args.no_layout,
+        "startup_ms": startup_ms,
+        "test_client": {},
+        "wsgi_server": {},
+    }
+
+    send = test_client_sender(app)
+    for scenario in SCENARIOS:
+        if paths.get(scenario):
+            results["test_client"][scenario] = measure(
+                send, paths[scenario], args.requests, not args.no_alloc
+            )
+
+    if not args.no_server:
+        send, server = wsgi_server_sender(app)
+        try:
+            for scenario in SCENARIOS:
+                if paths.get(scenario):
+                    results["wsgi_server"][scenario] = measure(
+                        send, paths[scenario], max(1, args.requests // 4), False
+                    )
+        finally:
+            server.shutdown()
+
+    os.chdir(ROOT_DIR)
+    print(json.dumps(results))
+
+
+if __name__ == "__main__":
+    main()
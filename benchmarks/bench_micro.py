@@ -0,0 +1,280 @@
+"""Micro-benchmarks for the logging, log-server and auth hot paths.
+
+Prints one JSON object with the results. Usually started through
+`python -m benchmarks.run`.
+"""
+import argparse
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from typing import Any, Callable, Dict, List
+
+from core.log_format import JsonFormatter, TEXT_FORMAT, TIMESTAMP_FORMAT, parse_line
+from core.log_queue import QueuedFileHandler
+from logserver.broadcast import LogBroadcaster
+
+TEXT_LINE = "2025-03-20 17:16:40 - [INFO] - Route: /user/dashboard | Method: GET | Status: 200"
+JSON_LINE = ('{"ts":1742481400.123,"level":"INFO",'
+             '"msg":"Route: /user/dashboard | Method: GET | Status: 200",'
+             '"route":"/user/dashboard","method":"GET","status":200,"latency_ms":3.2,'
+             '"session":"20250320_171640"}')
+TRACEBACK_LINE = '  File "/app/core/router.py", line 31, in handler'
+
+
+def timed(fn: Callable[[], Any], iterations: int) -> Dict[str, Any]:
+    """Runs fn `iterations` times and reports operations per second."""
+    started = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    elapsed = time.perf_counter() - started
+    return {
+        "iterations": iterations,
+        "ops_per_sec": round(iterations / elapsed, 1),
+        "us_per_op": round(elapsed / iterations * 1e6, 3),
+    }
+
+
+def bench_log_parsing(iterations: int) -> Dict[str, Any]:
+    return {
+        "text_line": timed(lambda: parse_line(TEXT_LINE, "bench.log"), iterations),
+        "json_line": timed(lambda: parse_line(JSON_LINE, "bench.log"), iterations),
+        "unstructured_line": timed(lambda: parse_line(TRACEBACK_LINE, "bench.log"), iterations),
+    }
+
+
+def bench_log_emit(iterations: int) -> Dict[str, Any]:
+    """Cost of one logger.info call on the request thread for each file handler setup."""
+    results = {}
+    directory = tempfile.mkdtemp(prefix="router_bench_logs_")
+    text = logging.Formatter(TEXT_FORMAT, TIMESTAMP_FORMAT)
+    json_lines = JsonFormatter("bench")
+    setups = {
+        "file_text": lambda path: _with_formatter(logging.FileHandler(path), text),
+        "file_json": lambda path: _with_formatter(logging.FileHandler(path), json_lines),
+        "queued_text": lambda path: _with_formatter(QueuedFileHandler(path), text),
+    }
+    for name, create in setups.items():
+        handler = create(os.path.join(directory, f"{name}.log"))
+        bench_logger = logging.getLogger(f"benchmark.{name}")
+        bench_logger.propagate = False
+        bench_logger.setLevel(logging.DEBUG)
+        bench_logger.addHandler(handler)
+        extra = {"route": "/user/dashboard", "method": "GET", "status": 200, "latency_ms": 3.2}
+        message = "Route: /user/dashboard | Method: GET | Status: 200"
+        results[name] = timed(lambda: bench_logger.info(message, extra=extra), iterations)
+        bench_logger.removeHandler(handler)
+        handler.close()
+    return results
+
+
+def _with_formatter(handler: logging.Handler, formatter: logging.Formatter) -> logging.Handler:
+    handler.setFormatter(formatter)
+    return handler
+
+
+def bench_sse_fanout(clients: int, batches: int) -> Dict[str, Any]:
+    """Publishes batches to `clients` concurrent stream readers and waits until all got them."""
+    size = max(batches * 2, 1024)
+    broadcaster = LogBroadcaster(capacity=size, max_backlog=size, heartbeat=1.0)
+    payload = json.dumps([parse_line(TEXT_LINE, "bench.log")] * 10)
+    received = [0] * clients
+    ready = threading.Barrier(clients + 1)
+
+    def reader(index: int) -> None:
+        stream = broadcaster.stream()
+        next(stream)
+        next(stream)
+        ready.wait()
+        while received[index] < batches:
+            chunk = next(stream)
+            received[index] += chunk.count("\ndata: ")
+        stream.close()
+
+    threads = [threading.Thread(target=reader, args=(i,), daemon=True) for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    ready.wait()
+
+    started = time.perf_counter()
+    for _ in range(batches):
+        broadcaster.publish(payload)
+    publish_elapsed = time.perf_counter() - started
+    for thread in threads:
+        thread.join(timeout=30)
+    elapsed = time.perf_counter() - started
+
+    return {
+        "clients": clients,
+        "batches": batches,
+        "publish_us_per_batch": round(publish_elapsed / batches * 1e6, 3),
+        "delivered_batches_per_sec": round(clients * batches / elapsed, 1),
+        "complete": all(count >= batches for count in received),
+    }
+
+
+def bench_stream_coalescing(lines: int) -> Dict[str, Any]:
+    """Publishes lines one at a time through the batching window; frames and bytes per format."""
+    entry = parse_line(TEXT_LINE, "bench.log")
+    results = {}
+    for window in (0.0, 0.05):
+        broadcaster = LogBroadcaster(
+            capacity=lines + 1, max_backlog=lines + 1, heartbeat=1.0, batch_window=window
+        )
+        stream = broadcaster.stream(format="columnar")
+        next(stream)
+        next(stream)
+        started = time.perf_counter()
+        for _ in range(lines):
+            broadcaster.publish_entries([dict(entry)])
+        broadcaster.flush()
+        elapsed = time.perf_counter() - started
+        frames = [
+            broadcaster._frames[i % broadcaster.capacity]
+            for i in range(broadcaster.oldest_id, broadcaster.last_id + 1)
+        ]
+        stream.close()
+        results[f"window_{window}"] = {
+            "lines": lines,
+            "frames": len(frames),
+            "publish_us_per_line": round(elapsed / lines * 1e6, 3),
+            "rows_bytes": sum(len(frame[0]) for frame in frames),
+            "columnar_bytes": sum(len(frame[1]) for frame in frames),
+        }
+    return results
+
+
+def bench_tailer(lines: int, lines_per_write: int = 50) -> Dict[str, Any]:
+    """Lines per second read back from a growing log and published to the stream.
+
+    Writes are cut mid-line and each one is followed by a modify notification,
+    like the file watcher sends them. "reopen" is the old open/seek/read per
+    event for comparison; it splits lines wherever a write stopped.
+    """
+    from logserver.tailer import LogTailer
+
+    directory = tempfile.mkdtemp(prefix="router_bench_tail_")
+    line = (TEXT_LINE + "\n").encode()
+    chunk = line * lines_per_write
+    cut = len(chunk) - len(line) // 2
+    writes = lines // lines_per_write
+    results = {}
+
+    for mode in ("tailer", "reopen"):
+        path = os.path.join(directory, f"{mode}.log")
+        open(path, "wb").close()
+        size = writes * 2 + 2
+        broadcaster = LogBroadcaster(capacity=size, max_backlog=size, heartbeat=1.0)
+        received = [0, 0]
+
+        def on_lines(log_file: str, new_lines: List[str]) -> None:
+            broadcaster.publish_entries([parse_line(text, "bench.log") for text in new_lines])
+            received[1] += sum(1 for text in new_lines if not text.startswith("2025-"))
+            received[0] += len(new_lines)
+
+        tailer = LogTailer(on_lines)
+        tailer.track(path)
+        position = [0]
+
+        def reopen(log_file: str) -> None:
+            with open(log_file, "r", encoding="utf-8") as f:
+                f.seek(position[0])
+                content = f.read()
+                position[0] = f.tell()
+            if content:
+                on_lines(log_file, content.splitlines())
+
+        notify = tailer.notify if mode == "tailer" else reopen
+        started = time.perf_counter()
+        with open(path, "ab", buffering=0) as f:
+            pending = b""
+            for _ in range(writes):
+                data = pending + chunk
+                f.write(data[:cut])
+                pending = data[cut:]
+                notify(path)
+            f.write(pending)
+            notify(path)
+        deadline = time.monotonic() + 30
+        while received[0] < writes * lines_per_write and time.monotonic() < deadline:
+            time.sleep(0.001)
+        broadcaster.flush()
+        elapsed = time.perf_counter() - started
+        results[mode] = {
+            "lines": received[0],
+            "lines_per_sec": round(received[0] / elapsed, 1),
+            "broken_lines": received[1],
+            "frames": broadcaster.last_id,
+        }
+    return results
+
+
+def bench_log_stats(lines: int) -> Dict[str, Any]:
+    """Cost of counting a tailed line and of answering a one-day stats query."""
+    from logserver.stats import LogStats
+
+    stats = LogStats()
+    now = time.time()
+    entries = [
+        dict(parse_line(TEXT_LINE, "bench.log"),
+             timestamp=time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(now - i)))
+        for i in range(0, 86400, max(1, 86400 // lines))
+    ]
+    started = time.perf_counter()
+    stats.add_entries(entries)
+    add_elapsed = time.perf_counter() - started
+    return {
+        "lines": len(entries),
+        "add_us_per_line": round(add_elapsed / len(entries) * 1e6, 3),
+        "query_day": timed(lambda: stats.query(now - 86400, now, step=3600), 20),
+        "query_hour": timed(lambda: stats.query(now - 3600, now), 200),
+    }
+
+
+def bench_auth(rules: int, iterations: int) -> Dict[str, Any]:
+    from core import middleware
+
+    for i in range(rules):
+        middleware.PROTECTED_ROUTES.append(f"/tenant{i}/admin")
+        middleware.PROTECTED_PATTERNS.append(rf"^/tenant{i}/[^/]+/edit$")
+    middleware.reload_protection()
+
+    last = f"/tenant{rules - 1}"
+    return {
+        "rules": rules * 2,
+        "miss": timed(lambda: middleware.is_protected("/user/dashboard/settings"), iterations),
+        "prefix_hit": timed(lambda: middleware.is_protected(f"{last}/admin/users"), iterations),
+        "pattern_hit": timed(lambda: middleware.is_protected(f"{last}/42/edit"), iterations),
+        "registered_route": timed(
+            lambda: middleware.route_protection("/user/dashboard"), iterations
+        ),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--iterations", type=int, default=50000)
+    parser.add_argument("--clients", type=int, default=25,
+                        help="SSE clients for the fan-out benchmark")
+    parser.add_argument("--batches", type=int, default=500,
+                        help="batches published in the fan-out benchmark")
+    parser.add_argument("--auth-rules", type=int, default=250,
+                        help="protected prefixes (and as many patterns)")
+    args = parser.parse_args()
+
+    results = {
+        "log_parsing": bench_log_parsing(args.iterations),
+        "log_emit": bench_log_emit(max(1, args.iterations // 5)),
+        "sse_fanout": bench_sse_fanout(args.clients, args.batches),
+        "stream_coalescing": bench_stream_coalescing(max(1, args.iterations // 10)),
+        "tailer": bench_tailer(max(50, args.iterations * 2)),
+        "log_stats": bench_log_stats(args.iterations),
+        "auth": bench_auth(args.auth_rules, args.iterations),
+    }
+    print(json.dumps(results))
+
+
+if __name__ == "__main__":
+    main()
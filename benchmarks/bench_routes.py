@@ -0,0 +1,119 @@
+"""Dispatch latency of the route table as the number of routes grows.
+
+Each size is a set of tenants with four routes each (static, [id:int],
+nested [item:uuid] and [...path] catch-all), matched through the route
+table alone and through the RouteMap the app uses, with werkzeug's own
+Map over the same rules for comparison.
+
+Prints one JSON object with the results. Usually started through
+`python -m benchmarks.run`.
+"""
+import argparse
+import json
+import random
+import time
+from typing import Any, Callable, Dict, List, Tuple
+
+from werkzeug.exceptions import NotFound
+from werkzeug.routing import Map, Rule
+from benchmarks.bench_micro import timed
+from core.manifest import to_endpoint, to_flask_rule
+from core.route_table import RouteMap, RouteTable
+
+UUID = "123e4567-e89b-12d3-a456-426614174000"
+SCENARIOS: Dict[str, Callable[[int], str]] = {
+    "static": lambda t: f"/tenant{t}/settings",
+    "int": lambda t: f"/tenant{t}/42",
+    "nested_uuid": lambda t: f"/tenant{t}/items/{UUID}/edit",
+    "catch_all": lambda t: f"/tenant{t}/files/a/b/c.txt",
+    "miss": lambda t: f"/tenant{t}/items/not-a-uuid/edit",
+}
+
+
+def route_dirs(count: int) -> List[str]:
+    routes = []
+    for tenant in range(max(1, count // 4)):
+        routes += [f"tenant{tenant}/settings", f"tenant{tenant}/[id:int]",
+                   f"tenant{tenant}/items/[item:uuid]/edit", f"tenant{tenant}/files/[...path]"]
+    return routes[:count]
+
+
+def make_rule(route: str) -> Rule:
+    return Rule(to_flask_rule(route), endpoint=to_endpoint(route), methods=["GET", "POST"])
+
+
+def build_table(routes: List[str]) -> Tuple[RouteTable, float]:
+    started = time.perf_counter()
+    table = RouteTable()
+    for route in routes:
+        table.add(route, make_rule(route))
+    return table, time.perf_counter() - started
+
+
+def build_werkzeug(routes: List[str]) -> Tuple[Map, float]:
+    started = time.perf_counter()
+    url_map = Map([make_rule(route) for route in routes])
+    url_map.update()
+    return url_map, time.perf_counter() - started
+
+
+def dispatch(match: Callable[[str], Any], paths: List[str], iterations: int) -> Dict[str, Any]:
+    cycle = iter(paths * (iterations // len(paths) + 1))
+
+    def run() -> None:
+        try:
+            match(next(cycle))
+        except NotFound:
+            pass
+
+    return timed(run, iterations)
+
+
+def bench_size(count: int, iterations: int, werkzeug: bool) -> Dict[str, Any]:
+    routes = route_dirs(count)
+    tenants = max(1, count // 4)
+    rng = random.Random(count)
+    # Spread the requests over all tenants so no single path stays hot
+    paths = {
+        name: [make(rng.randrange(tenants)) for _ in range(1000)]
+        for name, make in SCENARIOS.items()
+    }
+
+    table, table_build = build_table(routes)
+    route_map = RouteMap([
+        Rule("/<path:filename>", endpoint="static"), Rule("/debug/routes", endpoint="debug")
+    ])
+    route_map.table = table
+    adapter = route_map.bind("localhost")
+
+    result: Dict[str, Any] = {
+        "routes": len(table),
+        "table_build_ms": round(table_build * 1000, 2),
+        "table": {name: dispatch(table.match, p, iterations) for name, p in paths.items()},
+        "route_map": {name: dispatch(adapter.match, p, iterations) for name, p in paths.items()},
+    }
+    if werkzeug:
+        url_map, werkzeug_build = build_werkzeug(routes)
+        werkzeug_adapter = url_map.bind("localhost")
+        result["werkzeug_build_ms"] = round(werkzeug_build * 1000, 2)
+        result["werkzeug"] = {
+            name: dispatch(werkzeug_adapter.match, p, iterations) for name, p in paths.items()
+        }
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", default="10,1000,10000", help="comma separated route counts")
+    parser.add_argument("--iterations", type=int, default=50000)
+    parser.add_argument("--no-werkzeug", action="store_true",
+                        help="skip the werkzeug Map comparison")
+    args = parser.parse_args()
+
+    results = {size: bench_size(int(size), args.iterations, not args.no_werkzeug)
+               for size in args.sizes.split(",") if size}
+    print(json.dumps(results))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT_DIR, "benchmarks", "results")
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of a list of numbers."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+
+def summarize(latencies: List[float], elapsed: float,
+              peak_bytes: Optional[List[int]] = None) -> Dict[str, Any]:
+    """Turns per-request latencies (seconds) into requests/s and p50/p99 in milliseconds."""
+    summary: Dict[str, Any] = {
+        "requests": len(latencies),
+        "requests_per_sec": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 4),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 4),
+    }
+    if peak_bytes:
+        summary["alloc_peak_kib_per_request"] = round(sum(peak_bytes) / len(peak_bytes) / 1024, 2)
+    return summary
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def environment() -> Dict[str, Any]:
+    return {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+    }
+
+
+def save_results(results: Dict[str, Any], output: Optional[str] = None) -> str:
+    """Writes results as JSON, by default to benchmarks/results/<timestamp>_<commit>.json."""
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        commit = results.get("environment", {}).get("commit", "unknown")
+        name = f"{time.strftime('%Y%m%d_%H%M%S')}_{commit}.json"
+        output = os.path.join(RESULTS_DIR, name)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+    return output
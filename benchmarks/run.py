@@ -0,0 +1,110 @@
+"""Runs the benchmark suite and stores the results as JSON.
+
+    python -m benchmarks.run                       # default sizes, saved to benchmarks/results/
+    python -m benchmarks.run --sizes 10,1000 --requests 500
+    python -m benchmarks.run --compare old.json new.json
+
+Run from the project root: the benchmarks import the app's packages from there.
+
+No network access is needed: the app benchmarks use the Flask test client and a
+WSGI server bound to 127.0.0.1.
+"""
+import argparse
+import json
+import subprocess
+import sys
+from typing import Any, Dict, List, Tuple
+
+from benchmarks.common import ROOT_DIR, environment, save_results
+
+
+def run_script(module: str, args: List[str]) -> Dict[str, Any]:
+    """Runs a benchmark module in a fresh process and returns its JSON output."""
+    output = subprocess.check_output(
+        [sys.executable, "-m", f"benchmarks.{module}"] + args, cwd=ROOT_DIR
+    )
+    return json.loads(output.decode().strip().splitlines()[-1])
+
+
+def flatten(data: Any, prefix: str = "") -> Dict[str, float]:
+    """Flattens nested results into {"a.b.c": number}."""
+    flat: Dict[str, float] = {}
+    if isinstance(data, dict):
+        for key, value in data.items():
+            flat.update(flatten(value, f"{prefix}.{key}" if prefix else str(key)))
+    elif isinstance(data, (int, float)) and not isinstance(data, bool):
+        flat[prefix] = data
+    return flat
+
+
+def compare(old_path: str, new_path: str) -> List[Tuple[str, float, float, float]]:
+    with open(old_path, encoding="utf-8") as f:
+        old = flatten(json.load(f).get("results", {}))
+    with open(new_path, encoding="utf-8") as f:
+        new = flatten(json.load(f).get("results", {}))
+
+    rows = []
+    for key in sorted(old.keys() & new.keys()):
+        change = (new[key] - old[key]) / old[key] * 100 if old[key] else 0.0
+        rows.append((key, old[key], new[key], change))
+    return rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10,100,1000", help="comma separated route counts")
+    parser.add_argument("--requests", type=int, default=2000, help="requests per scenario")
+    parser.add_argument("--no-layout", action="store_true")
+    parser.add_argument("--no-server", action="store_true")
+    parser.add_argument("--skip-app", action="store_true", help="only run the micro-benchmarks")
+    parser.add_argument("--skip-micro", action="store_true", help="only run the app benchmarks")
+    parser.add_argument("--routing-sizes", default="10,1000,10000",
+                        help="route counts for the dispatch benchmark")
+    parser.add_argument("--skip-routing", action="store_true",
+                        help="skip the route dispatch benchmark")
+    parser.add_argument("--output", help="file to write the JSON results to")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"),
+                        help="compare two result files")
+    args = parser.parse_args()
+
+    if args.compare:
+        for key, old, new, change in compare(*args.compare):
+            print(f"{key:70} {old:>14.3f} {new:>14.3f} {change:>+8.1f}%")
+        return
+
+    results: Dict[str, Any] = {"app": {}, "micro": {}, "routing": {}}
+    if not args.skip_app:
+        for size in [int(s) for s in args.sizes.split(",") if s]:
+            script_args = ["--routes", str(size), "--requests", str(args.requests)]
+            if args.no_layout:
+                script_args.append("--no-layout")
+            if args.no_server:
+                script_args.append("--no-server")
+            print(f"Running app benchmark with {size} routes...", file=sys.stderr)
+            results["app"][str(size)] = run_script("bench_app", script_args)
+
+    if not args.skip_micro:
+        print("Running micro-benchmarks...", file=sys.stderr)
+        results["micro"] = run_script("bench_micro", [])
+
+    if not args.skip_routing:
+        print("Running route dispatch benchmark...", file=sys.stderr)
+        results["routing"] = run_script("bench_routes", ["--sizes", args.routing_sizes])
+
+    path = save_results({"environment": environment(), "results": results}, args.output)
+
+    for size, data in results["app"].items():
+        for mode in ("test_client", "wsgi_server"):
+            for scenario, summary in data.get(mode, {}).items():
+                print(f"{size:>6} routes {mode:12} {scenario:10} "
+                      f"{summary['requests_per_sec']:>10} req/s  p50 {summary['p50_ms']:>8} ms  "
+                      f"p99 {summary['p99_ms']:>8} ms")
+    for size, data in results["routing"].items():
+        for scenario, summary in data["route_map"].items():
+            print(f"{size:>6} routes dispatch     {scenario:12} {summary['us_per_op']:>8} us")
+    print(f"Results written to {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""Generates synthetic routes/ trees for the benchmarks."""
+import os
+import shutil
+from typing import Dict, List
+
+CONTROLLER = '''from flask import render_template
+from typing import Any
+
+def handler(request: Any, **kwargs: Any) -> Any:
+    return render_template("page.html", title="{title}", **kwargs)
+'''
+
+PAGE = '''<div class="container">
+    <h1>{{{{ title }}}}</h1>
+    <p>Synthetic page {name}{param}</p>
+    <ul>
+    {{% for i in range(20) %}}
+        <li>Item {{{{ i }}}} of {name}</li>
+    {{% endfor %}}
+    </ul>
+</div>
+'''
+
+FULL_PAGE = '''<!DOCTYPE html>
+<html>
+<head><title>{{{{ title }}}}</title></head>
+<body>
+''' + PAGE + '''</body>
+</html>
+'''
+
+LAYOUT = '''<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="UTF-8">
+    <title>{{ title|default('Benchmark') }}</title>
+    {% if style_url %}<link rel="stylesheet" href="{{ style_url }}">{% endif %}
+</head>
+<body>
+    {{ content }}
+    {% if script_url %}<script src="{{ script_url }}"></script>{% endif %}
+</body>
+</html>
+'''
+
+STYLES = "body { font-family: sans-serif; }\n" * 40
+SCRIPT = "console.log('benchmark');\n" * 40
+
+# Share of generated routes per kind
+KINDS = ("static", "dynamic", "nested")
+
+
+def _write(path: str, content: str) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(content)
+
+
+def generate_routes(root: str, count: int, layout: bool = True) -> Dict[str, List[str]]:
+    """Creates root/routes with `count` route directories, split between static
+    ("/s3"), dynamic ("/d3/[id]") and nested ("/n3/a/b") routes. Every other
+    route uses the layout (when enabled); the rest are full HTML pages.
+
+    Returns example request paths per kind.
+    """
+    routes_dir = os.path.join(root, "routes")
+    if os.path.exists(routes_dir):
+        shutil.rmtree(routes_dir)
+    os.makedirs(routes_dir)
+
+    if layout:
+        _write(os.path.join(routes_dir, "_layout.html"), LAYOUT)
+    _write(os.path.join(routes_dir, "controller.py"), CONTROLLER.format(title="Home"))
+    _write(os.path.join(routes_dir, "page.html"), PAGE.format(name="index", param=""))
+
+    paths: Dict[str, List[str]] = {kind: [] for kind in KINDS}
+    paths["asset"] = []
+    for i in range(count):
+        kind = KINDS[i % len(KINDS)]
+        if kind == "static":
+            rel, url, param = f"s{i}", f"/s{i}", ""
+        elif kind == "dynamic":
+            rel, url, param = f"d{i}/[id]", f"/d{i}/{i * 7}", " for {{ id }}"
+        else:
+            rel, url, param = f"n{i}/a/b", f"/n{i}/a/b", ""
+
+        directory = os.path.join(routes_dir, *rel.split("/"))
+        template = PAGE if (layout and i % 2 == 0) else FULL_PAGE
+        _write(os.path.join(directory, "controller.py"), CONTROLLER.format(title=f"Route {i}"))
+        _write(os.path.join(directory, "page.html"), template.format(name=rel, param=param))
+        _write(os.path.join(directory, "styles.css"), STYLES)
+        _write(os.path.join(directory, "script.js"), SCRIPT)
+
+        paths[kind].append(url)
+        if kind != "dynamic":
+            paths["asset"].append(f"{url}/styles.css")
+    return paths
@@ -0,0 +1,150 @@
+import gzip
+import hashlib
+import os
+import threading
+import time
+from flask import Response, request
+from typing import Any, Dict, Optional, Tuple
+from core.manifest import route_manifest, RouteEntry
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Per-route files served from memory
+ASSET_FILES: Dict[str, str] = {
+    "styles.css": "text/css; charset=utf-8",
+    "script.js": "text/javascript; charset=utf-8",
+}
+
+# Cache-Control for URLs carrying the content hash (?v=...)
+ASSET_MAX_AGE: int = int(os.getenv("ASSET_MAX_AGE", 31536000))
+# Seconds between mtime checks of a cached asset when routes/ is not watched (0 never checks)
+ASSET_CHECK_INTERVAL: float = float(os.getenv("ASSET_CHECK_INTERVAL", 2))
+# Smaller files are not worth compressing
+ASSET_MIN_COMPRESS_SIZE: int = 256
+
+
+class Asset:
+    """A file held in memory with its precompressed variants."""
+
+    __slots__ = ("path", "mtime", "mimetype", "digest", "variants", "checked")
+
+    def __init__(self, path: str, mimetype: str) -> None:
+        self.path = path
+        self.mimetype = mimetype
+        with open(path, "rb") as f:
+            body = f.read()
+        self.mtime = os.stat(path).st_mtime
+        self.digest = hashlib.sha256(body).hexdigest()[:16]
+        self.checked = time.monotonic()
+
+        # encoding -> (body, strong ETag); each encoding is a different representation
+        self.variants: Dict[str, Tuple[bytes, str]] = {"identity": (body, f'"{self.digest}"')}
+        if len(body) >= ASSET_MIN_COMPRESS_SIZE:
+            compressed = gzip.compress(body, compresslevel=9, mtime=0)
+            if len(compressed) < len(body):
+                self.variants["gzip"] = (compressed, f'"{self.digest}-gz"')
+            if brotli is not None:
+                compressed = brotli.compress(body)
+                if len(compressed) < len(body):
+                    self.variants["br"] = (compressed, f'"{self.digest}-br"')
+
+    def select(self, accepted: Any) -> Tuple[str, bytes, str]:
+        """Picks the smallest variant the client accepts (accepted maps encodings to quality)."""
+        for encoding in ("br", "gzip"):
+            if encoding in self.variants and accepted[encoding] > 0:
+                body, etag = self.variants[encoding]
+                return encoding, body, etag
+        body, etag = self.variants["identity"]
+        return "identity", body, etag
+
+
+class AssetStore:
+    """Per-route styles.css/script.js files, loaded on first use.
+
+    Only files recorded in the route manifest are served, so a request never
+    touches the filesystem after the first load (apart from the periodic mtime
+    check when routes/ is not being watched).
+    """
+
+    def __init__(self) -> None:
+        self.assets: Dict[str, Asset] = {}
+        self._lock = threading.Lock()
+        route_manifest.listeners.append(self.invalidate)
+
+    def get(self, entry: RouteEntry, filename: str) -> Optional[Asset]:
+        mimetype = ASSET_FILES.get(filename)
+        if mimetype is None:
+            return None
+        if (entry.style_url if filename == "styles.css" else entry.script_url) is None:
+            return None
+
+        path = os.path.join(entry.directory, filename)
+        asset = self.assets.get(path)
+        if asset is not None and not route_manifest.is_live and ASSET_CHECK_INTERVAL:
+            now = time.monotonic()
+            if now - asset.checked >= ASSET_CHECK_INTERVAL:
+                asset.checked = now
+                try:
+                    if os.stat(path).st_mtime != asset.mtime:
+                        asset = None
+                except OSError:
+                    asset = None
+        if asset is None:
+            with self._lock:
+                try:
+                    asset = self.assets[path] = Asset(path, mimetype)
+                except OSError:
+                    self.assets.pop(path, None)
+                    return None
+        return asset
+
+    def invalidate(self, path: str) -> None:
+        """Manifest watcher callback: forgets a changed file, or all under a changed directory."""
+        path = os.path.normpath(path)
+        with self._lock:
+            for key in [k for k in self.assets if k == path or k.startswith(path + os.sep)]:
+                del self.assets[key]
+
+    def url(self, entry: Optional[RouteEntry], filename: str) -> Optional[str]:
+        """URL of a route's asset with its content hash, for the template helpers."""
+        if entry is None:
+            return None
+        base = entry.style_url if filename == "styles.css" else entry.script_url
+        if base is None:
+            return None
+        asset = self.get(entry, filename)
+        return f"{base}?v={asset.digest}" if asset is not None else base
+
+    def response(self, asset: Asset) -> Response:
+        """Builds the response for the current request, answering revalidations with 304."""
+        encoding, body, etag = asset.select(request.accept_encodings)
+        headers = {"ETag": etag, "Vary": "Accept-Encoding"}
+        if request.args.get("v") == asset.digest:
+            headers["Cache-Control"] = f"public, max-age={ASSET_MAX_AGE}, immutable"
+        else:
+            headers["Cache-Control"] = "no-cache"
+
+        if_none_match = request.headers.get("If-None-Match")
+        if if_none_match and (
+            if_none_match.strip() == "*" or etag in [t.strip() for t in if_none_match.split(",")]
+        ):
+            return Response(status=304, headers=headers)
+
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        return Response(body, content_type=asset.mimetype, headers=headers)
+
+
+asset_store = AssetStore()
+
+
+def serve_asset(route: str, filename: str) -> Optional[Response]:
+    """Response for /<route>/<filename> if it is a known route asset, otherwise None."""
+    entry = route_manifest.get(route.strip("/"))
+    if entry is None:
+        return None
+    asset = asset_store.get(entry, filename)
+    return asset_store.response(asset) if asset is not None else None
@@ -0,0 +1,84 @@
+import asyncio
+import concurrent.futures
+import os
+import threading
+from typing import Any, Awaitable, Optional
+
+# Seconds an async handler may run before it is cancelled (0 waits forever)
+ASYNC_HANDLER_TIMEOUT: float = float(os.getenv("ASYNC_HANDLER_TIMEOUT", 30))
+
+
+class AsyncRunner:
+    """One event loop on a background thread that runs async controller handlers.
+
+    The request thread submits the coroutine and waits for its result, so the
+    handler keeps Flask's request context (it runs in a copy of the caller's
+    contextvars) while everything it awaits concurrently - e.g. several
+    backend calls under asyncio.gather - overlaps on the shared loop. Blocking
+    calls inside an async handler stall every other async handler; use
+    loop.run_in_executor for those.
+    """
+
+    def __init__(self) -> None:
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._after_fork_in_child)
+
+    def _after_fork_in_child(self) -> None:
+        # The loop thread does not survive fork(); a new one starts on first use
+        self.loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        loop = self.loop
+        if loop is None:
+            with self._lock:
+                if self.loop is None:
+                    ready = threading.Event()
+                    new_loop = asyncio.new_event_loop()
+
+                    def run() -> None:
+                        asyncio.set_event_loop(new_loop)
+                        new_loop.call_soon(ready.set)
+                        new_loop.run_forever()
+
+                    self._thread = threading.Thread(target=run, name="async-handlers", daemon=True)
+                    self._thread.start()
+                    ready.wait()
+                    self.loop = new_loop
+                loop = self.loop
+        return loop
+
+    def run(self, awaitable: Awaitable, timeout: float = ASYNC_HANDLER_TIMEOUT) -> Any:
+        """Runs an awaitable on the loop and returns its result on the calling thread.
+
+        The task is scheduled from this thread, so it starts in a copy of this
+        thread's context (call_soon_threadsafe copies it).
+        """
+        loop = self._ensure_loop()
+        future = asyncio.run_coroutine_threadsafe(_await(awaitable), loop)
+        try:
+            return future.result(timeout or None)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise TimeoutError(f"Async handler did not finish within {timeout}s")
+
+    def stop(self) -> None:
+        loop, self.loop = self.loop, None
+        if loop is not None:
+            loop.call_soon_threadsafe(loop.stop)
+
+
+async def _await(awaitable: Awaitable) -> Any:
+    return await awaitable
+
+
+async_runner = AsyncRunner()
+
+
+def run_async(awaitable: Awaitable) -> Any:
+    """Runs an awaitable on the shared handler loop and waits for its result."""
+    return async_runner.run(awaitable)
@@ -1,100 +1,352 @@
 import os
-from flask import Flask, request, session, render_template_string, current_app
-import logging
+import re
+import threading
+from flask import Flask, request, session, current_app, has_request_context
+from flask import Response, before_render_template, template_rendered, stream_with_context
+from flask.globals import request_ctx
+from jinja2 import BaseLoader, ChoiceLoader, Environment, FileSystemBytecodeCache, Template
+from jinja2 import TemplateNotFound
+from jinja2.utils import LRUCache
+from typing import Any, Callable, Dict, Iterator, List, MutableMapping, Optional, Tuple, Union, cast
+from core.manifest import route_manifest, checked_mtime, ROUTE_MANIFEST_WATCH, LAYOUT_FILE
+from core.assets import asset_store
+from core.metrics import METRICS_ENABLED, phase_timer, render_started, render_finished
+from core.logger import log_debug
 
 ROUTES_DIR = "routes"
-LAYOUT_PATH = os.path.join(ROUTES_DIR, "_layout.html")
+
+# Route pages and layouts are compiled once and kept in Jinja's LRU template
+# cache under "@route/<route>" and "@layout/<directory>"; an entry is
+# recompiled when its page.html or _layout.html changes.
+ROUTE_TEMPLATE_PREFIX = "@route/"
+LAYOUT_TEMPLATE_PREFIX = "@layout/"
+TEMPLATE_CACHE_SIZE = int(os.getenv("TEMPLATE_CACHE_SIZE", 400))
+TEMPLATE_BYTECODE_CACHE_DIR = os.getenv("TEMPLATE_BYTECODE_CACHE_DIR")
+# Rendered output stream_page() holds before the renderer waits for the client
+STREAM_BUFFER_SIZE = int(os.getenv("STREAM_BUFFER_SIZE", 65536))
+
+
+# Used when a _layout.html has neither {{ content }} nor {% block content %}
+DEFAULT_LAYOUT = """<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="UTF-8">
+    <title>{{ title|default('Page Title') }}</title>
+    {% if style_url %}<link rel="stylesheet" href="{{ style_url }}">{% endif %}
+</head>
+<body>
+    {% block content %}{% endblock %}
+    {% if script_url %}<script src="{{ script_url }}"></script>{% endif %}
+</body>
+</html>
+"""
+
+_CONTENT_PLACEHOLDER = re.compile(r"\{\{-?\s*content\s*-?\}\}")
+_CONTENT_BLOCK = re.compile(r"(\{%-?\s*block\s+)content(\s*-?%\})")
+
+
+def _layout_path(directory: str) -> str:
+    parts = directory.split("/") if directory else []
+    return os.path.join(route_manifest.routes_dir, *parts, LAYOUT_FILE)
+
+
+def _layout_dirs(route: str) -> List[str]:
+    """Route directories at or above route that have a _layout.html, outermost first.
+
+    Uses the manifest while it is being watched, otherwise checks the files
+    (at most once per ROUTE_CHECK_INTERVAL), so a layout that was added or
+    removed is picked up either way.
+    """
+    if route_manifest.is_live:
+        return [entry.route for entry in route_manifest.layouts(route)]
+    parts = route.split("/") if route else []
+    candidates = ["/".join(parts[:i]) for i in range(len(parts) + 1)]
+    return [
+        directory for directory in candidates
+        if checked_mtime(_layout_path(directory)) is not None
+    ]
+
+
+def _content_block(directory: str) -> str:
+    """Name of the block a layout leaves for its content. Layouts that extend another
+    layout are nested inside its content block, so each directory gets its own name."""
+    return "content" if not directory else "content_" + re.sub(r"\W", "_", directory)
+
+
+def _has_html_structure(source: str) -> bool:
+    lowered = source.lower()
+    return "<html" in lowered and "</html>" in lowered
+
+
+def _extend(layout_dir: str, source: str) -> str:
+    """Wraps a page (or a nested layout) so that it fills the content block of a layout.
+
+    Everything stays on the first line's offset so template errors keep their line numbers.
+    """
+    block = _content_block(layout_dir)
+    return (f'{{% extends "{LAYOUT_TEMPLATE_PREFIX}{layout_dir}" %}}{{% block {block} %}}'
+            f'{source}{{% endblock %}}')
+
+
+class RouteTemplateLoader(BaseLoader):
+    """Loads route pages as "@route/<route>" and layouts as "@layout/<directory>".
+
+    A page without its own <html> document extends the nearest _layout.html
+    at or above its directory, and a nested layout without one extends the
+    next layout up, so every layout is compiled once and shared by all the
+    pages below it instead of being copied into each of them.
+
+    The uptodate checks compare file mtimes and which layout was chosen, so
+    Jinja's template cache (and the bytecode cache, if configured) only
+    recompiles what changed: editing a layout recompiles that layout alone.
+    While the route manifest is being watched, the mtimes it records are
+    used instead of stat calls; otherwise each file is stat'ed at most once
+    per ROUTE_CHECK_INTERVAL.
+    """
+
+    def get_source(self, environment: Environment,
+                   template: str) -> Tuple[str, str, Callable[[], bool]]:
+        if template.startswith(LAYOUT_TEMPLATE_PREFIX):
+            return self.get_layout_source(template, template[len(LAYOUT_TEMPLATE_PREFIX):])
+        if not template.startswith(ROUTE_TEMPLATE_PREFIX):
+            raise TemplateNotFound(template)
+
+        route = template[len(ROUTE_TEMPLATE_PREFIX):]
+        entry = route_manifest.get(route)
+        if entry is None or entry.template_path is None:
+            raise TemplateNotFound(template)
+
+        template_path = entry.template_path
+        page_mtime = checked_mtime(template_path)
+
+        log_debug("Loading template from: %s", template_path)
+        try:
+            with open(template_path, 'r', encoding='utf-8') as f:
+                content = f.read()
+        except OSError:
+            raise TemplateNotFound(template)
+
+        layouts = _layout_dirs(route)
+        layout_dir = layouts[-1] if layouts else None
+        extends = "{% extends" in content
+        if layout_dir is not None and not _has_html_structure(content) and not extends:
+            content = _extend(layout_dir, content)
+
+        def uptodate() -> bool:
+            if route_manifest.is_live:
+                current = route_manifest.get(route)
+                if current is None or current.page_mtime != page_mtime:
+                    return False
+            elif checked_mtime(template_path) != page_mtime:
+                return False
+            current_layouts = _layout_dirs(route)
+            return (current_layouts[-1] if current_layouts else None) == layout_dir
+
+        return content, template_path, uptodate
+
+    def get_layout_source(self, template: str,
+                          directory: str) -> Tuple[str, str, Callable[[], bool]]:
+        layout_path = _layout_path(directory)
+        layout_mtime = checked_mtime(layout_path)
+        try:
+            with open(layout_path, 'r', encoding='utf-8') as f:
+                content = f.read()
+        except OSError:
+            raise TemplateNotFound(template)
+
+        if _CONTENT_BLOCK.search(content) is None:
+            if _CONTENT_PLACEHOLDER.search(content) is not None:
+                content = _CONTENT_PLACEHOLDER.sub("{% block content %}{% endblock %}", content)
+            else:
+                content = DEFAULT_LAYOUT
+
+        block = _content_block(directory)
+        if block != "content":
+            content = _CONTENT_BLOCK.sub(rf"\g<1>{block}\g<2>", content)
+
+        # Layouts above this one, e.g. routes/_layout.html for routes/user/_layout.html
+        parents = _layout_dirs(directory)[:-1] if directory else []
+        parent_dir = parents[-1] if parents else None
+        if parent_dir is not None and not _has_html_structure(content):
+            content = _extend(parent_dir, content)
+
+        def uptodate() -> bool:
+            if route_manifest.is_live:
+                entry = route_manifest.get(directory)
+                if entry is None or entry.layout_mtime != layout_mtime:
+                    return False
+            elif checked_mtime(layout_path) != layout_mtime:
+                return False
+            if not directory:
+                return True
+            current = _layout_dirs(directory)[:-1]
+            return (current[-1] if current else None) == parent_dir
+
+        return content, layout_path, uptodate
+
 
 def setup(app: Flask) -> None:
     """Configure the template engine to use route-specific templates"""
-    
+
+    route_manifest.load_or_build()
+    if ROUTE_MANIFEST_WATCH:
+        route_manifest.watch()
+
     @app.context_processor
-    def inject_template_helpers():
+    def inject_template_helpers() -> Dict[str, Any]:
         """Inject useful variables and helpers into templates"""
         route = request.path.strip('/')
-        if not route:
-            route = ''  
-            
-        route_dir = os.path.join(ROUTES_DIR, route)
-        
-        css_exists = os.path.exists(os.path.join(route_dir, "styles.css"))
-        js_exists = os.path.exists(os.path.join(route_dir, "script.js"))
-        css_path = f"/{route}/styles.css" if route else "/styles.css"
-        js_path = f"/{route}/script.js" if route else "/script.js"
-        
+        entry = route_manifest.for_request()
+
         user_from_session = session.get('user')
         user_from_cookie = request.cookies.get('user')
         is_authenticated = bool(user_from_session or user_from_cookie)
-        
-        print(f"CSS exists: {css_exists}, JS exists: {js_exists}")
-        print(f"CSS path: {css_path}, JS path: {js_path}")
-            
+
         return {
-            'script_url': js_path if js_exists else None,
-            'style_url': css_path if css_exists else None,
+            'script_url': asset_store.url(entry, "script.js"),
+            'style_url': asset_store.url(entry, "styles.css"),
             'current_route': route or 'index',
             'is_authenticated': is_authenticated,
             'user': user_from_session or user_from_cookie
         }
-    
-    original_get_template = app.jinja_env.get_template
-    
-    def get_route_template(name, parent=None, globals=None):
+
+    jinja_env = app.jinja_env
+    loaders: List[BaseLoader] = [RouteTemplateLoader()]
+    if jinja_env.loader is not None:
+        loaders.append(jinja_env.loader)
+    jinja_env.loader = ChoiceLoader(loaders)
+    # LRUCache has the mapping interface without subclassing MutableMapping
+    jinja_env.cache = cast(MutableMapping, LRUCache(TEMPLATE_CACHE_SIZE))
+    # Needed for the uptodate checks to run outside of debug mode
+    jinja_env.auto_reload = True
+    if TEMPLATE_BYTECODE_CACHE_DIR:
+        os.makedirs(TEMPLATE_BYTECODE_CACHE_DIR, exist_ok=True)
+        jinja_env.bytecode_cache = FileSystemBytecodeCache(TEMPLATE_BYTECODE_CACHE_DIR)
+
+    if METRICS_ENABLED:
+        before_render_template.connect(render_started, app)
+        template_rendered.connect(render_finished, app)
+
+    original_get_template = jinja_env.get_template
+
+    def get_route_template(name: Union[str, Template], parent: Optional[str] = None,
+                           globals: Optional[MutableMapping[str, Any]] = None) -> Template:
         """Custom template loader that checks route-specific directories first"""
+        with phase_timer("template"):
+            return resolve_route_template(name, parent, globals)
+
+    def resolve_route_template(name: Union[str, Template], parent: Optional[str] = None,
+                               globals: Optional[MutableMapping[str, Any]] = None) -> Template:
         try:
-            if request and name == "page.html":
-                route = request.path.strip('/')
-                route_dir = route.replace('/', os.sep)
-                
-                template_path = os.path.join(ROUTES_DIR, route_dir, name)
-                
-                layout_exists = os.path.exists(LAYOUT_PATH)
-                print(f"Layout exists: {layout_exists}, path: {LAYOUT_PATH}")
-                
-                if os.path.exists(template_path):
-                    with open(template_path, 'r', encoding='utf-8') as f:
-                        content = f.read()
-                        has_html_structure = "<html" in content.lower() and "</html>" in content.lower()
-
-                        print(f"Loading template from: {template_path}")
-                        print(f"Template has HTML structure: {has_html_structure}")
-                        
-                        if not has_html_structure and layout_exists:
-                            with open(LAYOUT_PATH, 'r', encoding='utf-8') as layout_file:
-                                layout = layout_file.read()
-                                
-                                print(f"Layout content length: {len(layout)}")
-                                print(f"Layout has placeholder: {'{{ content }}' in layout}")
-                               
-                                if "{{ content }}" in layout:
-                                    content = layout.replace("{{ content }}", content)
-                                    print("Replaced {{ content }} in layout")
-                                else:
-                                    print("No {{ content }} placeholder found, using default layout")
-                                    content = f'''
-                                    <!DOCTYPE html>
-                                    <html>
-                                    <head>
-                                        <meta charset="UTF-8">
-                                        <title>{{{{ title|default('Page Title') }}}}</title>
-                                        <link rel="stylesheet" href="{'/styles.css' if not route else f'/{route}/styles.css'}">
-                                    </head>
-                                    <body>
-                                        {content}
-                                        <script src="{'/script.js' if not route else f'/{route}/script.js'}"></script>
-                                    </body>
-                                    </html>
-                                    '''
-                        print(f"Final template size: {len(content)} characters")
-                        template = app.jinja_env.from_string(content)
-                        template.filename = template_path  
-                        return template
-                        
+            if has_request_context() and name == "page.html":
+                entry = route_manifest.for_request()
+                if entry is not None and entry.template_path is not None:
+                    return original_get_template(
+                        ROUTE_TEMPLATE_PREFIX + entry.route, parent, globals
+                    )
+
+        except TemplateNotFound:
+            pass
         except (RuntimeError, AttributeError) as e:
-            app.logger.error(f"Template engine error: {str(e)}")
-            print(f"Template engine error: {str(e)}")
-            
+            app.logger.error("Template engine error: %s", e)
+
         return original_get_template(name, parent, globals)
-        
-    app.jinja_env.get_template = get_route_template
-    
\ No newline at end of file
+
+    setattr(app.jinja_env, "get_template", get_route_template)
+
+
+class _PageStream:
+    """Renders on a helper thread while the response sends what is ready.
+
+    Whatever has been rendered goes out as soon as the client can take it,
+    so output before a slow part of the page (e.g. a generator fetching rows)
+    is not held back, while fast stretches are sent as a few large chunks
+    instead of Jinja's many small fragments. The renderer pauses when
+    buffer_size characters are waiting for a slow client.
+    """
+
+    def __init__(self, fragments: Callable[[], Iterator[str]], buffer_size: int) -> None:
+        self.buffer_size = buffer_size
+        self.pending: List[str] = []
+        self.size = 0
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.cancelled = False
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(
+            target=self._render, args=(fragments,), name="page-stream", daemon=True
+        )
+        self._thread.start()
+
+    def _render(self, fragments: Callable[[], Iterator[str]]) -> None:
+        try:
+            for fragment in fragments():
+                with self._cond:
+                    while self.size >= self.buffer_size and not self.cancelled:
+                        self._cond.wait()
+                    if self.cancelled:
+                        return
+                    self.pending.append(fragment)
+                    self.size += len(fragment)
+                    self._cond.notify()
+        except BaseException as e:
+            self.error = e
+        finally:
+            with self._cond:
+                self.done = True
+                self._cond.notify()
+
+    def __iter__(self) -> Iterator[str]:
+        try:
+            while True:
+                with self._cond:
+                    while not self.pending and not self.done:
+                        self._cond.wait()
+                    chunk, self.pending, self.size = self.pending, [], 0
+                    finished = self.done
+                    self._cond.notify()
+                if chunk:
+                    yield "".join(chunk)
+                if finished and not self.pending:
+                    break
+            if self.error is not None:
+                raise self.error
+        finally:
+            with self._cond:
+                self.cancelled = True
+                self._cond.notify()
+
+
+def stream_page(template_name: str = "page.html", **context: Any) -> Response:
+    """Renders a route page incrementally instead of into one string.
+
+    Use it in place of render_template in a controller. The layout head and
+    the content before the first slow part go out right away; the rest is
+    sent in chunks as it is rendered. Context values may be generators or
+    other lazy iterables, they are consumed while the page streams. The
+    request context stays available until the last chunk is sent.
+    """
+    app: Flask = current_app._get_current_object()  # type: ignore[attr-defined]
+    template = app.jinja_env.get_template(template_name)
+    app.update_template_context(context)
+    before_render_template.send(
+        app, _async_wrapper=app.ensure_sync, template=template, context=context
+    )
+
+    # The renderer thread gets its own copy of the request context
+    ctx = request_ctx.copy() if has_request_context() else None
+
+    def render() -> Iterator[str]:
+        if ctx is None:
+            yield from template.generate(context)
+            return
+        with ctx:
+            yield from template.generate(context)
+
+    def generate() -> Iterator[str]:
+        yield from _PageStream(render, STREAM_BUFFER_SIZE)
+        template_rendered.send(
+            app, _async_wrapper=app.ensure_sync, template=template, context=context
+        )
+
+    return Response(stream_with_context(generate()), mimetype="text/html")
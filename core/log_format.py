@@ -0,0 +1,121 @@
+import json
+import logging
+import time
+from typing import Any, Dict, Optional, Tuple
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+TEXT_FORMAT = "%(asctime)s - [%(levelname)s] - %(message)s"
+
+# Optional request fields a record can carry (passed through `extra=`)
+RECORD_FIELDS: Tuple[str, ...] = ("route", "method", "status", "latency_ms")
+
+LEVELS: Tuple[str, ...] = ("INFO", "ERROR", "WARNING", "DEBUG")
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats records as one JSON object per line.
+
+    Every line carries the epoch timestamp, level, message and session id, plus
+    any request fields (route, method, status, latency_ms) set on the record.
+    """
+
+    def __init__(self, session_id: Optional[str] = None) -> None:
+        super().__init__()
+        self.session_id = session_id
+
+    def format(self, record: logging.LogRecord) -> str:
+        return json.dumps(self.fields(record), separators=(",", ":"), default=str)
+
+    def fields(self, record: logging.LogRecord) -> Dict[str, Any]:
+        data: Dict[str, Any] = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "msg": record.getMessage(),
+        }
+        for field in RECORD_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                data[field] = value
+        if self.session_id:
+            data["session"] = self.session_id
+
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            data["exc"] = record.exc_text
+        return data
+
+
+_last_second = -1
+_last_timestamp = ""
+
+
+def format_timestamp(ts: float) -> str:
+    """Formats an epoch timestamp like the text log format, reusing the result within a second."""
+    global _last_second, _last_timestamp
+    second = int(ts)
+    if second != _last_second:
+        _last_timestamp = time.strftime(TIMESTAMP_FORMAT, time.localtime(second))
+        _last_second = second
+    return _last_timestamp
+
+
+def parse_json_line(line: str, file_name: str) -> Optional[Dict[str, Any]]:
+    """Turns a JSON log line into a viewer entry, or returns None if it is not JSON."""
+    try:
+        data = json.loads(line)
+    except ValueError:
+        return None
+    if not isinstance(data, dict):
+        return None
+
+    message = data.pop("msg", "")
+    exc = data.pop("exc", None)
+    if exc:
+        message = f"{message}\n{exc}"
+
+    entry: Dict[str, Any] = {"raw": line, "file": file_name, "message": message}
+    level = data.pop("level", None)
+    entry["level"] = level.lower() if level else "none"
+    ts = data.get("ts")
+    if isinstance(ts, (int, float)):
+        entry["timestamp"] = format_timestamp(ts)
+    entry.update(data)
+    return entry
+
+
+def parse_text_line(line: str, file_name: str) -> Dict[str, Any]:
+    """Parses a line written with TEXT_FORMAT ("<timestamp> - [LEVEL] - <message>")."""
+    entry: Dict[str, Any] = {"raw": line, "file": file_name}
+
+    if len(line) >= 19:
+        entry["timestamp"] = line[:19]
+
+    # Lines written by the text formatter have the level right after the timestamp
+    if line.startswith(" - [", 19):
+        end = line.find("] - ", 23)
+        level = line[23:end] if end != -1 else ""
+        if level in LEVELS:
+            entry["level"] = level.lower()
+            entry["message"] = line[end + 4:]
+            return entry
+
+    for level in LEVELS:
+        marker = f" - [{level}] - "
+        if marker in line:
+            entry["level"] = level.lower()
+            entry["message"] = line.split(marker, 1)[1]
+            return entry
+
+    entry["level"] = "none"
+    entry["message"] = line
+    return entry
+
+
+def parse_line(line: str, file_name: str) -> Dict[str, Any]:
+    """Parses a log line in either format, falling back to the text parser."""
+    if line.startswith("{"):
+        entry = parse_json_line(line, file_name)
+        if entry is not None:
+            return entry
+    return parse_text_line(line, file_name)
@@ -0,0 +1,242 @@
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Set
+from core.log_rotation import LogRotator
+
+# Records beyond this many are dropped, lowest level first
+DEFAULT_QUEUE_SIZE = 10000
+# Seconds between writes of queued records to the log file
+DEFAULT_FLUSH_INTERVAL = 0.5
+# Wake the writer early once this many records are waiting
+DEFAULT_BATCH_SIZE = 500
+
+
+class QueuedFileHandler(logging.Handler):
+    """File handler that never writes on the calling thread.
+
+    emit() only appends the record to a bounded in-memory queue. A single
+    background thread formats queued records in batches and appends them to
+    the file every flush_interval seconds. When the queue is full, the oldest
+    record of the lowest level queued below the incoming record's level is
+    evicted to make room; if nothing qualifies the incoming record is
+    dropped. Evicting takes constant time: queued records are also kept per
+    level, and an evicted record is only marked and skipped when the batch
+    is taken. The number of dropped records, and of records lost to a failed
+    write, is written to the log with the next batch. With a rotator, the
+    file is rotated before a batch that would start past its size or time
+    limit.
+    """
+
+    def __init__(self, filename: str, max_size: int = DEFAULT_QUEUE_SIZE,
+                 flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+                 batch_size: int = DEFAULT_BATCH_SIZE, encoding: str = "utf-8",
+                 rotator: Optional[LogRotator] = None) -> None:
+        super().__init__()
+        self.baseFilename = filename
+        self.rotator = rotator if rotator is not None and rotator.enabled else None
+        self.encoding = encoding
+        self.max_size = max_size
+        self.flush_interval = flush_interval
+        self.batch_size = min(batch_size, max_size)
+        self.dropped = 0
+        self.failed = 0
+        self._records: Deque[logging.LogRecord] = deque()
+        self._by_level: Dict[int, Deque[logging.LogRecord]] = {}
+        # ids of evicted records still in _records
+        self._evicted: Set[int] = set()
+        self._queued = 0
+        self._cond = threading.Condition()
+        self._pending = 0
+        self._flush_requested = False
+        self._closed = False
+        self._thread: Optional[threading.Thread] = None
+        self._start_writer()
+
+    def _start_writer(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._thread.start()
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(before=self._before_fork, after_in_child=self._after_fork_in_child)
+
+    def _before_fork(self) -> None:
+        # Records still queued would otherwise be written by the parent and the child
+        if not self._closed:
+            self.flush()
+
+    def _after_fork_in_child(self) -> None:
+        """The writer thread does not survive fork(); the child starts its own.
+        Both append to the same file, one write() per batch of whole lines."""
+        if self._closed:
+            return
+        self._records = deque()
+        self._by_level = {}
+        self._evicted = set()
+        self._queued = 0
+        self._cond = threading.Condition()
+        self._pending = 0
+        self._flush_requested = False
+        self.dropped = 0
+        self.failed = 0
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._thread.start()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """Resolves message arguments and tracebacks before the record changes hands."""
+        if record.args:
+            record.msg = record.getMessage()
+            record.args = None
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.exc_info = None
+        return record
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            record = self.prepare(record)
+        except Exception:
+            self.handleError(record)
+            return
+
+        with self._cond:
+            if self._closed:
+                return
+            if self._queued >= self.max_size and not self._make_room(record):
+                self.dropped += 1
+                return
+            self._records.append(record)
+            level = self._by_level.get(record.levelno)
+            if level is None:
+                level = self._by_level[record.levelno] = deque()
+            level.append(record)
+            self._queued += 1
+            self._pending += 1
+            if len(self._records) >= self.batch_size:
+                self._cond.notify_all()
+
+    def _make_room(self, record: logging.LogRecord) -> bool:
+        """Evicts the oldest queued record of the lowest level below the new record's."""
+        if record.levelno <= logging.DEBUG:
+            return False
+        # A handful of levels, so this is not a scan of the queue
+        for levelno in sorted(self._by_level):
+            if levelno >= record.levelno:
+                break
+            queued = self._by_level[levelno]
+            if queued:
+                self._evicted.add(id(queued.popleft()))
+                self._queued -= 1
+                self._pending -= 1
+                self.dropped += 1
+                return True
+        return False
+
+    def _take_batch(self) -> List[logging.LogRecord]:
+        if self._evicted:
+            batch = [record for record in self._records if id(record) not in self._evicted]
+            self._evicted.clear()
+        else:
+            batch = list(self._records)
+        self._records.clear()
+        self._by_level.clear()
+        self._queued = 0
+        return batch
+
+    def _run(self) -> None:
+        # Unbuffered O_APPEND: each batch goes out in a single write(), so processes
+        # sharing the file never interleave partial lines
+        stream = open(self.baseFilename, "ab", buffering=0)
+        try:
+            while True:
+                with self._cond:
+                    waiting = not (self._closed or self._flush_requested)
+                    if waiting and len(self._records) < self.batch_size:
+                        self._cond.wait(self.flush_interval)
+                    self._flush_requested = False
+                    batch = self._take_batch()
+                    dropped, self.dropped = self.dropped, 0
+                    failed, self.failed = self.failed, 0
+                    closing = self._closed
+
+                if batch and self.rotator is not None and self.rotator.needs_check():
+                    stream = self._rotate_if_due(stream)
+                self._write_batch(stream, batch, dropped, failed)
+
+                with self._cond:
+                    self._pending -= len(batch)
+                    self._cond.notify_all()
+                    if closing and not self._records:
+                        break
+        finally:
+            stream.close()
+
+    def _rotate_if_due(self, stream: Any) -> Any:
+        try:
+            stat = os.fstat(stream.fileno())
+            self.rotator.checked(stat.st_size)
+            if self.rotator.due(stat.st_size):
+                stream.close()
+                self.rotator.rotate(stat.st_ino)
+                stream = open(self.baseFilename, "ab", buffering=0)
+        except OSError:
+            if stream.closed:
+                stream = open(self.baseFilename, "ab", buffering=0)
+        return stream
+
+    def _write_batch(self, stream: Any, batch: List[logging.LogRecord], dropped: int,
+                     failed: int = 0) -> None:
+        if failed:
+            notice = logging.LogRecord(
+                "log_queue", logging.ERROR, __file__, 0,
+                f"Writing to the log file failed, lost {failed} record(s)", None, None
+            )
+            batch = [notice] + batch
+        if dropped:
+            notice = logging.LogRecord(
+                "log_queue", logging.WARNING, __file__, 0,
+                f"Log queue full, dropped {dropped} record(s)", None, None
+            )
+            batch = [notice] + batch
+
+        lines = []
+        for record in batch:
+            try:
+                lines.append(self.format(record) + "\n")
+            except Exception:
+                self.handleError(record)
+        data = "".join(lines).encode(self.encoding, "backslashreplace")
+        if self.rotator is not None:
+            self.rotator.wrote(len(data))
+        try:
+            while data:
+                written = stream.write(data)
+                data = data[written:]
+        except Exception:
+            # Reported with the next batch that can be written
+            with self._cond:
+                self.failed += data.count(b"\n")
+
+    def flush(self, timeout: float = 5.0) -> None:
+        """Blocks until every record queued so far has been written."""
+        if self._thread is None or not self._thread.is_alive():
+            return
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            self._flush_requested = True
+            self._cond.notify_all()
+            while self._pending > 0:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+    def close(self) -> None:
+        """Drains the queue and stops the writer thread."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=5.0)
+        super().close()
@@ -0,0 +1,410 @@
+"""Rotation of session logs into numbered, compressed segments.
+
+The active file keeps its name (logs/<date>_<session>.log). Once it reaches
+LOG_ROTATE_BYTES, or the current LOG_ROTATE_INTERVAL window ends, it is
+renamed to <date>_<session>.<n>.log (n counts up from 1) and a new active
+file is started. A background thread then compresses the segment to
+.log.gz (.log.zst with LOG_COMPRESSION=zstd, or by default when the
+zstandard package is installed) and deletes the oldest log files beyond
+LOG_RETENTION_BYTES / LOG_RETENTION_DAYS.
+
+Writers count the bytes they append and stat the file about once a second,
+so processes that share one session file (pre-fork workers) see each
+other's writes and notice the limits at about the same time; a lock file
+lets one of them rename the file while the others just reopen it. A segment
+is only compressed after it has been idle for a moment, so a late write from
+another process is not lost. If the rename fails (on Windows, while another
+program has the file open), rotation is retried after ROTATE_RETRY_DELAY.
+"""
+import gzip
+import os
+import re
+import shutil
+import sys
+import threading
+import time
+import logging
+from datetime import datetime
+from typing import BinaryIO, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+if sys.platform == "win32":
+    import _winapi
+    import msvcrt
+
+# Rotate the active file once it is this large (0 disables)
+LOG_ROTATE_BYTES = int(os.environ.get('LOG_ROTATE_BYTES', 100 * 1024 * 1024))
+# Also rotate every this many seconds, aligned to local midnight (0 disables), e.g. 3600 or 86400
+LOG_ROTATE_INTERVAL = int(os.environ.get('LOG_ROTATE_INTERVAL', 0))
+# "auto" (zstd if installed, else gzip), "gzip", "zstd" or "none"
+LOG_COMPRESSION = os.environ.get('LOG_COMPRESSION', 'auto').lower()
+# Delete the oldest log files once all of them together exceed this many bytes (0 keeps everything)
+LOG_RETENTION_BYTES = int(os.environ.get('LOG_RETENTION_BYTES', 0))
+# Delete log files not written to for this many days (0 keeps everything)
+LOG_RETENTION_DAYS = float(os.environ.get('LOG_RETENTION_DAYS', 0))
+
+# Seconds a rotated segment must stay unmodified before it is compressed
+COMPRESS_DELAY = 2.0
+# Seconds between stat calls on the active file; in between, its size is counted from the writes
+SIZE_CHECK_INTERVAL = 1.0
+# Seconds to wait before trying again after the active file could not be renamed
+ROTATE_RETRY_DELAY = 60.0
+RETENTION_CHECK_INTERVAL = 600.0
+ARCHIVE_EXTENSIONS = {"gzip": ".gz", "zstd": ".zst"}
+
+LOG_NAME_RE = re.compile(r"^(?P<base>[\w-]+)(?:\.(?P<seq>\d+))?\.log(?P<ext>\.gz|\.zst)?$")
+
+
+def parse_log_name(name: str) -> Optional[Tuple[str, Optional[int], str]]:
+    """Splits "<base>[.<n>].log[.gz|.zst]" into (base, segment number, extension).
+
+    The segment number is None for the active file.
+    """
+    match = LOG_NAME_RE.match(name)
+    if match is None:
+        return None
+    seq = match.group("seq")
+    return match.group("base"), int(seq) if seq is not None else None, match.group("ext") or ""
+
+
+def session_name(name: str) -> str:
+    """Name of the active file of the session a segment belongs to."""
+    parsed = parse_log_name(name)
+    return f"{parsed[0]}.log" if parsed is not None else name
+
+
+def segment_order(name: str) -> Tuple[float, str]:
+    """Sort key putting a session's segments oldest first and the active file last."""
+    parsed = parse_log_name(name)
+    if parsed is None or parsed[1] is None:
+        return float("inf"), name
+    return parsed[1], name
+
+
+def is_archive(name: str) -> bool:
+    return name.endswith((".gz", ".zst"))
+
+
+def resolve_compression(name: str = LOG_COMPRESSION) -> Optional[str]:
+    if name == "auto":
+        return "zstd" if zstandard is not None else "gzip"
+    if name == "zstd" and zstandard is None:
+        return "gzip"
+    return name if name in ARCHIVE_EXTENSIONS else None
+
+
+def open_shared(path: str) -> BinaryIO:
+    """Opens a file for reading without keeping a writer from rotating or deleting it.
+
+    Windows refuses to rename or delete a file while another handle has it
+    open, unless that handle was opened with FILE_SHARE_DELETE, which open()
+    does not do. Elsewhere this is a plain open().
+    """
+    if sys.platform != "win32":
+        return open(path, "rb")
+    # FILE_SHARE_READ | FILE_SHARE_WRITE | FILE_SHARE_DELETE
+    handle = _winapi.CreateFile(path, _winapi.GENERIC_READ, 0x7, 0, _winapi.OPEN_EXISTING, 0, 0)
+    try:
+        fd = msvcrt.open_osfhandle(handle, os.O_RDONLY | os.O_BINARY)
+    except OSError:
+        _winapi.CloseHandle(handle)
+        raise
+    return open(fd, "rb")
+
+
+def open_log(path: str) -> BinaryIO:
+    """Opens a log file or segment for reading its uncompressed bytes."""
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    if path.endswith(".zst"):
+        if zstandard is None:
+            raise OSError(f"Reading {os.path.basename(path)} needs the zstandard package")
+        return zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), closefd=True)
+    return open_shared(path)
+
+
+def compress_file(path: str, compression: str) -> str:
+    """Compresses a rotated segment next to itself and removes the original."""
+    target = path + ARCHIVE_EXTENSIONS[compression]
+    tmp_path = f"{target}.{os.getpid()}.tmp"
+    stat = os.stat(path)
+    with open(path, "rb") as src:
+        if compression == "zstd":
+            with open(tmp_path, "wb") as dst:
+                zstandard.ZstdCompressor(level=3).copy_stream(src, dst)
+        else:
+            with gzip.open(tmp_path, "wb", compresslevel=6) as dst:
+                shutil.copyfileobj(src, dst, 1 << 20)
+    # Keep the segment's mtime, retention and the log viewer order by it
+    os.utime(tmp_path, (stat.st_atime, stat.st_mtime))
+    os.replace(tmp_path, target)
+    os.remove(path)
+    return target
+
+
+def apply_retention(log_dir: str, max_bytes: int, max_days: float) -> List[str]:
+    """Deletes the least recently written segments beyond the age and size limits.
+
+    Active files are never deleted: besides this process's session log they
+    may belong to another running session or be written by the log server's
+    ingest. They still count towards max_bytes.
+    """
+    files = []
+    for name in os.listdir(log_dir):
+        parsed = parse_log_name(name)
+        if parsed is None:
+            continue
+        path = os.path.join(log_dir, name)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        files.append((stat.st_mtime, stat.st_size, path, parsed[1] is None))
+    files.sort()
+
+    total = sum(size for _, size, _, _ in files)
+    cutoff = time.time() - max_days * 86400 if max_days else None
+    removed = []
+    for mtime, size, path, active in files:
+        if active:
+            continue
+        if (cutoff is not None and mtime < cutoff) or (max_bytes and total > max_bytes):
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed.append(path)
+    return removed
+
+
+class LogRotator:
+    """Decides when a session log rotates and handles the rotated segments."""
+
+    def __init__(self, path: str, max_bytes: int = LOG_ROTATE_BYTES,
+                 interval: int = LOG_ROTATE_INTERVAL,
+                 compression: Optional[str] = resolve_compression(),
+                 retention_bytes: int = LOG_RETENTION_BYTES,
+                 retention_days: float = LOG_RETENTION_DAYS) -> None:
+        self.path = path
+        self.log_dir = os.path.dirname(path) or "."
+        self.base = os.path.basename(path)[:-len(".log")]
+        self.max_bytes = max_bytes
+        self.interval = interval
+        self.compression = compression
+        self.retention_bytes = retention_bytes
+        self.retention_days = retention_days
+        self.window_end = self._next_boundary(time.time()) if interval else None
+        self.lock_path = os.path.join(self.log_dir, ".rotate.lock")
+        # Size of the active file as of the last stat plus the bytes written since; None: unknown
+        self.size: Optional[int] = None
+        self._checked_at = 0.0
+        self._retry_at = 0.0
+        self._pending: List[str] = []
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._after_fork_in_child)
+
+    def _after_fork_in_child(self) -> None:
+        # The maintenance thread does not survive fork(); one starts again when needed
+        self._pending = []
+        self._cond = threading.Condition()
+        self._thread = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.max_bytes or self.interval)
+
+    def _next_boundary(self, now: float) -> float:
+        offset = datetime.fromtimestamp(now).astimezone().utcoffset().total_seconds()
+        return ((now + offset) // self.interval + 1) * self.interval - offset
+
+    def due(self, size: int) -> bool:
+        """Whether a file of this size should be rotated before the next write."""
+        if self.max_bytes and size >= self.max_bytes:
+            return True
+        return self.window_end is not None and size > 0 and time.time() >= self.window_end
+
+    def needs_check(self) -> bool:
+        """Whether the writer should stat the active file (and call checked()) before writing.
+
+        True when the counted size reached the limit, the time window ended
+        or the last stat is more than SIZE_CHECK_INTERVAL old; never while a
+        failed rotation waits for its retry.
+        """
+        now = time.time()
+        if now < self._retry_at:
+            return False
+        if self.size is None or now - self._checked_at >= SIZE_CHECK_INTERVAL:
+            return True
+        return self.due(self.size)
+
+    def checked(self, size: int) -> None:
+        self.size = size
+        self._checked_at = time.time()
+
+    def wrote(self, count: int) -> None:
+        """Counts bytes appended to the active file since the last stat."""
+        if self.size is not None:
+            self.size += count
+
+    def rotate(self, inode: int) -> Optional[str]:
+        """Renames the active file to the next segment, unless another process already did.
+
+        inode identifies the file the caller was writing to, which it must have
+        closed; the caller opens self.path again afterwards.
+        """
+        segment = None
+        self.size = None
+        with self._lock_file():
+            try:
+                stat = os.stat(self.path)
+            except OSError:
+                stat = None
+            if stat is not None and stat.st_ino == inode and self.due(stat.st_size):
+                segment = os.path.join(self.log_dir, f"{self.base}.{self._next_number()}.log")
+                try:
+                    os.rename(self.path, segment)
+                except OSError as e:
+                    self._rotation_failed(e)
+                    return None
+        if self.window_end is not None:
+            self.window_end = self._next_boundary(time.time())
+        if segment is not None:
+            self._schedule([segment])
+        return segment
+
+    def _rotation_failed(self, error: OSError) -> None:
+        # Set before logging: the record may come back to the handler that is rotating
+        first = self._retry_at == 0.0
+        self._retry_at = time.time() + ROTATE_RETRY_DELAY
+        if first:
+            logging.getLogger("log_rotation").warning(
+                f"Could not rotate {self.path}, retrying every {ROTATE_RETRY_DELAY:g}s: {error}"
+            )
+
+    def _next_number(self) -> int:
+        numbers = [0]
+        for name in os.listdir(self.log_dir):
+            parsed = parse_log_name(name)
+            if parsed is not None and parsed[0] == self.base and parsed[1] is not None:
+                numbers.append(parsed[1])
+        return max(numbers) + 1
+
+    def _lock_file(self) -> "_FileLock":
+        return _FileLock(self.lock_path)
+
+    def maintain(self) -> None:
+        """Compresses segments left uncompressed by an earlier run and applies retention."""
+        if not (self.compression or self.retention_bytes or self.retention_days):
+            return
+        leftovers = []
+        for name in os.listdir(self.log_dir):
+            parsed = parse_log_name(name)
+            if parsed is not None and parsed[1] is not None and not parsed[2]:
+                leftovers.append(os.path.join(self.log_dir, name))
+        self._schedule(leftovers, force=True)
+
+    def _schedule(self, segments: List[str], force: bool = False) -> None:
+        with self._cond:
+            self._pending.extend(segments)
+            if self._thread is None and (self._pending or force):
+                self._thread = threading.Thread(target=self._run, name="log-rotation", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                segments, self._pending = self._pending, []
+            for segment in segments:
+                self._compress(segment)
+            try:
+                apply_retention(self.log_dir, self.retention_bytes, self.retention_days)
+            except OSError:
+                pass
+            with self._cond:
+                # Woken by the next rotation, or now and then to age out old files
+                if not self._pending:
+                    self._cond.wait(RETENTION_CHECK_INTERVAL)
+
+    def _compress(self, segment: str) -> None:
+        if not self.compression:
+            return
+        try:
+            # Another process may still have the segment open for a last write
+            idle = time.time() - os.stat(segment).st_mtime
+            while idle < COMPRESS_DELAY:
+                time.sleep(COMPRESS_DELAY - idle)
+                idle = time.time() - os.stat(segment).st_mtime
+            compress_file(segment, self.compression)
+        except FileNotFoundError:
+            pass
+        except Exception:
+            logging.getLogger("log_rotation").exception(f"Could not compress {segment}")
+
+
+class _FileLock:
+    """Exclusive lock shared by the processes writing to one log directory."""
+
+    _thread_lock = threading.Lock()
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.fd: Optional[int] = None
+
+    def __enter__(self) -> "_FileLock":
+        self._thread_lock.acquire()
+        if fcntl is not None:
+            try:
+                self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+                fcntl.flock(self.fd, fcntl.LOCK_EX)
+            except OSError:
+                self.fd = None
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+        self._thread_lock.release()
+
+
+class SessionFileHandler(logging.FileHandler):
+    """FileHandler for the session log that rotates it through a LogRotator."""
+
+    def __init__(self, filename: str, rotator: Optional[LogRotator] = None,
+                 encoding: Optional[str] = None) -> None:
+        super().__init__(filename, encoding=encoding)
+        self.rotator = rotator if rotator is not None and rotator.enabled else None
+
+    def emit(self, record: logging.LogRecord) -> None:
+        # handle() holds the handler lock, so one thread rotates at a time
+        if self.rotator is not None and self.stream is not None and self.rotator.needs_check():
+            try:
+                stat = os.fstat(self.stream.fileno())
+                self.rotator.checked(stat.st_size)
+                if self.rotator.due(stat.st_size):
+                    self.stream.close()
+                    self.stream = None
+                    self.rotator.rotate(stat.st_ino)
+            except OSError:
+                pass
+        super().emit(record)
+
+    def format(self, record: logging.LogRecord) -> str:
+        text = super().format(record)
+        if self.rotator is not None:
+            # Characters, not encoded bytes: close enough between two stat calls
+            self.rotator.wrote(len(text) + 1)
+        return text
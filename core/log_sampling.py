@@ -0,0 +1,116 @@
+import logging
+import random
+import threading
+import time
+from typing import Dict, Hashable, List, Optional, Tuple
+
+# Distinct messages tracked for duplicate suppression; the least recently seen is forgotten first
+DEFAULT_DEDUP_KEYS = 256
+
+
+def parse_rates(value: str) -> Dict[str, float]:
+    """Parses "DEBUG=0.1,/health=0.01,/static/*=0" into {key: rate}.
+
+    Keys are level names or route paths; a path ending in * matches every
+    route starting with it.
+    """
+    rates: Dict[str, float] = {}
+    for item in value.split(","):
+        key, sep, rate = item.strip().partition("=")
+        if not sep or not key:
+            continue
+        try:
+            rates[key if key.startswith("/") else key.upper()] = min(1.0, max(0.0, float(rate)))
+        except ValueError:
+            continue
+    return rates
+
+
+class LogSampler:
+    """Decides whether a record is written, from per-level and per-route sampling rates.
+
+    A route rate takes precedence over the level rate; a rate of 1 (the
+    default) keeps every record and 0 drops them all.
+    """
+
+    def __init__(self, rates: Dict[str, float]) -> None:
+        self.levels = {logging.getLevelName(key): rate for key, rate in rates.items()
+                       if not key.startswith("/") and isinstance(logging.getLevelName(key), int)}
+        routes = {key: rate for key, rate in rates.items() if key.startswith("/")}
+        self.routes = {key: rate for key, rate in routes.items() if not key.endswith("*")}
+        # Longest prefix first
+        self.prefixes: List[Tuple[str, float]] = sorted(
+            ((key[:-1], rate) for key, rate in routes.items() if key.endswith("*")),
+            key=lambda item: -len(item[0])
+        )
+        self.dropped = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.levels or self.routes or self.prefixes)
+
+    def rate(self, level: int, route: Optional[str] = None) -> float:
+        if route is not None:
+            rate = self.routes.get(route)
+            if rate is not None:
+                return rate
+            for prefix, rate in self.prefixes:
+                if route.startswith(prefix):
+                    return rate
+        return self.levels.get(level, 1.0)
+
+    def keep(self, level: int, route: Optional[str] = None) -> bool:
+        rate = self.rate(level, route)
+        if rate >= 1.0 or (rate > 0.0 and random.random() < rate):
+            return True
+        self.dropped += 1
+        return False
+
+
+class DuplicateSuppressor:
+    """Collapses a message logged again and again into one record plus a repeat count.
+
+    The first occurrence of a key is logged; further occurrences within
+    window seconds are only counted. check() returns the repeat counts of
+    windows that have ended, so the caller can log them as "repeated N
+    times" records before its own.
+    """
+
+    def __init__(self, window: float, max_keys: int = DEFAULT_DEDUP_KEYS) -> None:
+        self.window = window
+        self.max_keys = max_keys
+        # key -> [window start, message, suppressed count]
+        self._seen: Dict[Hashable, list] = {}
+        self._lock = threading.Lock()
+
+    def check(self, key: Hashable, message: str) -> Tuple[bool, List[Tuple[str, int]]]:
+        """Returns (whether to log this occurrence, [(message, count)] of ended windows)."""
+        now = time.monotonic()
+        with self._lock:
+            repeated = self._expire(now)
+            seen = self._seen.get(key)
+            if seen is not None:
+                seen[2] += 1
+                return False, repeated
+            if len(self._seen) >= self.max_keys:
+                oldest = next(iter(self._seen))
+                _, old_message, count = self._seen.pop(oldest)
+                if count:
+                    repeated.append((old_message, count))
+            self._seen[key] = [now, message, 0]
+            return True, repeated
+
+    def _expire(self, now: float) -> List[Tuple[str, int]]:
+        repeated = []
+        for key in [key for key, seen in self._seen.items() if now - seen[0] >= self.window]:
+            _, message, count = self._seen.pop(key)
+            if count:
+                repeated.append((message, count))
+        return repeated
+
+    def flush(self) -> List[Tuple[str, int]]:
+        """Repeat counts of all open windows, e.g. on shutdown."""
+        with self._lock:
+            repeated = [(message, count) for _, message, count in self._seen.values() if count]
+            self._seen.clear()
+            return repeated
@@ -0,0 +1,269 @@
+"""Ships log records to a remote log server (log.py) over TCP or a Unix socket.
+
+Records are sent as JSON lines (see core.log_format.JsonFormatter), each
+tagged with the node name and the pre-fork worker id, so one log server can
+collect the logs of many app instances. Sending happens on a background
+thread in batches; the request thread only queues the record. While the log
+server cannot be reached, batches are appended to a spool file next to the
+local logs and sent once a connection succeeds again.
+
+The log server acknowledges what it has written with the byte offset reached
+on the connection, as a decimal number and a newline. A batch only counts as
+sent, and a spool file is only removed, once its last byte is acknowledged.
+"""
+import glob
+import logging
+import os
+import re
+import socket
+import time
+from typing import Any, Dict, List, Optional, Tuple, Union
+from core.log_format import JsonFormatter
+from core.log_queue import QueuedFileHandler, DEFAULT_QUEUE_SIZE, DEFAULT_FLUSH_INTERVAL
+
+# Seconds a connect, send or acknowledgement may take before the log server counts as down
+DEFAULT_TIMEOUT = 5.0
+# Limit of the spool file; batches beyond it are dropped
+DEFAULT_SPOOL_BYTES = 256 * 1024 * 1024
+MIN_RETRY_DELAY = 1.0
+MAX_RETRY_DELAY = 30.0
+READ_CHUNK = 1 << 20
+# Longest acknowledgement line accepted from the log server
+MAX_ACK = 32
+
+Address = Union[Tuple[str, int], str]
+
+
+def parse_address(value: str) -> Tuple[int, Address]:
+    """Parses "tcp://host:port", "host:port" or "unix:///path/to.sock" into (family, address)."""
+    if value.startswith("unix://"):
+        if not hasattr(socket, "AF_UNIX"):
+            raise ValueError("Unix sockets are not supported on this platform")
+        return socket.AF_UNIX, value[len("unix://"):]
+    if value.startswith("tcp://"):
+        value = value[len("tcp://"):]
+    host, sep, port = value.rpartition(":")
+    if not sep or not port.isdigit():
+        raise ValueError(f"Invalid log address {value!r}, expected tcp://host:port or unix:///path")
+    return socket.AF_INET, (host.strip("[]") or "0.0.0.0", int(port))
+
+
+def node_name(value: str) -> str:
+    """Node names end up in log file names, so only word characters and dashes are kept."""
+    return re.sub(r"[^\w-]+", "-", value).strip("-") or "node"
+
+
+class SinkFormatter(JsonFormatter):
+    """JSON lines tagged with the node and, in pre-fork workers, the worker id."""
+
+    def __init__(self, session_id: Optional[str], node: str) -> None:
+        super().__init__(session_id)
+        self.node = node
+
+    def fields(self, record: logging.LogRecord) -> Dict[str, Any]:
+        data = super().fields(record)
+        data["node"] = self.node
+        # Set by core.server in each worker after fork, so it is read per record
+        worker = os.environ.get("ROUTER_WORKER_ID")
+        if worker is not None:
+            data["worker"] = worker
+        data["pid"] = record.process
+        return data
+
+
+class SocketLogHandler(QueuedFileHandler):
+    """Queued handler that sends its batches to a socket instead of a file.
+
+    Queueing, eviction of low-level records when the queue is full, flushing
+    and the fork handling come from QueuedFileHandler. A send blocks only the
+    sender thread; if it times out or the connection drops, the batch goes to
+    the spool file (filename) and reconnects are retried with a growing delay.
+    After reconnecting, the spool is sent before new batches, so the log
+    server receives a process's records in order. Delivery is at least once:
+    a batch whose acknowledgement does not arrive is spooled and sent again,
+    even if the log server had written it, and so is a spool whose sending
+    was cut off.
+    """
+
+    def __init__(self, address: str, spool_path: str, max_size: int = DEFAULT_QUEUE_SIZE,
+                 flush_interval: float = DEFAULT_FLUSH_INTERVAL, timeout: float = DEFAULT_TIMEOUT,
+                 spool_bytes: int = DEFAULT_SPOOL_BYTES) -> None:
+        self.family, self.address = parse_address(address)
+        self.timeout = timeout
+        self.spool_bytes = spool_bytes
+        self.sent = 0
+        self.spooled = 0
+        self._retry_at = 0.0
+        self._retry_delay = MIN_RETRY_DELAY
+        # Bytes sent and acknowledged on the current connection
+        self._offset = 0
+        self._acked = 0
+        self._ack_buffer = b""
+        super().__init__(spool_path, max_size, flush_interval)
+
+    def _run(self) -> None:
+        sock: Optional[socket.socket] = None
+        try:
+            while True:
+                with self._cond:
+                    waiting = not (self._closed or self._flush_requested)
+                    if waiting and len(self._records) < self.batch_size:
+                        self._cond.wait(self.flush_interval)
+                    self._flush_requested = False
+                    batch = self._take_batch()
+                    dropped, self.dropped = self.dropped, 0
+                    closing = self._closed
+
+                data = self._encode_batch(batch, dropped)
+                if data:
+                    sock = self._send(sock, data)
+
+                with self._cond:
+                    self._pending -= len(batch)
+                    self._cond.notify_all()
+                    if closing and not self._records:
+                        break
+        finally:
+            if sock is not None:
+                sock.close()
+
+    def _send(self, sock: Optional[socket.socket], data: bytes) -> Optional[socket.socket]:
+        if sock is None and time.monotonic() >= self._retry_at:
+            sock = self._connect()
+            if sock is not None and not self._send_spool(sock):
+                sock.close()
+                sock = None
+                self._schedule_retry()
+        if sock is not None:
+            try:
+                sock.sendall(data)
+                self._offset += len(data)
+                self._await_ack(sock)
+                self.sent += len(data)
+                return sock
+            except OSError:
+                sock.close()
+                sock = None
+                self._schedule_retry()
+        self._spool(data)
+        return sock
+
+    def _connect(self) -> Optional[socket.socket]:
+        sock = socket.socket(self.family, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.address)
+        except OSError:
+            sock.close()
+            self._schedule_retry()
+            return None
+        self._retry_delay = MIN_RETRY_DELAY
+        self._offset = self._acked = 0
+        self._ack_buffer = b""
+        return sock
+
+    def _schedule_retry(self) -> None:
+        self._retry_at = time.monotonic() + self._retry_delay
+        self._retry_delay = min(self._retry_delay * 2, MAX_RETRY_DELAY)
+
+    def _spool(self, data: bytes) -> None:
+        try:
+            size = os.path.getsize(self.baseFilename)
+        except OSError:
+            size = 0
+        if size + len(data) > self.spool_bytes:
+            with self._cond:
+                self.dropped += data.count(b"\n")
+            return
+        # One O_APPEND write per batch: processes of a node share the spool file
+        try:
+            with open(self.baseFilename, "ab", buffering=0) as spool:
+                spool.write(data)
+            self.spooled += len(data)
+        except OSError:
+            pass
+
+    def _send_spool(self, sock: socket.socket) -> bool:
+        """Sends spooled batches, this node's oldest first; False if the connection failed."""
+        for path in self._claim_spools():
+            size = 0
+            last = b""
+            try:
+                with open(path, "rb") as spool:
+                    while True:
+                        chunk = spool.read(READ_CHUNK)
+                        if not chunk:
+                            break
+                        sock.sendall(chunk)
+                        size += len(chunk)
+                        last = chunk[-1:]
+                if size and last != b"\n":
+                    # Cut off by a failed write; only whole lines are acknowledged
+                    sock.sendall(b"\n")
+                    size += 1
+                self._offset += size
+                self._await_ack(sock)
+                self.sent += size
+            except OSError:
+                # Left in place and sent again after the next reconnect
+                return False
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        return True
+
+    def _await_ack(self, sock: socket.socket) -> None:
+        """Waits until the log server has acknowledged everything sent on this connection."""
+        while self._acked < self._offset:
+            chunk = sock.recv(MAX_ACK)
+            if not chunk:
+                raise ConnectionError("Log server closed the connection")
+            *acks, self._ack_buffer = (self._ack_buffer + chunk).split(b"\n")
+            if acks:
+                if not acks[-1].isdigit():
+                    raise ConnectionError(f"Invalid acknowledgement {acks[-1]!r}")
+                self._acked = int(acks[-1])
+            if len(self._ack_buffer) > MAX_ACK:
+                raise ConnectionError("Invalid acknowledgement")
+
+    def _claim_spools(self) -> List[str]:
+        """Takes over the spool file, and spools a dead process was sending, by renaming them."""
+        claimed = []
+        for path in glob.glob(f"{glob.escape(self.baseFilename)}.*.sending"):
+            pid = path[len(self.baseFilename) + 1:].split("-", 1)[0]
+            if pid.isdigit() and (int(pid) == os.getpid() or not _alive(int(pid))):
+                claimed.append(path)
+        own = f"{self.baseFilename}.{os.getpid()}-{time.time_ns()}.sending"
+        try:
+            os.rename(self.baseFilename, own)
+            claimed.append(own)
+        except OSError:
+            pass
+        claimed.sort(key=lambda path: os.path.getmtime(path) if os.path.exists(path) else 0)
+        return claimed
+
+    def _encode_batch(self, batch: List[logging.LogRecord], dropped: int) -> bytes:
+        if dropped:
+            notice = logging.LogRecord(
+                "log_sink", logging.WARNING, __file__, 0,
+                f"Log sink queue full, dropped {dropped} record(s)", None, None
+            )
+            batch = [notice] + batch
+        lines = []
+        for record in batch:
+            try:
+                lines.append(self.format(record) + "\n")
+            except Exception:
+                self.handleError(record)
+        return "".join(lines).encode(self.encoding, "backslashreplace")
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True
+    return True
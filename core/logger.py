@@ -2,10 +2,16 @@ import logging
 import os
 import atexit
 import json
+import socket
 import time
 from datetime import datetime
-from typing import Any
+from typing import Any, List, Optional, Tuple
 import sys
+from core.log_queue import QueuedFileHandler
+from core.log_format import JsonFormatter, TEXT_FORMAT, TIMESTAMP_FORMAT
+from core.log_rotation import LogRotator, SessionFileHandler
+from core.log_sampling import DuplicateSuppressor, LogSampler, parse_rates
+from core.log_sink import SinkFormatter, SocketLogHandler, node_name
 
 LOG_DIR = "logs"
 if not os.path.exists(LOG_DIR):
@@ -13,6 +19,30 @@ if not os.path.exists(LOG_DIR):
 
 DEVELOPMENT_MODE = os.environ.get('FLASK_ENV') == 'development' or os.environ.get('DEBUG') == 'True'
 
+# Queued logging: request threads only enqueue records and a background
+# writer thread appends them to the log file in batches
+LOG_QUEUE = os.environ.get('LOG_QUEUE', 'False').lower() == 'true'
+LOG_QUEUE_SIZE = int(os.environ.get('LOG_QUEUE_SIZE', 10000))
+LOG_FLUSH_INTERVAL = float(os.environ.get('LOG_FLUSH_INTERVAL', 0.5))
+
+# "text" (default) or "json" for one JSON object per line in the log file
+LOG_FORMAT = os.environ.get('LOG_FORMAT', 'text').lower()
+
+# Also send every record to a log server: tcp://host:port or unix:///path/to.sock
+# (see log.py's LOG_INGEST)
+LOG_SINK = os.environ.get('LOG_SINK', '')
+# Name of this app instance in the collected logs (defaults to the host name)
+LOG_SINK_NODE = node_name(os.environ.get('LOG_SINK_NODE') or socket.gethostname())
+LOG_SINK_SPOOL_BYTES = int(os.environ.get('LOG_SINK_SPOOL_BYTES', 256 * 1024 * 1024))
+
+# Records below this level are not created at all
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'DEBUG').upper()
+# Share of records written per level or route, e.g. "DEBUG=0.1,/health=0.01,/static/*=0"
+LOG_SAMPLE_RATES = os.environ.get('LOG_SAMPLE_RATES', '')
+# Seconds during which repeats of the same error are counted instead of logged
+# (0, the default, logs every error)
+LOG_DEDUP_WINDOW = float(os.environ.get('LOG_DEDUP_WINDOW', 0))
+
 # Session management
 SESSION_TRACKING_FILE = os.path.join(LOG_DIR, ".session_tracker")
 MAX_DEV_SESSION_AGE = 3600  
@@ -22,6 +52,11 @@ def get_or_create_session_id():
     """Get an existing session ID or create a new one based on environment"""
     new_session_created = False
     
+    # Set by the pre-fork server so every process logs to the master's session
+    shared_session = os.environ.get('ROUTER_SESSION_ID')
+    if shared_session:
+        return shared_session, False
+
     if DEVELOPMENT_MODE:
         try:
             if os.path.exists(SESSION_TRACKING_FILE):
@@ -54,6 +89,8 @@ def get_or_create_session_id():
     return new_session, new_session_created
 
 SESSION_ID, IS_NEW_SESSION = get_or_create_session_id()
+# Forked workers inherit the session; only the process that opened it announces shutdown
+SESSION_PID = os.getpid()
 
 
 LOG_FILE = os.path.join(LOG_DIR, f"{datetime.now().strftime('%Y-%m-%d')}_{SESSION_ID}.log")
@@ -61,17 +98,44 @@ LOG_FILE = os.path.join(LOG_DIR, f"{datetime.now().strftime('%Y-%m-%d')}_{SESSIO
 
 logger = logging.getLogger('myapp')
 
+formatter = logging.Formatter(TEXT_FORMAT, TIMESTAMP_FORMAT)
+file_formatter: logging.Formatter = JsonFormatter(SESSION_ID) if LOG_FORMAT == 'json' else formatter
+
+# Rotates the session log into numbered segments (see core/log_rotation.py)
+log_rotator = LogRotator(LOG_FILE)
+if not os.environ.get('ROUTER_SESSION_ID'):
+    # Workers of the pre-fork server leave this to the master
+    log_rotator.maintain()
+
+# One handler for the session log file, shared by every logger that writes to it
+if LOG_QUEUE:
+    file_handler: logging.Handler = QueuedFileHandler(
+        LOG_FILE, LOG_QUEUE_SIZE, LOG_FLUSH_INTERVAL, rotator=log_rotator
+    )
+else:
+    file_handler = SessionFileHandler(LOG_FILE, log_rotator)
+file_handler.setLevel(logging.DEBUG)
+file_handler.setFormatter(file_formatter)
+
+# Records go to the log server as well as to the local file; the spool holds them while it is down
+sink_handler: Optional[logging.Handler] = None
+if LOG_SINK:
+    sink_handler = SocketLogHandler(
+        LOG_SINK, os.path.join(LOG_DIR, ".sink_spool"), LOG_QUEUE_SIZE, LOG_FLUSH_INTERVAL,
+        spool_bytes=LOG_SINK_SPOOL_BYTES
+    )
+    sink_handler.setLevel(logging.DEBUG)
+    sink_handler.setFormatter(SinkFormatter(SESSION_ID, LOG_SINK_NODE))
+
 
 if not logger.handlers:
-    logger.setLevel(logging.DEBUG)
+    level_known = isinstance(logging.getLevelName(LOG_LEVEL), int)
+    logger.setLevel(LOG_LEVEL if level_known else logging.DEBUG)
     logger.propagate = False  
     
-  
-    file_handler = logging.FileHandler(LOG_FILE)
-    file_handler.setLevel(logging.DEBUG)
-    formatter = logging.Formatter("%(asctime)s - [%(levelname)s] - %(message)s", "%Y-%m-%d %H:%M:%S")
-    file_handler.setFormatter(formatter)
     logger.addHandler(file_handler)
+    if sink_handler is not None:
+        logger.addHandler(sink_handler)
     
    
     if IS_NEW_SESSION or not DEVELOPMENT_MODE:
@@ -93,25 +157,52 @@ if DEVELOPMENT_MODE and not IS_NEW_SESSION:
         sys.stdout = NullStream()
         sys.stderr = NullStream()
 
-def log_request(route: str, method: str, status: Any) -> None:
-    """Logs each request."""
-    logger.info(f"Route: {route} | Method: {method} | Status: {status}")
+sampler = LogSampler(parse_rates(LOG_SAMPLE_RATES))
+error_dedup = DuplicateSuppressor(LOG_DEDUP_WINDOW) if LOG_DEDUP_WINDOW > 0 else None
+
+
+def _enabled(level: int, route: Optional[str] = None) -> bool:
+    # Checked before a record (or its message) is built
+    return logger.isEnabledFor(level) and (not sampler.enabled or sampler.keep(level, route))
+
+def log_request(route: str, method: str, status: Any, latency_ms: Optional[float] = None) -> None:
+    """Logs the access record of a request; written once per request, after the response."""
+    if _enabled(logging.INFO, route):
+        logger.info(
+            "Route: %s | Method: %s | Status: %s", route, method, status,
+            extra={"route": route, "method": method, "status": status, "latency_ms": latency_ms}
+        )
 
 def log_error(error: Any) -> None:
-    """Logs errors."""
-    logger.error(f"Error: {error}", exc_info=True)
+    """Logs errors; repeats of the same error within LOG_DEDUP_WINDOW are counted instead."""
+    if not _enabled(logging.ERROR):
+        return
+    message = f"Error: {error}"
+    if error_dedup is not None:
+        log_this, repeated = error_dedup.check((type(error), message), message)
+        _log_repeated(repeated)
+        if not log_this:
+            return
+    logger.error(message, exc_info=True)
+
+def _log_repeated(repeated: List[Tuple[str, int]]) -> None:
+    for message, count in repeated:
+        logger.error("%s (repeated %d more times in %ss)", message, count, f"{LOG_DEDUP_WINDOW:g}")
 
-def log_warning(message: str) -> None:
-    """Logs a warning message."""
-    logger.warning(message)
+def log_warning(message: str, *args: Any) -> None:
+    """Logs a warning message; args are %-formatted into it only if the record is written."""
+    if _enabled(logging.WARNING):
+        logger.warning(message, *args)
 
-def log_info(message: str) -> None:
-    """Logs an info message."""
-    logger.info(message)
+def log_info(message: str, *args: Any) -> None:
+    """Logs an info message; args are %-formatted into it only if the record is written."""
+    if _enabled(logging.INFO):
+        logger.info(message, *args)
 
-def log_debug(message: str) -> None:
-    """Logs a debug message."""
-    logger.debug(message)
+def log_debug(message: str, *args: Any) -> None:
+    """Logs a debug message; args are %-formatted into it only if the record is written."""
+    if _enabled(logging.DEBUG):
+        logger.debug(message, *args)
 
 def log_startup() -> None:
     """Logs application startup."""
@@ -125,17 +216,20 @@ def log_startup() -> None:
         file_only_logger = logging.getLogger("file_only")
         if not file_only_logger.handlers:
             file_only_logger.setLevel(logging.DEBUG)
-            file_handler = logging.FileHandler(LOG_FILE)
-            file_handler.setFormatter(formatter)
             file_only_logger.addHandler(file_handler)
+            if sink_handler is not None:
+                file_only_logger.addHandler(sink_handler)
         
         file_only_logger.info(f"===== SERVER RELOADED (Session ID: {SESSION_ID}) =====")
 
 def log_shutdown() -> None:
     """Logs application shutdown."""
   
-    if not DEVELOPMENT_MODE or IS_NEW_SESSION:
+    if (not DEVELOPMENT_MODE or IS_NEW_SESSION) and os.getpid() == SESSION_PID:
         logger.info(f"===== SERVER SHUTTING DOWN (Session ID: {SESSION_ID}) =====")
+    if error_dedup is not None:
+        _log_repeated(error_dedup.flush())
+    # Drains the queued writer (if enabled) before the files are closed
     logging.shutdown()
 
 
@@ -147,23 +241,16 @@ log_startup()
 
 quiet_logger = logging.getLogger("quiet")
 if not quiet_logger.handlers:
-    quiet_logger.setLevel(logging.DEBUG)
+    quiet_logger.setLevel(logger.level)
     quiet_logger.propagate = False  
-    file_handler = logging.FileHandler(LOG_FILE)
-    formatter = logging.Formatter("%(asctime)s - [%(levelname)s] - %(message)s", "%Y-%m-%d %H:%M:%S")
-    file_handler.setFormatter(formatter)
     quiet_logger.addHandler(file_handler)
+    if sink_handler is not None:
+        quiet_logger.addHandler(sink_handler)
 
-def log_quiet(message: str, level: str = "INFO") -> None:
-    """Logs a message to file only, without console output"""
-    level = level.upper()
-    if level == "DEBUG":
-        quiet_logger.debug(message)
-    elif level == "INFO":
-        quiet_logger.info(message)
-    elif level == "WARNING":
-        quiet_logger.warning(message)
-    elif level == "ERROR":
-        quiet_logger.error(message)
-    else:
-        quiet_logger.info(message)
\ No newline at end of file
+def log_quiet(message: str, *args: Any, level: str = "INFO") -> None:
+    """Logs a message to file only, without console output; args are %-formatted into it."""
+    levelno = logging.getLevelName(level.upper())
+    if not isinstance(levelno, int) or levelno == logging.CRITICAL:
+        levelno = logging.INFO
+    if quiet_logger.isEnabledFor(levelno) and (not sampler.enabled or sampler.keep(levelno)):
+        quiet_logger.log(levelno, message, *args)
@@ -0,0 +1,416 @@
+import os
+import re
+import json
+import threading
+import time
+from flask import request, has_request_context
+from typing import Callable, Dict, List, Optional, Tuple
+from core.route_table import rule_segment
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+ROUTES_DIR: str = "routes"
+LAYOUT_FILE: str = "_layout.html"
+
+ROUTE_MANIFEST_WATCH: bool = os.getenv("ROUTE_MANIFEST_WATCH", "False").lower() == "true"
+# Where the manifest is loaded from at startup and saved to after a fresh walk
+ROUTE_MANIFEST_FILE: str = os.getenv("ROUTE_MANIFEST_FILE", "")
+# Compare recorded directory mtimes against the filesystem before trusting the file
+ROUTE_MANIFEST_VERIFY: bool = os.getenv("ROUTE_MANIFEST_VERIFY", "True").lower() == "true"
+# Seconds a page or layout mtime is trusted before it is checked again while the manifest
+# isn't watched (0 checks on every request)
+ROUTE_CHECK_INTERVAL: float = float(os.getenv("ROUTE_CHECK_INTERVAL", 1.0))
+
+MANIFEST_VERSION: int = 2
+ROUTE_FILES = ("controller.py", "page.html", "styles.css", "script.js", LAYOUT_FILE)
+
+_PARAM_SEGMENT_RE = re.compile(r"\[(?:\.\.\.)?([^\]:]*)(?::[^\]]*)?\]")
+
+
+def to_flask_rule(rel_path: str) -> str:
+    """Converts a route directory such as "user/[id:int]" into a Flask rule ("/user/<int:id>")."""
+    route_path = f"/{rel_path}" if rel_path else "/"
+    if "[" in route_path:
+        segments = route_path.split("/")
+        for i, segment in enumerate(segments):
+            try:
+                segments[i] = rule_segment(segment)
+            except ValueError:
+                pass  # reported when the route table rejects the route
+        route_path = "/".join(segments)
+    return route_path
+
+
+def to_endpoint(rel_path: str) -> str:
+    """Endpoint name of a route directory: "user/[id:int]" -> "route_user_id"."""
+    name = _PARAM_SEGMENT_RE.sub(r"\1", rel_path).replace("/", "_")
+    return f"route_{name}" if name else "route_index"
+
+
+def _is_ignored(name: str) -> bool:
+    """Skips caches and hidden directories such as __pycache__ when walking routes/"""
+    return name.startswith((".", "__"))
+
+
+def file_mtime(path: str) -> Optional[float]:
+    """Returns the modification time of a file, or None if it does not exist"""
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
+
+
+_checked_mtimes: Dict[str, Tuple[float, Optional[float]]] = {}
+
+
+def checked_mtime(path: str) -> Optional[float]:
+    """file_mtime(), calling stat at most once per ROUTE_CHECK_INTERVAL seconds per path."""
+    now = time.monotonic()
+    checked = _checked_mtimes.get(path)
+    if checked is not None and now - checked[0] < ROUTE_CHECK_INTERVAL:
+        return checked[1]
+    mtime = file_mtime(path)
+    _checked_mtimes[path] = (now, mtime)
+    return mtime
+
+
+def _read_hits(path: str) -> Optional[Dict[str, int]]:
+    """Request counts saved in a manifest file, or None if it can't be read."""
+    try:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(data, dict) or data.get("version") != MANIFEST_VERSION:
+        return None
+    return {route: int(count) for route, count in data.get("hits", {}).items()}
+
+
+class RouteEntry:
+    """Everything the engine and router need to know about one route directory."""
+
+    __slots__ = (
+        "route", "directory", "flask_route", "endpoint", "module_name",
+        "controller_path", "template_path", "page_mtime", "style_url", "script_url",
+        "dir_mtime", "layout_path", "layout_mtime",
+    )
+
+    def __init__(self, route: str, directory: str, files: List[str]) -> None:
+        self.route = route
+        self.directory = directory
+        self.dir_mtime = file_mtime(directory)
+        self.flask_route = to_flask_rule(route)
+
+        self.endpoint = to_endpoint(route)
+        self.module_name = route.replace("/", ".") if route else "index"
+
+        self.controller_path = (
+            os.path.join(directory, "controller.py") if "controller.py" in files else None
+        )
+        self.template_path = os.path.join(directory, "page.html") if "page.html" in files else None
+        self.page_mtime = file_mtime(self.template_path) if self.template_path else None
+
+        prefix = f"/{route}" if route else ""
+        self.style_url = f"{prefix}/styles.css" if "styles.css" in files else None
+        self.script_url = f"{prefix}/script.js" if "script.js" in files else None
+
+        # A _layout.html applies to this directory and everything below it
+        self.layout_path = os.path.join(directory, LAYOUT_FILE) if LAYOUT_FILE in files else None
+        self.layout_mtime = file_mtime(self.layout_path) if self.layout_path else None
+
+    @property
+    def files(self) -> List[str]:
+        present = (self.controller_path, self.template_path, self.style_url, self.script_url,
+                   self.layout_path)
+        return [name for name, path in zip(ROUTE_FILES, present) if path is not None]
+
+    @property
+    def depth(self) -> int:
+        return self.route.count("/") + 1 if self.route else 0
+
+
+class RouteManifest:
+    """In-memory table of route directories, built by walking routes/ once.
+
+    Lookups never touch the filesystem. With watch() running, the table is
+    updated per directory as files are created, changed or deleted.
+    """
+
+    def __init__(self, routes_dir: str = ROUTES_DIR) -> None:
+        self.routes_dir = routes_dir
+        self.layout_path = os.path.join(routes_dir, LAYOUT_FILE)
+        self.layout_mtime: Optional[float] = None
+        self.entries: Dict[str, RouteEntry] = {}
+        self.by_rule: Dict[str, RouteEntry] = {}
+        self.built = False
+        self.loaded_from: Optional[str] = None
+        # Requests per route recorded by previous runs, used to pick routes to warm up
+        self.hits: Dict[str, int] = {}
+        self.observer = None
+        # Called with the path of every file or directory the watcher saw change
+        self.listeners: List[Callable[[str], None]] = []
+        self._lock = threading.Lock()
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._after_fork_in_child)
+
+    def _after_fork_in_child(self) -> None:
+        """The watcher thread does not survive fork(); the child starts its own."""
+        self._lock = threading.Lock()
+        if self.observer is not None:
+            self.observer = None
+            self.watch()
+
+    @property
+    def has_layout(self) -> bool:
+        return self.layout_mtime is not None
+
+    @property
+    def is_live(self) -> bool:
+        """True when a watcher keeps the recorded mtimes current."""
+        return self.observer is not None
+
+    def build(self) -> None:
+        """Walks the routes directory and records every route in it."""
+        entries: Dict[str, RouteEntry] = {}
+        for root, dirs, files in os.walk(self.routes_dir):
+            dirs[:] = [d for d in dirs if not _is_ignored(d)]
+            rel_path = root.replace("\\", "/")[len(self.routes_dir):].strip("/")
+            entries[rel_path] = RouteEntry(rel_path, root, files)
+
+        with self._lock:
+            self.layout_mtime = file_mtime(self.layout_path)
+            self.entries = entries
+            self.by_rule = {entry.flask_route: entry for entry in entries.values()}
+            self.built = True
+
+    def ensure_built(self) -> None:
+        if not self.built:
+            self.build()
+
+    def load(self, path: str, verify: bool = ROUTE_MANIFEST_VERIFY) -> bool:
+        """Loads a manifest written by save() instead of walking routes/.
+
+        With verify, every recorded directory is stat'ed and the file is
+        rejected if one of them changed: adding or removing a file or a
+        subdirectory updates the mtime of the directory containing it.
+        """
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if not isinstance(data, dict) or data.get("version") != MANIFEST_VERSION:
+            return False
+
+        self.hits = {route: int(count) for route, count in data.get("hits", {}).items()}
+        if data.get("routes_dir") != self.routes_dir:
+            return False
+
+        entries: Dict[str, RouteEntry] = {}
+        for item in data.get("routes", []):
+            route = item["route"]
+            directory = os.path.join(self.routes_dir, *(route.split("/") if route else []))
+            if verify and file_mtime(directory) != item.get("mtime"):
+                return False
+            entries[route] = RouteEntry(route, directory, item.get("files", []))
+
+        layout_mtime = file_mtime(self.layout_path)
+        if verify and layout_mtime != data.get("layout_mtime"):
+            return False
+
+        with self._lock:
+            self.layout_mtime = layout_mtime
+            self.entries = entries
+            self.by_rule = {entry.flask_route: entry for entry in entries.values()}
+            self.built = True
+            self.loaded_from = path
+        return True
+
+    def save(self, path: str) -> None:
+        """Writes the manifest to a JSON file, atomically replacing an older one."""
+        self.ensure_built()
+        with self._lock:
+            data = {
+                "version": MANIFEST_VERSION,
+                "routes_dir": self.routes_dir,
+                "layout_mtime": self.layout_mtime,
+                "routes": [
+                    {"route": entry.route, "files": entry.files, "mtime": entry.dir_mtime}
+                    for entry in self.entries.values()
+                ],
+                "hits": self.hits,
+            }
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, separators=(",", ":"))
+        os.replace(tmp_path, path)
+
+    def load_or_build(self, path: str = ROUTE_MANIFEST_FILE) -> None:
+        """Loads the manifest file when it is present and current, otherwise walks
+        routes/ and (re)writes the file for the next start."""
+        if path and self.load(path):
+            return
+        self.build()
+        if path:
+            try:
+                self.save(path)
+            except OSError:
+                pass
+
+    def record_hits(self, counts: Dict[str, int]) -> None:
+        for route, count in counts.items():
+            if count:
+                self.hits[route] = self.hits.get(route, 0) + count
+
+    def save_hits(self, path: str, counts: Dict[str, int]) -> None:
+        """Adds counts to the hits in the file and saves it.
+
+        Pre-fork workers and the master each call this on exit with their own
+        counts, so the file is re-read under a lock instead of being
+        overwritten with this process's view of it.
+        """
+        lock_fd = None
+        if fcntl is not None:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            lock_fd = os.open(f"{path}.lock", os.O_RDWR | os.O_CREAT, 0o644)
+            fcntl.flock(lock_fd, fcntl.LOCK_EX)
+        try:
+            hits = _read_hits(path)
+            if hits is not None:
+                self.hits = hits
+            self.record_hits(counts)
+            self.save(path)
+        finally:
+            if lock_fd is not None:
+                os.close(lock_fd)
+
+    def popular(self, limit: int) -> List[RouteEntry]:
+        """Routes with a controller, most requested first. Routes never seen fall
+        back to the shallowest ones, since they are the most likely entry points."""
+        self.ensure_built()
+        candidates = [entry for entry in self.entries.values() if entry.controller_path]
+        candidates.sort(
+            key=lambda entry: (-self.hits.get(entry.route, 0), entry.depth, entry.route)
+        )
+        return candidates[:limit]
+
+    def refresh(self, directory: str, recursive: bool = False) -> None:
+        """Re-reads a route directory (and optionally its subtree) after something in it changed."""
+        directory = os.path.normpath(directory)
+        rel_path = os.path.relpath(directory, self.routes_dir).replace("\\", "/")
+        if rel_path == ".":
+            rel_path = ""
+        if rel_path.startswith("..") or any(_is_ignored(p) for p in rel_path.split("/") if p):
+            return
+
+        with self._lock:
+            if not rel_path:
+                self.layout_mtime = file_mtime(self.layout_path)
+
+            old_entry = self.entries.pop(rel_path, None)
+            if old_entry is not None:
+                self.by_rule.pop(old_entry.flask_route, None)
+
+            if not os.path.isdir(directory):
+                # The directory is gone, so are all of its children
+                for child in [r for r in self.entries if r.startswith(f"{rel_path}/")]:
+                    self.by_rule.pop(self.entries.pop(child).flask_route, None)
+                return
+
+            entry = RouteEntry(rel_path, directory, os.listdir(directory))
+            self.entries[rel_path] = entry
+            self.by_rule[entry.flask_route] = entry
+
+        if recursive:
+            for child in os.listdir(directory):
+                if not _is_ignored(child) and os.path.isdir(os.path.join(directory, child)):
+                    self.refresh(os.path.join(directory, child), recursive=True)
+
+    def layouts(self, route: str) -> List[RouteEntry]:
+        """Entries of the route and its parents that have a _layout.html, outermost first."""
+        self.ensure_built()
+        parts = route.split("/") if route else []
+        chain = []
+        for i in range(len(parts) + 1):
+            entry = self.entries.get("/".join(parts[:i]))
+            if entry is not None and entry.layout_path is not None:
+                chain.append(entry)
+        return chain
+
+    def get(self, route: str) -> Optional[RouteEntry]:
+        self.ensure_built()
+        return self.entries.get(route)
+
+    def for_request(self) -> Optional[RouteEntry]:
+        """Returns the entry for the current request, matching dynamic routes by URL rule."""
+        if not has_request_context():
+            return None
+        self.ensure_built()
+        rule = request.url_rule
+        if rule is not None:
+            entry = self.by_rule.get(rule.rule)
+            if entry is not None:
+                return entry
+        return self.entries.get(request.path.strip("/"))
+
+    def watch(self) -> None:
+        """Starts a watchdog observer that keeps the manifest up to date."""
+        if self.observer is not None:
+            return
+
+        from watchdog.observers import Observer
+        from watchdog.events import FileSystemEventHandler
+
+        manifest = self
+
+        class ManifestEventHandler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                if event.event_type in ("opened", "closed", "closed_no_write"):
+                    return
+                for path in (event.src_path, getattr(event, "dest_path", "")):
+                    if not path:
+                        continue
+                    if event.is_directory:
+                        manifest.refresh(path, recursive=True)
+                    else:
+                        manifest.refresh(os.path.dirname(path))
+                    for listener in manifest.listeners:
+                        listener(path)
+
+        self.ensure_built()
+        observer = Observer()
+        observer.schedule(ManifestEventHandler(), self.routes_dir, recursive=True)
+        observer.daemon = True
+        observer.start()
+        self.observer = observer
+
+    def stop(self) -> None:
+        if self.observer is not None:
+            self.observer.stop()
+            self.observer = None
+
+
+route_manifest = RouteManifest()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Prebuild the route manifest loaded at startup")
+    parser.add_argument("command", choices=["build"])
+    parser.add_argument("--routes", default=ROUTES_DIR, help="routes directory")
+    parser.add_argument("--output", default=ROUTE_MANIFEST_FILE or ".route_manifest.json",
+                        help="manifest file to write")
+    args = parser.parse_args()
+
+    manifest = RouteManifest(args.routes)
+    manifest.load(args.output, verify=False)
+    manifest.build()
+    manifest.save(args.output)
+    print(f"Wrote {len(manifest.entries)} routes to {args.output}")
@@ -0,0 +1,312 @@
+"""Per-route request counters and phase latency histograms.
+
+Under the pre-fork server every worker has its own registry. The master
+exports a directory as ROUTER_METRICS_DIR; each worker writes a snapshot of
+its registry there (`<pid>.json`) every METRICS_SYNC_INTERVAL seconds and on
+exit, and a scrape merges all snapshots, so any worker returns the totals.
+When a worker exits, the master folds its snapshot into `retired.json`, so
+counters don't go backwards when workers are replaced.
+"""
+import atexit
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from typing import Any, Dict, List, Optional, Tuple
+from flask import g, has_request_context, request
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None  # type: ignore[assignment]
+
+METRICS_ENABLED: bool = os.getenv("METRICS", "True").lower() == "true"
+# Seconds between snapshots a pre-fork worker writes for the other workers' scrapes
+METRICS_SYNC_INTERVAL: float = float(os.getenv("METRICS_SYNC_INTERVAL", 1.0))
+RETIRED_FILE = "retired.json"
+
+# Upper bounds (seconds) of the latency histogram buckets
+BUCKETS: Tuple[float, ...] = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+
+# auth: protection check, handler: the controller's handler (includes template and render),
+# template: page template resolution and compilation, render: template rendering,
+# total: before_request to after_request
+PHASES: Tuple[str, ...] = ("auth", "handler", "template", "render", "total")
+
+
+class Histogram:
+    """Fixed-bucket latency histogram."""
+
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self) -> None:
+        self.counts: List[int] = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def _label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class MetricsRegistry:
+    """Per-route request counters and phase histograms."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.histograms: Dict[Tuple[str, str, str], Histogram] = {}
+        self.requests: Dict[Tuple[str, str, int], int] = {}
+        self._dirty = False
+        self._syncer: Optional[threading.Thread] = None
+
+    def _after_fork_in_child(self) -> None:
+        # A worker starts counting from zero; the syncer thread does not survive fork()
+        self._lock = threading.Lock()
+        self.histograms = {}
+        self.requests = {}
+        self._dirty = False
+        self._syncer = None
+
+    def observe_request(self, route: str, method: str, status: int,
+                        phases: Dict[str, float]) -> None:
+        if self._syncer is None and os.environ.get("ROUTER_METRICS_DIR"):
+            self._start_syncer()
+        with self._lock:
+            self._dirty = True
+            key = (route, method, status)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            for phase, seconds in phases.items():
+                histogram = self.histograms.get((route, method, phase))
+                if histogram is None:
+                    histogram = self.histograms[(route, method, phase)] = Histogram()
+                histogram.observe(seconds)
+
+    def reset(self) -> None:
+        with self._lock:
+            self.histograms = {}
+            self.requests = {}
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Returns the registry as JSON-serializable lists."""
+        with self._lock:
+            self._dirty = False
+            return {
+                "requests": [[*key, count] for key, count in self.requests.items()],
+                "histograms": [
+                    [*key, list(h.counts), h.sum, h.count] for key, h in self.histograms.items()
+                ],
+            }
+
+    def merge(self, data: Dict[str, Any]) -> None:
+        """Adds a snapshot's counts to this registry."""
+        with self._lock:
+            for route, method, status, count in data.get("requests", ()):
+                key = (route, method, int(status))
+                self.requests[key] = self.requests.get(key, 0) + count
+            for route, method, phase, counts, total, count in data.get("histograms", ()):
+                histogram = self.histograms.get((route, method, phase))
+                if histogram is None:
+                    histogram = self.histograms[(route, method, phase)] = Histogram()
+                if len(counts) == len(histogram.counts):
+                    histogram.counts = [a + b for a, b in zip(histogram.counts, counts)]
+                    histogram.sum += total
+                    histogram.count += count
+
+    def _start_syncer(self) -> None:
+        with self._lock:
+            if self._syncer is not None:
+                return
+            self._syncer = threading.Thread(target=self._sync_loop, name="metrics-sync",
+                                            daemon=True)
+            self._syncer.start()
+        atexit.register(self.sync)
+
+    def _sync_loop(self) -> None:
+        while True:
+            time.sleep(METRICS_SYNC_INTERVAL)
+            if self._dirty:
+                self.sync()
+
+    def sync(self) -> None:
+        """Writes this process's snapshot to the shared metrics directory."""
+        directory = os.environ.get("ROUTER_METRICS_DIR")
+        if not directory:
+            return
+        path = os.path.join(directory, f"{os.getpid()}.json")
+        try:
+            _write_json(path, self.snapshot())
+        except OSError:
+            pass
+
+    def _collect(self) -> "MetricsRegistry":
+        """Returns the registry to render: this one, or the merge of every process's."""
+        directory = os.environ.get("ROUTER_METRICS_DIR")
+        if not directory:
+            return self
+        self.sync()
+        merged = MetricsRegistry()
+        with _locked(directory, shared=True):
+            try:
+                names = os.listdir(directory)
+            except OSError:
+                names = []
+            for name in names:
+                if name.endswith(".json"):
+                    data = _read_json(os.path.join(directory, name))
+                    if data is not None:
+                        merged.merge(data)
+        return merged
+
+    def render_prometheus(self) -> str:
+        """Renders all metrics in the Prometheus text exposition format."""
+        lines = [
+            "# HELP router_requests_total Requests handled, by route, method and status.",
+            "# TYPE router_requests_total counter",
+        ]
+        registry = self._collect()
+        with registry._lock:
+            requests = sorted(registry.requests.items())
+            histograms = sorted(
+                (key, list(h.counts), h.sum, h.count) for key, h in registry.histograms.items()
+            )
+
+        for (route, method, status), count in requests:
+            labels = f'route="{_label(route)}",method="{method}",status="{status}"'
+            lines.append(f"router_requests_total{{{labels}}} {count}")
+
+        lines.append("# HELP router_request_phase_seconds Time spent in each phase of a request.")
+        lines.append("# TYPE router_request_phase_seconds histogram")
+        for (route, method, phase), counts, total, count in histograms:
+            labels = f'route="{_label(route)}",method="{method}",phase="{phase}"'
+            cumulative = 0
+            for bound, bucket_count in zip(BUCKETS, counts):
+                cumulative += bucket_count
+                lines.append(
+                    f'router_request_phase_seconds_bucket{{{labels},le="{bound}"}} {cumulative}'
+                )
+            lines.append(f'router_request_phase_seconds_bucket{{{labels},le="+Inf"}} {count}')
+            lines.append(f"router_request_phase_seconds_sum{{{labels}}} {total:.6f}")
+            lines.append(f"router_request_phase_seconds_count{{{labels}}} {count}")
+        return "\n".join(lines) + "\n"
+
+
+def _read_json(path: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def _write_json(path: str, data: Dict[str, Any]) -> None:
+    # Readers never see a half-written snapshot
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+
+class _locked:
+    """flock on the metrics directory's lock file; a no-op without fcntl."""
+
+    def __init__(self, directory: str, shared: bool) -> None:
+        self.path = os.path.join(directory, ".lock")
+        self.shared = shared
+        self.fd: Optional[int] = None
+
+    def __enter__(self) -> "_locked":
+        if fcntl is not None:
+            try:
+                self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            except OSError:
+                return self
+            fcntl.flock(self.fd, fcntl.LOCK_SH if self.shared else fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+def retire_process(directory: str, pid: int) -> None:
+    """Folds an exited worker's snapshot into the retired totals."""
+    path = os.path.join(directory, f"{pid}.json")
+    data = _read_json(path)
+    if data is None:
+        return
+    with _locked(directory, shared=False):
+        retired = MetricsRegistry()
+        retired.merge(_read_json(os.path.join(directory, RETIRED_FILE)) or {})
+        retired.merge(data)
+        try:
+            _write_json(os.path.join(directory, RETIRED_FILE), retired.snapshot())
+            os.remove(path)
+        except OSError:
+            pass
+
+
+metrics = MetricsRegistry()
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=metrics._after_fork_in_child)
+
+
+def record_phase(phase: str, seconds: float) -> None:
+    """Adds time spent in a phase to the current request's timings."""
+    if not METRICS_ENABLED or not has_request_context():
+        return
+    phases = g.get("request_phases")
+    if phases is None:
+        phases = g.request_phases = {}
+    phases[phase] = phases.get(phase, 0.0) + seconds
+
+
+class phase_timer:
+    """Context manager that records the time spent in its block as a request phase."""
+
+    __slots__ = ("phase", "started")
+
+    def __init__(self, phase: str) -> None:
+        self.phase = phase
+        self.started = 0.0
+
+    def __enter__(self) -> "phase_timer":
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        record_phase(self.phase, time.perf_counter() - self.started)
+
+
+def finish_request(status: int, total_seconds: Optional[float]) -> None:
+    """Moves the current request's phase timings into the per-route histograms."""
+    if not METRICS_ENABLED:
+        return
+    phases = g.pop("request_phases", None) or {}
+    if total_seconds is not None:
+        phases["total"] = total_seconds
+    rule = request.url_rule
+    route = rule.rule if rule is not None else "<unmatched>"
+    metrics.observe_request(route, request.method, status, phases)
+
+
+def render_started(sender: object, **extra: object) -> None:
+    """before_render_template receiver."""
+    if METRICS_ENABLED and has_request_context():
+        g.render_started = time.perf_counter()
+
+
+def render_finished(sender: object, **extra: object) -> None:
+    """template_rendered receiver."""
+    started = g.pop("render_started", None) if has_request_context() else None
+    if started is not None:
+        record_phase("render", time.perf_counter() - started)
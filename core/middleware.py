@@ -1,36 +1,163 @@
 from flask import request, redirect, session
-from typing import Optional, List, Dict, Callable, Any
+from typing import Optional, List, Dict, Callable, Any, Pattern
 from functools import wraps
 import re
+import threading
+import time
+from core.metrics import record_phase
 
 PROTECTED_ROUTES: List[str] = []
 
 PROTECTED_PATTERNS: List[str] = [
-    r"^/user/[^/]+/edit$",  
+    r"^/user/[^/]+/edit$",
 ]
 
-def auth_required(f: Callable) -> Callable:
-    """Decorator for routes that require authentication."""
+_END = ""
+
+
+class ProtectionRules:
+    """Compiled form of PROTECTED_ROUTES and PROTECTED_PATTERNS.
+
+    Route prefixes live in a character trie, so a lookup walks the path once
+    no matter how many prefixes there are. All patterns are joined into a
+    single regular expression.
+    """
+
+    def __init__(self, routes: List[str], patterns: List[str]) -> None:
+        self.trie: Dict[str, Any] = {}
+        for route in routes:
+            node = self.trie
+            for char in route:
+                node = node.setdefault(char, {})
+            node[_END] = True
+
+        self.patterns: List[Pattern[str]] = []
+        if patterns:
+            try:
+                self.patterns = [re.compile("|".join(f"(?:{pattern})" for pattern in patterns))]
+            except re.error:
+                # Patterns that cannot be combined (e.g. duplicate group names) are matched
+                # one by one
+                self.patterns = [re.compile(pattern) for pattern in patterns]
+
+    def prefix_match(self, path: str) -> bool:
+        """Checks whether any protected route is a prefix of the path."""
+        node = self.trie
+        if _END in node:
+            return True
+        for char in path:
+            node = node.get(char)
+            if node is None:
+                return False
+            if _END in node:
+                return True
+        return False
+
+    def matches(self, path: str) -> bool:
+        if self.prefix_match(path):
+            return True
+        return any(pattern.match(path) for pattern in self.patterns)
+
+    def route_decision(self, route: str) -> Optional[bool]:
+        """Decides protection for a registered route template such as "/user/<id>".
+
+        Returns None when the answer depends on the concrete path.
+        """
+        if "<" not in route:
+            return self.matches(route)
+        if self.prefix_match(route[:route.index("<")]):
+            return True
+        return None
+
+
+_rules_lock = threading.Lock()
+_rules: ProtectionRules = ProtectionRules(PROTECTED_ROUTES, PROTECTED_PATTERNS)
+_route_decisions: Dict[str, Optional[bool]] = {}
+
+
+def reload_protection() -> None:
+    """Recompiles the protection rules and drops all precomputed route decisions.
+
+    Call this after changing PROTECTED_ROUTES or PROTECTED_PATTERNS directly.
+    """
+    global _rules, _route_decisions
+    with _rules_lock:
+        _rules = ProtectionRules(PROTECTED_ROUTES, PROTECTED_PATTERNS)
+        _route_decisions = {}
+
+
+def protect_route(prefix: str) -> None:
+    """Protects every path starting with the given prefix."""
+    if prefix not in PROTECTED_ROUTES:
+        PROTECTED_ROUTES.append(prefix)
+        reload_protection()
+
+
+def unprotect_route(prefix: str) -> None:
+    if prefix in PROTECTED_ROUTES:
+        PROTECTED_ROUTES.remove(prefix)
+        reload_protection()
+
+
+def protect_pattern(pattern: str) -> None:
+    """Protects every path matching the given regular expression."""
+    re.compile(pattern)
+    if pattern not in PROTECTED_PATTERNS:
+        PROTECTED_PATTERNS.append(pattern)
+        reload_protection()
+
+
+def unprotect_pattern(pattern: str) -> None:
+    if pattern in PROTECTED_PATTERNS:
+        PROTECTED_PATTERNS.remove(pattern)
+        reload_protection()
+
+
+def is_protected(path: str) -> bool:
+    """Checks a concrete request path against the protection rules."""
+    return _rules.matches(path)
+
+
+def route_protection(route: str) -> Optional[bool]:
+    """Returns the precomputed decision for a route template, computing it on first use."""
+    decisions = _route_decisions
+    if route in decisions:
+        return decisions[route]
+    decision = _rules.route_decision(route)
+    decisions[route] = decision
+    return decision
+
+
+def auth_required(f: Optional[Callable] = None, *, route: Optional[str] = None) -> Callable:
+    """Decorator for routes that require authentication.
+
+    When the route template is passed, protection is decided once for that
+    route and only routes whose answer depends on the path are checked per
+    request.
+    """
+    if f is None:
+        return lambda func: auth_required(func, route=route)
+
+    if route is not None:
+        route_protection(route)
+
     @wraps(f)
     def decorated_function(*args: Any, **kwargs: Any) -> Any:
-        path = request.path
-        
-        is_protected = any(path.startswith(route) for route in PROTECTED_ROUTES)
-        
-        if not is_protected:
-            is_protected = any(re.match(pattern, path) for pattern in PROTECTED_PATTERNS)
-            
-        if is_protected:
+        started = time.perf_counter()
+        is_protected_route = route_protection(route) if route is not None else None
+        if is_protected_route is None:
+            is_protected_route = is_protected(request.path)
+
+        if is_protected_route:
             user: Optional[str] = session.get("user")
             if not user:
+                record_phase("auth", time.perf_counter() - started)
                 return redirect("/login")
-                
+
+        record_phase("auth", time.perf_counter() - started)
         return f(*args, **kwargs)
     return decorated_function
 
 def auth_middleware(route: str) -> bool:
     """Checks if a route is protected without accessing session."""
-    is_protected = any(route.startswith(protected) for protected in PROTECTED_ROUTES)
-    if not is_protected:
-        is_protected = any(re.match(pattern, route) for pattern in PROTECTED_PATTERNS)
-    return is_protected
\ No newline at end of file
+    return is_protected(route)
@@ -0,0 +1,322 @@
+"""Opt-in cache of rendered route responses.
+
+It is off unless OUTPUT_CACHE=True, and then a controller enables it by
+declaring CACHE in its module:
+
+    CACHE = {
+        "ttl": 60,              # seconds a response is fresh
+        "stale": 30,            # further seconds it may be served while it is re-rendered
+        "vary": ["page"],       # query parameters that are part of the key
+        "authenticated": False, # False: bypass for logged in users, True: cache per user
+    }
+
+Only GET/HEAD requests and 200 responses are cached. Keys contain the path,
+view args, the selected query parameters, the user (empty when anonymous) and a
+version built from the controller, page and layout mtimes, so editing any of
+them makes older entries unreachable; they age out through TTL/LRU.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from flask import Response, copy_current_request_context, make_response, request, session
+from types import ModuleType
+from typing import Any, Callable, Dict, List, Optional, Tuple, cast
+from core.logger import log_error
+from core.manifest import route_manifest, checked_mtime, RouteManifest, LAYOUT_FILE
+
+OUTPUT_CACHE: bool = os.getenv("OUTPUT_CACHE", "False").lower() == "true"
+# "memory" (per process) or "sqlite" (shared by the processes of one machine)
+OUTPUT_CACHE_BACKEND: str = os.getenv("OUTPUT_CACHE_BACKEND", "memory").lower()
+OUTPUT_CACHE_PATH: str = os.getenv("OUTPUT_CACHE_PATH", ".output_cache.sqlite3")
+OUTPUT_CACHE_MAX_BYTES: int = int(os.getenv("OUTPUT_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+
+# Headers that must not be replayed to other clients
+_UNCACHEABLE_HEADERS = {"set-cookie", "content-length", "date"}
+
+
+class CachePolicy:
+    __slots__ = ("ttl", "stale", "vary", "authenticated")
+
+    def __init__(self, ttl: float, stale: float = 0, vary: Optional[List[str]] = None,
+                 authenticated: bool = False) -> None:
+        self.ttl = float(ttl)
+        self.stale = float(stale)
+        self.vary = sorted(vary or [])
+        self.authenticated = authenticated
+
+
+_NO_POLICY = object()
+
+
+def cache_policy(module: ModuleType) -> Optional[CachePolicy]:
+    """Reads (once per imported module) the controller's CACHE settings."""
+    cached = module.__dict__.get("__cache_policy__", _NO_POLICY)
+    if cached is not _NO_POLICY:
+        return cast(Optional[CachePolicy], cached)
+    settings = getattr(module, "CACHE", None)
+    policy = None
+    if isinstance(settings, dict) and settings.get("ttl"):
+        policy = CachePolicy(
+            settings["ttl"], settings.get("stale", 0),
+            settings.get("vary"), settings.get("authenticated", False)
+        )
+    setattr(module, "__cache_policy__", policy)
+    return policy
+
+
+class CacheEntry:
+    __slots__ = ("status", "headers", "body", "expires", "stale_until")
+
+    def __init__(self, status: int, headers: List[Tuple[str, str]], body: bytes,
+                 expires: float, stale_until: float) -> None:
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.expires = expires
+        self.stale_until = stale_until
+
+    @property
+    def size(self) -> int:
+        return len(self.body) + sum(len(k) + len(v) for k, v in self.headers) + 64
+
+
+class MemoryBackend:
+    """Per-process LRU bounded by the total size of the cached bodies."""
+
+    def __init__(self, max_bytes: int = OUTPUT_CACHE_MAX_BYTES) -> None:
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+            return entry
+
+    def set(self, key: str, entry: CacheEntry) -> None:
+        if entry.size > self.max_bytes:
+            return
+        with self._lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.size -= old.size
+            self.entries[key] = entry
+            self.size += entry.size
+            while self.size > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= evicted.size
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.size -= old.size
+
+    def clear(self) -> None:
+        with self._lock:
+            self.entries.clear()
+            self.size = 0
+
+
+class SQLiteBackend:
+    """Cache shared through a local SQLite file, e.g. by pre-forked workers.
+
+    Entries are evicted least recently used first once their total size
+    exceeds max_bytes; access times are only written back every few seconds
+    so hits stay read-only.
+    """
+
+    TOUCH_INTERVAL = 5.0
+    PRUNE_EVERY = 100
+
+    def __init__(self, path: str = OUTPUT_CACHE_PATH,
+                 max_bytes: int = OUTPUT_CACHE_MAX_BYTES) -> None:
+        self.path = path
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._writes = 0
+        conn = self._conn()
+        conn.execute("""CREATE TABLE IF NOT EXISTS entries (
+            key TEXT PRIMARY KEY, status INTEGER, headers TEXT, body BLOB,
+            expires REAL, stale_until REAL, size INTEGER, accessed REAL)""")
+        conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)")
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        conn = self._conn()
+        row = conn.execute(
+            "SELECT status, headers, body, expires, stale_until, accessed "
+            "FROM entries WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        now = time.time()
+        if now - row[5] > self.TOUCH_INTERVAL:
+            conn.execute("UPDATE entries SET accessed = ? WHERE key = ?", (now, key))
+        return CacheEntry(row[0], [tuple(h) for h in json.loads(row[1])], row[2], row[3], row[4])
+
+    def set(self, key: str, entry: CacheEntry) -> None:
+        if entry.size > self.max_bytes:
+            return
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (key, entry.status, json.dumps(entry.headers), entry.body,
+             entry.expires, entry.stale_until, entry.size, time.time())
+        )
+        with self._lock:
+            self._writes += 1
+            due = self._writes % self.PRUNE_EVERY == 0
+        if due:
+            self.prune()
+
+    def prune(self) -> None:
+        conn = self._conn()
+        conn.execute("DELETE FROM entries WHERE stale_until < ?", (time.time(),))
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        excess = total - self.max_bytes
+        freed = 0
+        victims = []
+        for key, size in conn.execute("SELECT key, size FROM entries ORDER BY accessed"):
+            victims.append((key,))
+            freed += size
+            if freed >= excess:
+                break
+        conn.executemany("DELETE FROM entries WHERE key = ?", victims)
+
+    def delete(self, key: str) -> None:
+        self._conn().execute("DELETE FROM entries WHERE key = ?", (key,))
+
+    def clear(self) -> None:
+        self._conn().execute("DELETE FROM entries")
+
+
+def create_backend(name: str = OUTPUT_CACHE_BACKEND) -> Any:
+    if name == "sqlite":
+        return SQLiteBackend()
+    return MemoryBackend()
+
+
+class OutputCache:
+    def __init__(self, backend: Any = None) -> None:
+        self.backend = backend if backend is not None else create_backend()
+        self._refreshing: set = set()
+        self._lock = threading.Lock()
+
+    def key(self, policy: CachePolicy, version: str, view_args: Dict[str, Any],
+            user: Optional[str]) -> str:
+        params = "&".join(f"{name}={','.join(request.args.getlist(name))}"
+                          for name in policy.vary if name in request.args)
+        args = ",".join(f"{k}={v}" for k, v in sorted(view_args.items()))
+        return f"{version}|{request.path}|{args}|{params}|{user or ''}"
+
+    def serve(self, policy: CachePolicy, version: str, view_args: Dict[str, Any],
+              render: Callable[[], Any]) -> Any:
+        """Returns the cached response for this request, or renders and stores it."""
+        if request.method not in ("GET", "HEAD"):
+            return render()
+
+        user = session.get("user") or request.cookies.get("user")
+        if user and not policy.authenticated:
+            return render()
+
+        key = self.key(policy, version, view_args, user)
+        entry = self.backend.get(key)
+        now = time.time()
+        if entry is not None:
+            if now < entry.expires:
+                return self._replay(entry, "HIT")
+            if now < entry.stale_until:
+                self._revalidate(key, policy, render)
+                return self._replay(entry, "STALE")
+
+        response = make_response(render())
+        self._store(key, policy, response)
+        response.headers["X-Cache"] = "MISS"
+        return response
+
+    def _store(self, key: str, policy: CachePolicy, response: Response) -> None:
+        if response.status_code != 200 or response.is_streamed or response.direct_passthrough:
+            return
+        headers = [
+            (k, v) for k, v in response.headers.items() if k.lower() not in _UNCACHEABLE_HEADERS
+        ]
+        now = time.time()
+        expires = now + policy.ttl
+        entry = CacheEntry(200, headers, response.get_data(), expires, expires + policy.stale)
+        self.backend.set(key, entry)
+
+    def _replay(self, entry: CacheEntry, state: str) -> Response:
+        response = Response(entry.body, status=entry.status, headers=entry.headers)
+        response.headers["X-Cache"] = state
+        return response
+
+    def _revalidate(self, key: str, policy: CachePolicy, render: Callable[[], Any]) -> None:
+        """Re-renders a stale entry in the background, once per key at a time."""
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        @copy_current_request_context
+        def refresh() -> None:
+            try:
+                self._store(key, policy, make_response(render()))
+            except Exception as e:
+                log_error(f"Output cache refresh failed for {request.path}: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=refresh, name="output-cache-refresh", daemon=True).start()
+
+    def clear(self) -> None:
+        self.backend.clear()
+
+
+output_cache = OutputCache() if OUTPUT_CACHE else None
+
+
+def route_version(controller_mtime: Optional[float], route: str,
+                  manifest: RouteManifest = route_manifest) -> str:
+    """Changes whenever the controller, the page template or one of its layouts changes.
+
+    Uses the mtimes the route manifest records while it is being watched,
+    otherwise stats page.html and every _layout.html above it (at most once
+    per ROUTE_CHECK_INTERVAL), like the template loader's uptodate checks.
+    """
+    if manifest.is_live:
+        entry = manifest.entries.get(route)
+        page_mtime = entry.page_mtime if entry is not None else None
+        layouts = ",".join(
+            f"{layout.route}={layout.layout_mtime}" for layout in manifest.layouts(route)
+        )
+        return f"{controller_mtime}:{page_mtime}:{layouts}"
+
+    parts = route.split("/") if route else []
+    directory = os.path.join(manifest.routes_dir, *parts)
+    page_mtime = checked_mtime(os.path.join(directory, "page.html"))
+    layouts = ",".join(
+        f"{i}={checked_mtime(os.path.join(manifest.routes_dir, *parts[:i], LAYOUT_FILE))}"
+        for i in range(len(parts) + 1)
+    )
+    return f"{controller_mtime}:{page_mtime}:{layouts}"
@@ -0,0 +1,163 @@
+import os
+import threading
+from flask import Flask
+from typing import Dict, Iterable, Optional, Set
+from core.logger import log_info, log_error
+from core.manifest import route_manifest, RouteEntry, LAYOUT_FILE
+from core.route_table import RouteMap
+from core import router
+
+HOT_RELOAD: bool = os.getenv("HOT_RELOAD", "False").lower() == "true"
+# Seconds to wait for more changes before applying them, editors save in several steps
+HOT_RELOAD_DELAY: float = float(os.getenv("HOT_RELOAD_DELAY", 0.2))
+
+
+class RouteReloader:
+    """Applies changes under routes/ to a running app without restarting it.
+
+    The route manifest's watcher reports changed paths; after a short quiet
+    period they are applied together:
+
+    - a changed controller.py is re-imported (only that module),
+    - created or deleted route directories add or remove URL rules,
+    - changed page.html files are dropped from the template cache, and so is
+      everything below a changed _layout.html.
+
+    The route table is never edited in place: a new one is built and
+    swapped in, so requests that already matched a route finish against the
+    old table and view functions of removed routes stay callable.
+    """
+
+    def __init__(self, app: Flask, delay: float = HOT_RELOAD_DELAY) -> None:
+        self.app = app
+        self.delay = delay
+        self.pending: Set[str] = set()
+        self._condition = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        route_manifest.listeners.append(self.notify)
+        route_manifest.watch()
+        self._start_thread()
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._after_fork_in_child)
+
+    def _start_thread(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="route-reloader", daemon=True)
+        self._thread.start()
+
+    def _after_fork_in_child(self) -> None:
+        # Each pre-forked worker applies changes to its own copy of the app
+        self.pending = set()
+        self._condition = threading.Condition()
+        self._start_thread()
+
+    def notify(self, path: str) -> None:
+        with self._condition:
+            self.pending.add(os.path.normpath(path))
+            self._condition.notify()
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                while not self.pending:
+                    self._condition.wait()
+                # Keep collecting until no change arrived for `delay` seconds
+                while True:
+                    count = len(self.pending)
+                    self._condition.wait(self.delay)
+                    if len(self.pending) == count:
+                        break
+                paths, self.pending = self.pending, set()
+            try:
+                self.apply(paths)
+            except Exception as e:
+                log_error(f"Hot reload failed: {e}")
+
+    def apply(self, paths: Iterable[str]) -> None:
+        paths = set(paths)
+        entries: Dict[str, RouteEntry] = {
+            route: entry for route, entry in route_manifest.entries.items() if entry.controller_path
+        }
+
+        added = [entry for route, entry in entries.items() if route not in router.controllers]
+        removed = [ctrl for route, ctrl in router.controllers.items() if route not in entries]
+
+        for route, ctrl in list(router.controllers.items()):
+            entry = entries.get(route)
+            if entry is None:
+                continue
+            ctrl.entry = entry
+            controller_path = entry.controller_path
+            if controller_path is not None and os.path.normpath(controller_path) in paths:
+                try:
+                    ctrl.reload()
+                    log_info(f"Reloaded controller for /{route}")
+                except Exception as e:
+                    log_error(f"Could not reload controller for /{route}, "
+                              f"keeping the previous version: {e}")
+
+        if added or removed:
+            self.update_rules(added, removed)
+
+        self.drop_templates(paths)
+
+    def update_rules(self, added: Iterable[RouteEntry],
+                     removed: Iterable["router.Controller"]) -> None:
+        app = self.app
+        for ctrl in removed:
+            router.controllers.pop(ctrl.entry.route, None)
+            log_info(f"Removed route {ctrl.entry.flask_route}")
+
+        for entry in added:
+            ctrl = router.controllers[entry.route] = router.Controller(entry)
+            if not router.LAZY_CONTROLLERS:
+                try:
+                    ctrl.load()
+                except Exception as e:
+                    log_error(f"Could not import controller for /{entry.route}: {e}")
+            app.view_functions[entry.endpoint] = router.create_route_handler(ctrl)
+            log_info(f"Added route {entry.flask_route}")
+
+        url_map = app.url_map
+        assert isinstance(url_map, RouteMap), "register_routes() installs the route map"
+        url_map.table = router.build_route_table(app)
+
+    def drop_templates(self, paths: Set[str]) -> None:
+        """Evicts compiled templates whose page.html or layout changed."""
+        cache = self.app.jinja_env.cache
+        if cache is None:
+            return
+
+        from core.engine import ROUTE_TEMPLATE_PREFIX, LAYOUT_TEMPLATE_PREFIX
+        routes_dir = os.path.normpath(route_manifest.routes_dir)
+        names = set()
+        # A layout applies to the whole subtree, and adding or removing one
+        # changes which layout the pages and layouts below it extend
+        subtrees = set()
+        for path in paths:
+            name = os.path.basename(path)
+            if name in (LAYOUT_FILE, "page.html") or not os.path.splitext(name)[1]:
+                directory = os.path.dirname(path) if name in (LAYOUT_FILE, "page.html") else path
+                route = os.path.relpath(directory, routes_dir)
+                route = "" if route == "." else route.replace("\\", "/")
+                if name == LAYOUT_FILE:
+                    subtrees.add(route)
+                else:
+                    names.add(ROUTE_TEMPLATE_PREFIX + route)
+
+        def in_subtree(key: str) -> bool:
+            for prefix in (ROUTE_TEMPLATE_PREFIX, LAYOUT_TEMPLATE_PREFIX):
+                if key.startswith(prefix):
+                    route = key[len(prefix):]
+                    return any(not d or route == d or route.startswith(d + "/") for d in subtrees)
+            return False
+
+        for key in list(cache.keys()):
+            if key[1] in names or subtrees and in_subtree(key[1]):
+                try:
+                    del cache[key]
+                except KeyError:
+                    pass
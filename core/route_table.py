@@ -0,0 +1,343 @@
+"""Route table for the routes/ tree, matched segment by segment.
+
+Route directories are inserted into a tree keyed by path segment, so
+matching a request walks one node per segment of its path: the cost
+depends on the depth of the URL, not on how many routes exist.
+
+Directory names select the segment type:
+
+    user/profile        static segment
+    user/[id]           any non-empty segment, passed as a string
+    user/[id:int]       digits only, passed as an int
+    files/[key:uuid]    a UUID, passed as uuid.UUID
+    docs/[...rest]      one or more remaining segments, e.g. "a/b/c"
+
+At every node a static child is tried before typed parameters (int, then
+uuid, then untyped), and a catch-all comes last; if a branch does not lead
+to a route, the next candidate is tried. Two parameters of the same type
+at the same position must share a name, since either could match.
+"""
+import re
+import uuid
+from urllib.parse import quote, urlencode
+from werkzeug.exceptions import MethodNotAllowed, NotFound
+from werkzeug.routing import BuildError, Map, MapAdapter, Rule
+from typing import Any, Callable, Dict, Iterator, List, Mapping, Optional, Tuple, cast
+
+_UUID_RE = re.compile(
+    r"^[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}$"
+)
+
+
+def _to_int(value: str) -> int:
+    if not (value.isascii() and value.isdigit()):
+        raise ValueError(value)
+    return int(value)
+
+
+def _to_uuid(value: str) -> uuid.UUID:
+    if _UUID_RE.match(value) is None:
+        raise ValueError(value)
+    return uuid.UUID(value)
+
+
+# Segment type -> (precedence, converter, werkzeug converter name)
+CONVERTERS: Dict[str, Tuple[int, Callable[[str], Any], str]] = {
+    "int": (0, _to_int, "int"),
+    "uuid": (1, _to_uuid, "uuid"),
+    "str": (2, str, "string"),
+}
+
+STATIC, PARAM, CATCH_ALL = "static", "param", "catch_all"
+
+
+def parse_segment(segment: str) -> Tuple[str, str, Optional[str]]:
+    """Splits a directory name into (kind, name or text, segment type)."""
+    if not (segment.startswith("[") and segment.endswith("]")):
+        return STATIC, segment, None
+    inner = segment[1:-1]
+    if inner.startswith("..."):
+        name = inner[3:]
+        if not name.isidentifier():
+            raise ValueError(f"Invalid catch-all segment {segment}")
+        return CATCH_ALL, name, None
+    name, _, kind = inner.partition(":")
+    kind = kind or "str"
+    if not name.isidentifier():
+        raise ValueError(f"Invalid parameter name in {segment}")
+    if kind not in CONVERTERS:
+        raise ValueError(f"Unknown segment type {kind!r} in {segment}, "
+                         f"use one of {', '.join(CONVERTERS)}")
+    return PARAM, name, kind
+
+
+def rule_segment(segment: str) -> str:
+    """The werkzeug rule syntax for a directory name, e.g. "[id:int]" -> "<int:id>"."""
+    kind, name, converter = parse_segment(segment)
+    if kind == CATCH_ALL:
+        return f"<path:{name}>"
+    if kind == PARAM and converter is not None:
+        return f"<{name}>" if converter == "str" else f"<{CONVERTERS[converter][2]}:{name}>"
+    return segment
+
+
+class TableRoute:
+    """A route in the table and the werkzeug Rule reported for it (request.url_rule)."""
+
+    __slots__ = ("route", "segments", "rule")
+
+    def __init__(self, route: str, rule: Rule) -> None:
+        self.route = route
+        self.segments = [parse_segment(segment) for segment in route.split("/")] if route else []
+        self.rule = rule
+
+    def build(self, values: Mapping[str, Any]) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """Returns the path for the given values and the values it did not use."""
+        unused = dict(values)
+        parts = []
+        for kind, name, _ in self.segments:
+            if kind == STATIC:
+                parts.append(quote(name))
+                continue
+            if name not in unused:
+                return None
+            value = str(unused.pop(name))
+            parts.append(quote(value, safe="/" if kind == CATCH_ALL else ""))
+        return "/" + "/".join(parts), unused
+
+
+class _Param:
+    __slots__ = ("precedence", "convert", "kind", "name", "node")
+
+    def __init__(self, kind: str, name: str) -> None:
+        self.precedence, self.convert, _ = CONVERTERS[kind]
+        self.kind = kind
+        self.name = name
+        self.node = _Node()
+
+
+class _Node:
+    __slots__ = ("static", "params", "catch_all", "route")
+
+    def __init__(self) -> None:
+        self.static: Dict[str, "_Node"] = {}
+        self.params: List[_Param] = []
+        self.catch_all: Optional[Tuple[str, TableRoute]] = None
+        self.route: Optional[TableRoute] = None
+
+
+class RouteTable:
+    """Routes keyed by path segment; see the module docstring for the precedence rules."""
+
+    def __init__(self) -> None:
+        self.root = _Node()
+        self.by_endpoint: Dict[str, TableRoute] = {}
+
+    def __len__(self) -> int:
+        return len(self.by_endpoint)
+
+    def add(self, route: str, rule: Rule) -> TableRoute:
+        """Inserts a route directory such as "user/[id:int]". Raises ValueError if it
+        is invalid or could match the same URLs as a route already in the table."""
+        target = TableRoute(route, rule)
+        node = self.root
+        for i, (kind, name, converter) in enumerate(target.segments):
+            if kind == CATCH_ALL:
+                if i != len(target.segments) - 1:
+                    raise ValueError(f"[...{name}] must be the last segment of /{route}")
+                if node.catch_all is not None:
+                    raise ValueError(f"/{route} conflicts with /{node.catch_all[1].route}")
+                node.catch_all = (name, target)
+                break
+            if kind == STATIC:
+                node = node.static.setdefault(name, _Node())
+                continue
+            param = next((p for p in node.params if p.kind == converter), None)
+            if param is None:
+                param = _Param(converter or "str", name)
+                node.params.append(param)
+                node.params.sort(key=lambda p: p.precedence)
+            elif param.name != name:
+                raise ValueError(f"[{name}] in /{route} matches the same segments as "
+                                 f"[{param.name}], use the same name")
+            node = param.node
+        else:
+            if node.route is not None:
+                raise ValueError(f"/{route} is already registered")
+            node.route = target
+        self.by_endpoint[rule.endpoint] = target
+        return target
+
+    def match(self, path: str) -> Optional[Tuple[TableRoute, Dict[str, Any]]]:
+        """Finds the route for a path such as "/user/42" and its converted parameters."""
+        segments = path[1:].split("/") if path != "/" else []
+        params: Dict[str, Any] = {}
+        target = self._match(self.root, segments, 0, params)
+        return (target, params) if target is not None else None
+
+    def _match(self, node: _Node, segments: List[str], i: int,
+               params: Dict[str, Any]) -> Optional[TableRoute]:
+        if i == len(segments):
+            return node.route
+        segment = segments[i]
+        child = node.static.get(segment)
+        if child is not None:
+            target = self._match(child, segments, i + 1, params)
+            if target is not None:
+                return target
+        if segment:
+            for param in node.params:
+                try:
+                    value = param.convert(segment)
+                except ValueError:
+                    continue
+                target = self._match(param.node, segments, i + 1, params)
+                if target is not None:
+                    params[param.name] = value
+                    return target
+            if node.catch_all is not None:
+                name, target = node.catch_all
+                params[name] = "/".join(segments[i:])
+                return target
+        return None
+
+    def rules(self) -> Iterator[Rule]:
+        for target in self.by_endpoint.values():
+            yield target.rule
+
+
+# Returns (rule, view args) for a path, or None
+Resolver = Callable[[str], Optional[Tuple[Rule, Dict[str, Any]]]]
+
+
+class RouteMap(Map):
+    """A werkzeug Map that also dispatches through a RouteTable.
+
+    Precedence: the map's own static rules (the app's @app.route views
+    without variables, found by a dict lookup), then the resolvers, then the
+    table, then everything else werkzeug matches - e.g. Flask's static
+    /static/<path:filename>, which therefore only matches when no route
+    does. The table is replaced as a whole (see core.reloader), so a request
+    always sees one consistent set of routes.
+    """
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        # Set before super().__init__, which adds the rules passed to it
+        self.static_rules: Dict[str, List[Rule]] = {}
+        super().__init__(*args, **kwargs)
+        self.table = RouteTable()
+        self.resolvers: List[Resolver] = []
+
+    def add(self, rulefactory: Any) -> None:
+        super().add(rulefactory)
+        for rules in self._rules_by_endpoint.values():
+            for rule in rules:
+                if (not rule.arguments and not rule.build_only and not rule.defaults
+                        and rule.redirect_to is None and not rule.websocket and not rule.host
+                        and not self.host_matching and not rule.subdomain):
+                    same_path = self.static_rules.setdefault(rule.rule, [])
+                    if rule not in same_path:
+                        same_path.append(rule)
+
+    @classmethod
+    def from_map(cls, old_map: Map) -> "RouteMap":
+        """Copies the settings and rules of an existing map."""
+        new_map = cls(
+            host_matching=old_map.host_matching,
+            strict_slashes=old_map.strict_slashes,
+            merge_slashes=old_map.merge_slashes,
+            redirect_defaults=old_map.redirect_defaults,
+            sort_parameters=old_map.sort_parameters,
+            sort_key=old_map.sort_key,
+        )
+        new_map.converters = old_map.converters
+        new_map.default_subdomain = old_map.default_subdomain
+        for rule in old_map.iter_rules():
+            copy = rule.empty()
+            # Set by Flask on the rules it creates, not declared by werkzeug's Rule
+            setattr(copy, "provide_automatic_options",
+                    getattr(rule, "provide_automatic_options", False))
+            new_map.add(copy)
+        return new_map
+
+    def resolve(self, path: str) -> Optional[Tuple[Rule, Dict[str, Any]]]:
+        for resolver in self.resolvers:
+            found = resolver(path)
+            if found is not None:
+                return found
+        target = self.table.match(path)
+        if target is not None:
+            return target[0].rule, target[1]
+        return None
+
+    def iter_rules(self, endpoint: Optional[Any] = None) -> Iterator[Rule]:
+        table = self.table
+        if endpoint is not None and endpoint in table.by_endpoint:
+            return iter([table.by_endpoint[endpoint].rule])
+        rules = super().iter_rules(endpoint)
+        if endpoint is not None:
+            return rules
+        return iter(list(rules) + list(table.rules()))
+
+    def _adapter(self, adapter: MapAdapter) -> "RouteMapAdapter":
+        return RouteMapAdapter(self, adapter.server_name, adapter.script_name, adapter.subdomain,
+                               adapter.url_scheme, adapter.path_info, adapter.default_method,
+                               adapter.query_args)
+
+    def bind(self, *args: Any, **kwargs: Any) -> "RouteMapAdapter":
+        return self._adapter(super().bind(*args, **kwargs))
+
+    def bind_to_environ(self, *args: Any, **kwargs: Any) -> "RouteMapAdapter":
+        # Map.bind_to_environ calls Map.bind directly, not self.bind
+        return self._adapter(super().bind_to_environ(*args, **kwargs))
+
+
+class RouteMapAdapter(MapAdapter):
+    map: RouteMap
+
+    def match(self, path_info: Optional[str] = None, method: Optional[str] = None,
+              return_rule: bool = False, query_args: Any = None,
+              websocket: Optional[bool] = None) -> Tuple[Any, Mapping[str, Any]]:
+        path = path_info if path_info is not None else self.path_info
+        path = f"/{path.lstrip('/')}" if path else "/"
+        request_method = (method or self.default_method).upper()
+        for rule in self.map.static_rules.get(path, ()):
+            if (rule.methods is None or request_method in rule.methods) and not self.subdomain:
+                return (rule if return_rule else rule.endpoint), {}
+
+        found = self.map.resolve(path)
+        if found is not None:
+            rule, args = found
+            if rule.methods is not None and request_method not in rule.methods:
+                raise MethodNotAllowed(valid_methods=sorted(rule.methods))
+            return (rule if return_rule else rule.endpoint), args
+
+        try:
+            matched, values = super().match(path_info, method, True, query_args, websocket)
+        except NotFound:
+            raise NotFound() from None
+        # return_rule=True above
+        rule = cast(Rule, matched)
+        return (rule if return_rule else rule.endpoint), values
+
+    def build(self, endpoint: Any, values: Optional[Mapping[str, Any]] = None,
+              method: Optional[str] = None, force_external: bool = False,
+              append_unknown: bool = True, url_scheme: Optional[str] = None) -> str:
+        target = self.map.table.by_endpoint.get(endpoint)
+        if target is None:
+            return super().build(
+                endpoint, values, method, force_external, append_unknown, url_scheme
+            )
+
+        values = {k: v for k, v in (values or {}).items() if v is not None}
+        built = target.build(values)
+        if built is None:
+            raise BuildError(endpoint, values, method, self)
+        path, unused = built
+        if unused and append_unknown:
+            path = f"{path}?{urlencode(sorted(unused.items()), doseq=True)}"
+        if not force_external:
+            return f"{self.script_name.rstrip('/')}{path}"
+        scheme = url_scheme or self.url_scheme
+        host = self.get_host(self.subdomain)
+        return f"{scheme + ':' if scheme else ''}//{host}{self.script_name.rstrip('/')}{path}"
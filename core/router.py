@@ -1,65 +1,219 @@
 import os
+import atexit
+import inspect
+import threading
 import importlib.util
+from types import ModuleType
 from flask import Flask, request, jsonify, render_template
 from core.middleware import auth_middleware, auth_required
-from core.logger import log_request, log_error
-from typing import Optional, Any, Dict
+from core.logger import log_error
+from core.manifest import route_manifest, RouteEntry, ROUTE_MANIFEST_FILE
+from core.metrics import phase_timer
+from core.async_runner import run_async
+from core.assets import serve_asset, ASSET_FILES
+from core.output_cache import output_cache, cache_policy, route_version
+from core.route_table import RouteMap, RouteTable
+from werkzeug.routing import Rule
+from typing import Optional, Any, Callable, Dict, List, Tuple
 
 ROUTES_DIR: str = "routes"
+# Import each controller.py on the first request to its route instead of at startup
+LAZY_CONTROLLERS: bool = os.getenv("LAZY_CONTROLLERS", "False").lower() == "true"
+# Number of most requested routes (or a comma separated list of routes) to preload in the background
+WARMUP_ROUTES: str = os.getenv("WARMUP_ROUTES", "")
+
+controllers: Dict[str, "Controller"] = {}
+
+# Reported as request.url_rule for route assets
+ASSET_RULE = Rule("/<path:route_path>/<filename>", endpoint="route_asset", methods=["GET"])
+
+
+class Controller:
+    """A route's controller module, imported once.
+
+    The first thread to call load() imports the module while other threads
+    for the same route wait on the lock; afterwards load() is lock-free.
+    A failed import is retried by the next request.
+    """
+
+    __slots__ = ("entry", "module", "mtime", "hits", "_lock")
+
+    def __init__(self, entry: RouteEntry) -> None:
+        self.entry = entry
+        self.module: Optional[ModuleType] = None
+        # controller.py's mtime when it was imported, part of the output cache version
+        self.mtime: Optional[float] = None
+        self.hits = 0
+        self._lock = threading.Lock()
+
+    def _import(self) -> ModuleType:
+        path = self.entry.controller_path
+        if path is None:
+            raise ImportError(f"/{self.entry.route} has no controller.py")
+        mtime = os.stat(path).st_mtime
+        spec = importlib.util.spec_from_file_location(self.entry.module_name, path)
+        if spec is None or spec.loader is None:
+            raise ImportError(f"Cannot import {path}")
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        self.mtime = mtime
+        return module
+
+    def load(self) -> ModuleType:
+        module = self.module
+        if module is None:
+            with self._lock:
+                if self.module is None:
+                    self.module = self._import()
+                module = self.module
+        return module
+
+    def reload(self) -> None:
+        """Re-imports a changed controller.py. Requests already running keep the
+        module they started with; if the new code fails to import, the old
+        module stays in place and the error is raised."""
+        with self._lock:
+            if self.module is not None:
+                self.module = self._import()
+
+
+def call_handler(mod: ModuleType, kwargs: Dict[str, Any]) -> Any:
+    """Runs a controller's handler, sync or async."""
+    with phase_timer("handler"):
+        response = mod.handler(request, **kwargs)
+        if inspect.isawaitable(response):
+            response = run_async(response)
+    return response
+
+
+def create_route_handler(ctrl: Controller) -> Callable:
+    """Creates the view function for a route's controller."""
+    r_path = ctrl.entry.flask_route
+
+    @auth_required(route=r_path)
+    def handler(*args: Any, **kwargs: Any) -> Any:
+        ctrl.hits += 1
+        try:
+            mod = ctrl.load()
+            cache = output_cache
+            policy = cache_policy(mod) if cache is not None else None
+            if cache is None or policy is None:
+                response = call_handler(mod, kwargs)
+            else:
+                response = cache.serve(
+                    policy, route_version(ctrl.mtime, ctrl.entry.route), kwargs,
+                    lambda: call_handler(ctrl.load(), kwargs)
+                )
+            return response
+        except Exception as e:
+            log_error(e)
+            return jsonify({"error": "Internal Server Error"}), 500
+
+    handler.__name__ = f"handle_{ctrl.entry.endpoint}"
+    return handler
+
 
 def register_routes(app: Flask) -> None:
     """Dynamically registers routes based on folder structure."""
-    route_functions: Dict[str, Any] = {}  
-    
-    for root, dirs, files in os.walk(ROUTES_DIR):
-        if "controller.py" not in files:
+    route_manifest.ensure_built()
+
+    for entry in list(route_manifest.entries.values()):
+        if entry.controller_path is None:
             continue
-            
-        rel_path: str = root.replace("\\", "/").replace(ROUTES_DIR, "").strip("/")
-        route_path: str = f"/{rel_path}" if rel_path else "/"
-        
-        flask_route: str = route_path
-        if "[" in flask_route:
-            segments = flask_route.split("/")
-            for i, segment in enumerate(segments):
-                if segment.startswith("[") and segment.endswith("]"):
-                    param_name = segment[1:-1]
-                    segments[i] = f"<{param_name}>"
-            flask_route = "/".join(segments)
-            
-        module_name: str = rel_path.replace("/", ".") if rel_path else "index"
-        module_path: str = os.path.join(root, "controller.py")
-        
-        spec = importlib.util.spec_from_file_location(module_name, module_path)
-        module = importlib.util.module_from_spec(spec)
-        spec.loader.exec_module(module)
-        endpoint_name = f"route_{rel_path.replace('/', '_').replace('[', '').replace(']', '')}"
-        if not endpoint_name or endpoint_name == "route_":
-            endpoint_name = "route_index"
-            
-        def create_route_handler(mod, r_path):
-            @auth_required
-            def handler(*args, **kwargs):
-                try:
-                    response = mod.handler(request, **kwargs)
-                    log_request(r_path, request.method, 200)
-                    return response
-                except Exception as e:
-                    log_error(e)
-                    return jsonify({"error": "Internal Server Error"}), 500
-            
-            handler.__name__ = f"handle_{endpoint_name}"
-            return handler
-        
-        route_functions[flask_route] = (create_route_handler(module, flask_route), endpoint_name)
-    
-    for flask_route, (handler_func, endpoint) in route_functions.items():
-        app.route(flask_route, methods=["GET", "POST"], endpoint=endpoint)(handler_func)
-        
-    @app.route('/<path:route_path>/<filename>')
-    def serve_route_static(route_path, filename):
-        if filename in ['script.js', 'styles.css']:
-            route_dir = os.path.join(ROUTES_DIR, route_path)
-            if os.path.exists(os.path.join(route_dir, filename)):
-                return app.send_static_file(os.path.join(route_path, filename))
-        return "", 404
\ No newline at end of file
+
+        controller = controllers[entry.route] = Controller(entry)
+        if not LAZY_CONTROLLERS:
+            controller.load()
+
+        app.view_functions[entry.endpoint] = create_route_handler(controller)
+
+    app.view_functions[ASSET_RULE.endpoint] = serve_route_asset
+    route_map = RouteMap.from_map(app.url_map)
+    route_map.resolvers.append(match_asset)
+    route_map.table = build_route_table(app)
+    app.url_map = route_map
+
+    if ROUTE_MANIFEST_FILE:
+        atexit.register(save_route_hits)
+    if WARMUP_ROUTES:
+        warm_up(app, WARMUP_ROUTES)
+
+
+def build_route_table(app: Flask) -> RouteTable:
+    """Builds the route table for the current controllers. A route that is invalid or
+    ambiguous with another one is logged and left out."""
+    table = RouteTable()
+    for route in sorted(controllers):
+        entry = controllers[route].entry
+        rule = app.url_rule_class(
+            entry.flask_route, methods=["GET", "POST", "OPTIONS"], endpoint=entry.endpoint
+        )
+        # Flask's own attribute for answering OPTIONS, not declared by werkzeug's Rule
+        setattr(rule, "provide_automatic_options", True)
+        try:
+            table.add(route, rule)
+        except ValueError as e:
+            log_error(f"Route /{route} was not registered: {e}")
+    return table
+
+
+def match_asset(path: str) -> Optional[Tuple[Rule, Dict[str, Any]]]:
+    """Route table resolver for /<route>/styles.css and /<route>/script.js. Checked before the
+    routes, so an asset URL is never taken by a dynamic segment such as [id]."""
+    route, _, filename = path.rpartition("/")
+    if filename not in ASSET_FILES:
+        return None
+    route = route.strip("/")
+    entry = route_manifest.get(route)
+    if entry is None or (entry.style_url if filename == "styles.css" else entry.script_url) is None:
+        return None
+    return ASSET_RULE, {"route_path": route, "filename": filename}
+
+
+def serve_route_asset(route_path: str, filename: str) -> Any:
+    response = serve_asset(route_path, filename)
+    if response is not None:
+        return response
+    return "", 404
+
+
+def warmup_targets(spec: str) -> List[Controller]:
+    """Resolves WARMUP_ROUTES: a number picks the routes requested most in previous
+    runs (per the manifest file), otherwise a comma separated list of routes."""
+    spec = spec.strip()
+    entries: List[Optional[RouteEntry]]
+    if spec.isdigit():
+        entries = list(route_manifest.popular(int(spec)))
+    else:
+        entries = [route_manifest.get(route.strip().strip("/")) for route in spec.split(",")]
+    return [
+        controllers[entry.route] for entry in entries
+        if entry is not None and entry.route in controllers
+    ]
+
+
+def warm_up(app: Flask, spec: str) -> threading.Thread:
+    """Imports controllers and compiles page templates for the selected routes in the background."""
+    from core.engine import ROUTE_TEMPLATE_PREFIX
+
+    def run() -> None:
+        for controller in warmup_targets(spec):
+            try:
+                controller.load()
+                if controller.entry.template_path is not None:
+                    app.jinja_env.get_template(ROUTE_TEMPLATE_PREFIX + controller.entry.route)
+            except Exception as e:
+                log_error(f"Warm-up failed for /{controller.entry.route}: {e}")
+
+    thread = threading.Thread(target=run, name="route-warmup", daemon=True)
+    thread.start()
+    return thread
+
+
+def save_route_hits() -> None:
+    """Adds this process's request counts to the manifest file, for WARMUP_ROUTES."""
+    counts = {route: controller.hits for route, controller in controllers.items()}
+    try:
+        route_manifest.save_hits(ROUTE_MANIFEST_FILE, counts)
+    except OSError:
+        pass
@@ -0,0 +1,248 @@
+"""Pre-fork production server: `python main.py --workers N`.
+
+The master process imports the app, binds the listening socket and forks N
+workers that each run a threaded WSGI server on that socket, so the kernel
+spreads connections across processes. The master only supervises:
+
+- a worker that exits unexpectedly is replaced (with a delay if it keeps
+  crashing right after start),
+- SIGTERM/SIGINT stop accepting, let in-flight requests finish for up to
+  SERVER_GRACEFUL_TIMEOUT seconds and then kill what is left,
+- SIGHUP replaces the workers with fresh forks of the master, one at a
+  time, e.g. to release memory the workers have built up. The next worker is
+  stopped only once the previous one's replacement is up, so the others keep
+  serving meanwhile. The new workers run the code the master imported at
+  startup, so code changes need a full restart.
+
+Workers inherit the master's log session and its log file handle, which is
+opened in append mode, so all processes write one session log. Metrics are
+merged through snapshot files in a temporary directory (see core.metrics).
+Unix only.
+"""
+import os
+import shutil
+import signal
+import socket
+import sys
+import tempfile
+import threading
+import time
+from flask import Flask
+from werkzeug.wsgi import ClosingIterator
+from typing import Any, Callable, Dict, Iterable, List, Optional
+from core.logger import log_info, log_warning, log_error, SESSION_ID
+from core.metrics import retire_process
+
+SERVER_GRACEFUL_TIMEOUT: float = float(os.getenv("SERVER_GRACEFUL_TIMEOUT", 30))
+SERVER_BACKLOG: int = int(os.getenv("SERVER_BACKLOG", 2048))
+# A worker that dies sooner than this after starting is restarted with a delay
+MIN_WORKER_UPTIME: float = 1.0
+MAX_RESTART_DELAY: float = 30.0
+
+
+class InFlightCounter:
+    """WSGI middleware counting requests that have not finished yet."""
+
+    def __init__(self, app: Callable) -> None:
+        self.app = app
+        self.active = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, environ: Dict[str, Any], start_response: Callable) -> Iterable[bytes]:
+        with self._lock:
+            self.active += 1
+        try:
+            iterable = self.app(environ, start_response)
+        except BaseException:
+            self.finished()
+            raise
+        # Counts the request as finished once the server has sent and closed the body
+        return ClosingIterator(iterable, self.finished)
+
+    def finished(self) -> None:
+        with self._lock:
+            self.active -= 1
+
+
+def run_worker(app: Flask, listener: socket.socket, worker_id: int) -> None:
+    """Serves requests on the inherited socket until SIGTERM/SIGINT."""
+    from werkzeug.serving import make_server
+
+    os.environ["ROUTER_WORKER_ID"] = str(worker_id)
+    counter = InFlightCounter(app.wsgi_app)
+    setattr(app, "wsgi_app", counter)
+    server = make_server(listener.getsockname()[0], listener.getsockname()[1], app,
+                         threaded=True, fd=listener.fileno())
+    listener.close()
+
+    def stop(signum: int, frame: Any) -> None:
+        # shutdown() waits for serve_forever to return, so it can't run on this thread
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGHUP, signal.SIG_DFL)
+
+    log_info(f"Worker {worker_id} started (pid {os.getpid()})")
+    server.serve_forever()
+
+    deadline = time.monotonic() + SERVER_GRACEFUL_TIMEOUT
+    while counter.active and time.monotonic() < deadline:
+        time.sleep(0.05)
+    log_info(f"Worker {worker_id} stopped (pid {os.getpid()})")
+
+
+class Master:
+    def __init__(self, app: Flask, host: str, port: int, workers: int) -> None:
+        self.app = app
+        self.host = host
+        self.port = port
+        self.size = workers
+        self.listener: Optional[socket.socket] = None
+        self.workers: Dict[int, int] = {}        # pid -> worker id
+        self.started: Dict[int, float] = {}      # worker id -> start time
+        self.delays: Dict[int, float] = {}       # worker id -> next restart delay
+        self.scheduled: Dict[int, float] = {}    # worker id -> time to restart at
+        self.stopping = False
+        self.reload_requested = False
+        self.reload_pending: List[int] = []      # pids still to replace on SIGHUP
+        self.replacing: Optional[int] = None     # pid of the worker being replaced
+        self.replacing_id = 0
+        self.metrics_dir = ""
+
+    def spawn(self, worker_id: int) -> None:
+        listener = self.listener
+        assert listener is not None, "spawn() before run() bound the socket"
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                run_worker(self.app, listener, worker_id)
+            except BaseException as e:
+                log_error(f"Worker {worker_id} failed: {e}")
+                code = 1
+            finally:
+                # atexit hooks flush the log queue and close files
+                sys.exit(code)
+        self.workers[pid] = worker_id
+        self.started[worker_id] = time.monotonic()
+
+    def reap(self) -> None:
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            worker_id = self.workers.pop(pid, None)
+            retire_process(self.metrics_dir, pid)
+            if worker_id is None or self.stopping:
+                continue
+
+            code = os.waitstatus_to_exitcode(status)
+            uptime = time.monotonic() - self.started.get(worker_id, 0)
+            if uptime < MIN_WORKER_UPTIME and pid != self.replacing:
+                delay = min(self.delays.get(worker_id, 0.5) * 2, MAX_RESTART_DELAY)
+            else:
+                delay = 0.0
+            self.delays[worker_id] = delay or 0.5
+            if code != 0:
+                log_warning(f"Worker {worker_id} (pid {pid}) exited with {code}, restarting"
+                            + (f" in {delay:.1f}s" if delay else ""))
+            self.scheduled[worker_id] = time.monotonic() + delay
+
+    def handle_stop(self, signum: int, frame: Any) -> None:
+        self.stopping = True
+
+    def handle_reload(self, signum: int, frame: Any) -> None:
+        self.reload_requested = True
+
+    def run(self) -> None:
+        self.listener = socket.create_server((self.host, self.port), backlog=SERVER_BACKLOG)
+        # Idle workers must not block in accept() when another one took the connection
+        self.listener.setblocking(False)
+        os.environ["ROUTER_SESSION_ID"] = SESSION_ID
+        # Workers write their metrics here so that a scrape of any worker sees all of them
+        self.metrics_dir = tempfile.mkdtemp(prefix="router-metrics-")
+        os.environ["ROUTER_METRICS_DIR"] = self.metrics_dir
+
+        signal.signal(signal.SIGTERM, self.handle_stop)
+        signal.signal(signal.SIGINT, self.handle_stop)
+        signal.signal(signal.SIGHUP, self.handle_reload)
+
+        log_info(
+            f"Starting {self.size} workers on {self.host}:{self.port} (master pid {os.getpid()})"
+        )
+        for worker_id in range(self.size):
+            self.spawn(worker_id)
+
+        while not self.stopping:
+            if self.reload_requested:
+                log_info("Reloading workers one at a time")
+                self.reload_pending = list(self.workers)
+                self.reload_requested = False
+            self.reap()
+            now = time.monotonic()
+            for worker_id, due in list(self.scheduled.items()):
+                if due <= now and not self.stopping:
+                    del self.scheduled[worker_id]
+                    self.spawn(worker_id)
+            self.roll()
+            time.sleep(0.1)
+
+        self.shutdown()
+
+    def roll(self) -> None:
+        """Stops the next worker of a reload once the previous one has been replaced."""
+        if self.replacing is not None:
+            if self.replacing in self.workers:
+                return
+            # Waits for the new worker of the same id to come up
+            worker_id = self.replacing_id
+            if worker_id in self.scheduled or worker_id not in self.workers.values():
+                return
+            if time.monotonic() - self.started[worker_id] < MIN_WORKER_UPTIME:
+                return
+            self.replacing = None
+        while self.reload_pending:
+            pid = self.reload_pending.pop(0)
+            if pid in self.workers:
+                self.replacing = pid
+                self.replacing_id = self.workers[pid]
+                try:
+                    os.kill(pid, signal.SIGTERM)
+                except ProcessLookupError:
+                    pass
+                return
+
+    def signal_workers(self, signum: int) -> None:
+        for pid in list(self.workers):
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass
+
+    def shutdown(self) -> None:
+        log_info("Stopping workers")
+        self.signal_workers(signal.SIGTERM)
+        deadline = time.monotonic() + SERVER_GRACEFUL_TIMEOUT + 1
+        while self.workers and time.monotonic() < deadline:
+            self.reap()
+            time.sleep(0.05)
+        if self.workers:
+            log_warning(f"Killing {len(self.workers)} worker(s) that did not stop in time")
+            self.signal_workers(signal.SIGKILL)
+            while self.workers:
+                pid, _ = os.waitpid(-1, 0)
+                self.workers.pop(pid, None)
+        if self.listener is not None:
+            self.listener.close()
+        shutil.rmtree(self.metrics_dir, ignore_errors=True)
+
+
+def serve(app: Flask, host: str, port: int, workers: int) -> None:
+    """Runs the app in `workers` pre-forked processes until stopped."""
+    if not hasattr(os, "fork"):
+        raise RuntimeError("--workers needs os.fork and is not available on this platform")
+    Master(app, host, port, max(1, workers)).run()
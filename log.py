@@ -1,13 +1,22 @@
 import os
 import sys
 import time
-import json
 import logging
 import datetime
+import threading
 from pathlib import Path
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
-from flask import Flask, render_template, jsonify, request, Response, send_from_directory
+from flask import Flask, render_template, jsonify, request, Response, send_from_directory, abort
+from core.log_format import parse_line
+from core.log_rotation import is_archive, parse_log_name, session_name
+from logserver.broadcast import LogBroadcaster
+from logserver.search_index import SearchIndex, parse_timestamp
+from logserver.segments import SegmentStore
+from logserver.ingest import LogIngestServer
+from logserver.stats import LogStats
+from logserver.tailer import LogTailer
+from logserver.pagination import forget as forget_line_index, DEFAULT_PAGE_SIZE
 
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(message)s')
@@ -29,160 +38,148 @@ log_server = Flask(__name__,
                   template_folder=str(TEMPLATES_DIR)) 
 print("Hello")
 print(log_server.static_folder)
-clients = []
+
+# Sessions are split into rotated (and compressed) segments, see core/log_rotation.py
+segment_store = SegmentStore(
+    str(LOGS_DIR),
+    cache_bytes=int(os.getenv("LOG_SEGMENT_CACHE_BYTES", 256 * 1024 * 1024)),
+)
+search_index = SearchIndex(str(LOGS_DIR), segments=segment_store)
+# Rolling per-minute and per-hour counts behind /api/stats, see logserver/stats.py
+log_stats = LogStats()
+
+broadcaster = LogBroadcaster(
+    capacity=int(os.getenv("LOG_STREAM_BUFFER", 2048)),
+    max_backlog=int(os.getenv("LOG_STREAM_MAX_BACKLOG", 1024)),
+    heartbeat=float(os.getenv("LOG_STREAM_HEARTBEAT", 15)),
+    batch_window=float(os.getenv("LOG_STREAM_BATCH_WINDOW", 0.05)),
+    batch_size=int(os.getenv("LOG_STREAM_BATCH_SIZE", 1000)),
+)
 
 class LogFileHandler(FileSystemEventHandler):
     def __init__(self):
-        self.last_position = {}
+        # Keeps one handle per log file and passes on complete lines only, see logserver/tailer.py
+        self.tailer = LogTailer(self._process_and_broadcast, on_read=search_index.schedule)
         self.active_logs = {}
         
     def on_modified(self, event):
         if not event.is_directory and event.src_path.endswith('.log'):
-            log_file = event.src_path
-            
-            if log_file not in self.last_position:
-                self.last_position[log_file] = 0
-                
-            try:
-                with open(log_file, 'r', encoding='utf-8') as f:
-                   
-                    f.seek(self.last_position[log_file])
-                    
-                    
-                    new_content = f.read()
-                    
-                    if new_content:
-                        
-                        self.last_position[log_file] = f.tell()
-                        
-        
-                        self._process_and_broadcast(log_file, new_content)
-            except Exception as e:
-                logging.error(f"Error reading log file {log_file}: {str(e)}")
+            self.tailer.notify(event.src_path)
     
-    def _process_and_broadcast(self, log_file, content):
-        """Process log content and broadcast to clients"""
-        log_name = os.path.basename(log_file)
+    def on_deleted(self, event):
+        name = os.path.basename(event.src_path)
+        if not event.is_directory and parse_log_name(name):
+            self.tailer.forget(event.src_path)
+            forget_line_index(event.src_path)
+            if is_archive(name):
+                segment_store.forget(name)
+            search_index.schedule(event.src_path)
+
+    def on_moved(self, event):
+        if event.is_directory:
+            return
+        src_name = os.path.basename(event.src_path)
+        dest_name = os.path.basename(event.dest_path)
+        if src_name.endswith('.log') and dest_name.endswith('.log'):
+            # Rotation: keep tailing the renamed file to pick up its last lines
+            forget_line_index(event.src_path)
+            search_index.rename(src_name, dest_name)
+            self.tailer.rename(event.src_path, event.dest_path)
+            return
+        self.on_deleted(event)
+        if is_archive(dest_name) and parse_log_name(dest_name):
+            # A segment was compressed; its lines are already indexed under the uncompressed name
+            search_index.rename(os.path.splitext(dest_name)[0], dest_name)
+            search_index.schedule(event.dest_path)
+        elif dest_name.endswith('.log'):
+            search_index.schedule(event.dest_path)
+
+    def _process_and_broadcast(self, log_file, lines):
+        """Process new log lines and broadcast to clients"""
+        log_name = session_name(os.path.basename(log_file))
         
         
         entries = []
-        for line in content.splitlines():
+        for line in lines:
             if not line.strip():
                 continue
                 
-            entry = {"raw": line, "file": log_name}
-            
-           
-            timestamp_match = line[:19] if len(line) >= 19 else None
-            if timestamp_match:
-                entry["timestamp"] = timestamp_match
-            
-            if " - [INFO] - " in line:
-                entry["level"] = "info"
-                entry["message"] = line.split(" - [INFO] - ", 1)[1]
-            elif " - [ERROR] - " in line:
-                entry["level"] = "error"
-                entry["message"] = line.split(" - [ERROR] - ", 1)[1]
-            elif " - [WARNING] - " in line:
-                entry["level"] = "warning"
-                entry["message"] = line.split(" - [WARNING] - ", 1)[1]
-            elif " - [DEBUG] - " in line:
-                entry["level"] = "debug"
-                entry["message"] = line.split(" - [DEBUG] - ", 1)[1]
-            else:
-                entry["level"] = "none"
-                entry["message"] = line
-            
-            entries.append(entry)
+            entries.append(parse_line(line, log_name))
         
         if entries:
-           
+            log_stats.add_entries(entries)
             self._send_to_clients(entries)
     
     def _send_to_clients(self, entries):
-        """Send log entries to all connected clients"""
-       
-        data = json.dumps(entries)
-        message = f"data: {data}\n\n"
-        
-       
-        for client in list(clients):
-            try:
-                client.put(message)
-            except Exception:
-                clients.remove(client)
+        """Queue log entries for the next batch sent to all connected clients"""
+        broadcaster.publish_entries(entries)
     
-    def read_initial_logs(self, log_file=None):
-        """Read initial log content for new connections"""
-        entries = []
-        
+    def read_initial_logs(self, log_name=None, before=None, after=None, line=None,
+                          limit=DEFAULT_PAGE_SIZE):
+        """Read one page of a session's log entries, by default the newest of the newest session"""
+        if not (log_name and segment_store.segments(log_name)):
+            sessions = list_sessions()
+            if not sessions:
+                return {"file": None, "entries": [], "before": 0, "after": 0,
+                        "has_more_before": False, "has_more_after": False, "size": 0, "lines": 0}
+            log_name = sessions[0]['name']
         
-        if log_file and os.path.exists(log_file):
-            files_to_read = [log_file]
-        else:
+        file_path = os.path.join(LOGS_DIR, log_name)
+        try:
+            self.tailer.track(file_path)
             
-            files_to_read = sorted(
-                [os.path.join(LOGS_DIR, f) for f in os.listdir(LOGS_DIR) if f.endswith('.log')],
-                key=os.path.getmtime, 
-                reverse=True  
+            return segment_store.read_page(
+                log_name, before=before, after=after, line=line, limit=limit
             )
         
-        for file_path in files_to_read:
-            try:
-               
-                if file_path not in self.last_position:
-                    self.last_position[file_path] = os.path.getsize(file_path)
-                
-                
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                
-                log_name = os.path.basename(file_path)
-                
-               
-                for line in content.splitlines():
-                    if not line.strip():
-                        continue
-                        
-                    entry = {"raw": line, "file": log_name}
-                    
-                  
-                    timestamp_match = line[:19] if len(line) >= 19 else None
-                    if timestamp_match:
-                        entry["timestamp"] = timestamp_match
-                    
-                    
-                    if " - [INFO] - " in line:
-                        entry["level"] = "info"
-                        entry["message"] = line.split(" - [INFO] - ", 1)[1]
-                    elif " - [ERROR] - " in line:
-                        entry["level"] = "error"
-                        entry["message"] = line.split(" - [ERROR] - ", 1)[1]
-                    elif " - [WARNING] - " in line:
-                        entry["level"] = "warning"
-                        entry["message"] = line.split(" - [WARNING] - ", 1)[1]
-                    elif " - [DEBUG] - " in line:
-                        entry["level"] = "debug"
-                        entry["message"] = line.split(" - [DEBUG] - ", 1)[1]
-                    else:
-                        entry["level"] = "none"
-                        entry["message"] = line
-                    
-                    entries.append(entry)
-            
-            except Exception as e:
-                logging.error(f"Error reading log file {file_path}: {str(e)}")
-                entries.append({
+        except Exception as e:
+            logging.error(f"Error reading log file {file_path}: {str(e)}")
+            return {
+                "file": os.path.basename(file_path),
+                "entries": [{
                     "level": "error",
                     "message": f"Error reading log file {os.path.basename(file_path)}: {str(e)}",
                     "file": os.path.basename(file_path),
                     "timestamp": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                })
-        
-        return entries
+                }],
+                "before": 0, "after": 0, "has_more_before": False, "has_more_after": False,
+                "size": 0, "lines": 0,
+            }
 
 log_handler = LogFileHandler()
 
+# Log lines sent by app nodes with LOG_SINK set, see core/log_sink.py and logserver/ingest.py
+LOG_INGEST = os.getenv("LOG_INGEST", "")
+ingest_server = None
+if LOG_INGEST:
+    ingest_server = LogIngestServer(LOG_INGEST, LOGS_DIR, on_write=log_handler.tailer.notify)
+
+
+def list_sessions():
+    """Log sessions with their segments, most recently written first"""
+    sessions = []
+    if os.path.exists(LOGS_DIR):
+        for name, segment_names in segment_store.sessions().items():
+            segments = []
+            for segment in segment_names:
+                try:
+                    stat = os.stat(os.path.join(LOGS_DIR, segment))
+                except OSError:
+                    continue
+                segments.append({'name': segment, 'size': stat.st_size, 'mtime': stat.st_mtime})
+            if not segments:
+                continue
+            mtime = max(segment['mtime'] for segment in segments)
+            sessions.append({
+                'name': name,
+                'size': sum(segment['size'] for segment in segments),
+                'mtime': mtime,
+                'modified': datetime.datetime.fromtimestamp(mtime).strftime('%Y-%m-%d %H:%M:%S'),
+                'segments': [segment['name'] for segment in segments],
+            })
+        sessions.sort(key=lambda x: x['mtime'], reverse=True)
+    return sessions
+
 @log_server.route('/')
 def index():
     """Main page of the log viewer"""
@@ -190,111 +187,191 @@ def index():
 
 @log_server.route('/api/logs')
 def get_logs():
-    """API endpoint to get all logs"""
-    log_file = request.args.get('file')
-    if log_file:
-        log_path = os.path.join(LOGS_DIR, log_file)
-    else:
-        log_path = None
-        
-    entries = log_handler.read_initial_logs(log_path)
-    return jsonify(entries)
+    """API endpoint to get one page of logs
+
+    Query parameters: file (a session or one of its segments), limit, and at
+    most one of before/after (cursors from a previous page) or line (1-based
+    line number in the active file). Without a cursor the newest lines are
+    returned; paging backwards continues into older segments.
+    """
+    log_file = request.args.get('file') or None
+
+    def int_arg(name):
+        value = request.args.get(name)
+        try:
+            return int(value) if value not in (None, '') else None
+        except ValueError:
+            return None
+
+    page = log_handler.read_initial_logs(
+        log_file,
+        before=request.args.get('before') or None,
+        after=request.args.get('after') or None,
+        line=int_arg('line'),
+        limit=int_arg('limit') or DEFAULT_PAGE_SIZE,
+    )
+    return jsonify(page)
 
 @log_server.route('/api/files')
 def get_log_files():
-    """API endpoint to get list of log files"""
-    log_files = []
-    if os.path.exists(LOGS_DIR):
-        for file in os.listdir(LOGS_DIR):
-            if file.endswith('.log'):
-                file_path = os.path.join(LOGS_DIR, file)
-                log_files.append({
-                    'name': file,
-                    'size': os.path.getsize(file_path),
-                    'modified': datetime.datetime.fromtimestamp(os.path.getmtime(file_path)).strftime('%Y-%m-%d %H:%M:%S')
-                })
-        
-        log_files.sort(key=lambda x: x['modified'], reverse=True)
-    
-    return jsonify(log_files)
+    """API endpoint to get list of log sessions, each with its segments"""
+    return jsonify([
+        {key: value for key, value in session.items() if key != 'mtime'}
+        for session in list_sessions()
+    ])
 
 @log_server.route('/api/stream')
 def stream_logs():
-    """Server-sent events endpoint for real-time log streaming"""
-    def generate():
-        queue = []
-        clients.append(queue)
-        
-        try:
-            yield "data: {\"connected\": true}\n\n"
-            
-            while True:
-                if queue and len(queue) > 0:
-                    yield queue.pop(0)
-                else:
-                    time.sleep(0.1)
-        except GeneratorExit:
-            if queue in clients:
-                clients.remove(queue)
+    """Server-sent events endpoint for real-time log streaming
+
+    format=columnar asks for compact column-oriented batches instead of arrays of entries.
+    """
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('lastEventId')
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        last_event_id = None
     
-    return Response(generate(), mimetype='text/event-stream')
+    response = Response(
+        broadcaster.stream(last_event_id, request.remote_addr, request.args.get('format', 'rows')),
+        mimetype='text/event-stream'
+    )
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@log_server.route('/api/stream/stats')
+def stream_stats():
+    """Connected stream clients, ring buffer, tailer and ingest state"""
+    stats = dict(broadcaster.stats(), tailer=log_handler.tailer.stats())
+    if ingest_server is not None:
+        stats['ingest'] = ingest_server.stats()
+    return jsonify(stats)
+
+@log_server.route('/api/stats')
+def get_stats():
+    """Log line counts over a time range from the rolling aggregates
+
+    Query parameters: since and until (epoch seconds or "YYYY-MM-DD HH:MM:SS",
+    the last hour by default), step (bucket size in seconds) and top (number
+    of routes and error messages, default 10).
+    """
+    until = parse_timestamp(request.args.get('until')) or time.time()
+    since = parse_timestamp(request.args.get('since'))
+    if since is None:
+        since = until - 3600
+    try:
+        step = int(request.args.get('step')) if request.args.get('step') else None
+        top = min(int(request.args.get('top', 10)), 100)
+    except ValueError:
+        abort(400)
+    return jsonify(log_stats.query(since, until, step=step, top=top))
 
 @log_server.route('/api/download/<filename>')
 def download_log(filename):
-    """Download a log file"""
-    return send_from_directory(LOGS_DIR, filename, as_attachment=True)
+    """Download a whole session (every segment, decompressed, in order) or a single segment
+
+    A compressed segment is decompressed unless raw=1 is given.
+    """
+    parsed = parse_log_name(filename)
+    if parsed is None:
+        abort(404)
+
+    if parsed[1] is None and not parsed[2]:
+        segments = segment_store.segments(filename)
+        if segments == [filename]:
+            return send_from_directory(LOGS_DIR, filename, as_attachment=True)
+    elif is_archive(filename) and request.args.get('raw') != '1':
+        segments = [filename] if os.path.exists(os.path.join(LOGS_DIR, filename)) else []
+        filename = os.path.splitext(filename)[0]
+    else:
+        return send_from_directory(LOGS_DIR, filename, as_attachment=True)
+
+    if not segments:
+        abort(404)
+    response = Response(segment_store.iter_bytes(segments), mimetype='text/plain')
+    response.headers['Content-Disposition'] = f'attachment; filename={filename}'
+    return response
 
 @log_server.route('/api/search')
 def search_logs():
-    """Search within log files"""
-    query = request.args.get('q', '').lower()
-    log_file = request.args.get('file')
-    
+    """Search within log files using the persistent search index"""
+    query = request.args.get('q', '')
     if not query:
-        return jsonify([])
+        return jsonify({"results": [], "next": None})
     
-    results = []
-    if log_file:
-        files_to_search = [os.path.join(LOGS_DIR, log_file)]
-    else:
-        files_to_search = [os.path.join(LOGS_DIR, f) for f in os.listdir(LOGS_DIR) if f.endswith('.log')]
+    files = [f for value in request.args.getlist('file') for f in value.split(',') if f]
+    # A session name searches all of its segments
+    sessions = segment_store.sessions() if files else {}
+    files = [segment for f in files for segment in sessions.get(f, [f])]
+    levels = [name for value in request.args.getlist('level') for name in value.split(',') if name]
+    try:
+        limit = min(int(request.args.get('limit', 100)), 1000)
+    except ValueError:
+        limit = 100
     
-    for file_path in files_to_search:
-        if not os.path.exists(file_path):
-            continue
-            
-        try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                line_num = 0
-                for line in f:
-                    line_num += 1
-                    if query in line.lower():
-                        file_name = os.path.basename(file_path)
-                        results.append({
-                            'file': file_name,
-                            'line': line_num,
-                            'content': line.strip()
-                        })
-        except Exception as e:
-            logging.error(f"Error searching log file {file_path}: {str(e)}")
+    # Picks up anything the background indexer has not seen yet, including truncated and
+    # deleted files
+    search_index.sync()
     
-    return jsonify(results)
+    return jsonify(search_index.search(
+        query,
+        files=files or None,
+        levels=levels or None,
+        since=parse_timestamp(request.args.get('since')),
+        until=parse_timestamp(request.args.get('until')),
+        limit=limit,
+        cursor=request.args.get('cursor'),
+    ))
 
 def start(host='0.0.0.0', port=9001):
     """Start the log server and file watcher"""
-    # Set up file watcher
-    event_handler = log_handler
+    # run(debug=True) below restarts this script in a child that serves requests. Only that
+    # child watches, indexes and listens; the first process just restarts it on code changes.
+    serving = os.environ.get('WERKZEUG_RUN_MAIN') == 'true'
     observer = Observer()
-    observer.schedule(event_handler, str(LOGS_DIR), recursive=False)
-    observer.start()
+    if serving:
+        start_background(observer)
     
     try:
         logging.info(f"Log server starting on http://{host}:{port}")
         log_server.run(host=host, port=port, threaded=True,debug=True)
     except KeyboardInterrupt:
-        observer.stop()
+        pass
     
-    observer.join()
+    if serving:
+        observer.stop()
+        observer.join()
+
+
+def start_background(observer):
+    """Start the file watcher, search indexer, stats backfill and ingest listener"""
+    # Set up file watcher
+    event_handler = log_handler
+    observer.schedule(event_handler, str(LOGS_DIR), recursive=False)
+    # Stream what is written from now on; existing lines are only counted for /api/stats
+    backfill = []
+    for segments in segment_store.sessions().values():
+        for name in segments:
+            path = os.path.join(LOGS_DIR, name)
+            limit = None
+            if name.endswith('.log'):
+                try:
+                    limit = os.path.getsize(path)
+                except OSError:
+                    continue
+                event_handler.tailer.track(path, limit)
+            backfill.append((path, limit))
+    threading.Thread(
+        target=log_stats.backfill,
+        args=(backfill, int(os.getenv("LOG_STATS_BACKFILL_WORKERS", 0))),
+        name="log-stats-backfill",
+        daemon=True,
+    ).start()
+    observer.start()
+    search_index.start()
+    if ingest_server is not None:
+        ingest_server.start()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,250 @@
+import json
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# Number of frames kept for resuming clients
+DEFAULT_CAPACITY = 2048
+# Frames a client may fall behind before it is evicted
+DEFAULT_MAX_BACKLOG = 1024
+# Seconds between keep-alive comments on an idle stream
+DEFAULT_HEARTBEAT = 15.0
+# Seconds entries are collected into one batch before it is sent (0 sends every publish at once)
+DEFAULT_BATCH_WINDOW = 0.05
+# A batch is sent early once it holds this many entries
+DEFAULT_BATCH_SIZE = 1000
+
+# Stream formats: "rows" is a JSON array of entries, "columnar" a compact object of columns
+FORMATS = ("rows", "columnar")
+# Entry fields left out of columnar frames; the viewer only needs the parsed fields
+COLUMNAR_SKIP = {"raw"}
+
+
+def encode_columnar(entries: List[Dict[str, Any]]) -> str:
+    """Encodes a batch as {"count": n, "columns": {field: column}}.
+
+    A column is a list with one value per entry (null where an entry lacks
+    the field), {"const": value} when every entry has the same value, or
+    {"values": [...], "codes": [...]} when few distinct values repeat.
+    """
+    count = len(entries)
+    fields: Dict[str, None] = {}
+    for entry in entries:
+        for field in entry:
+            fields[field] = None
+
+    columns: Dict[str, Any] = {}
+    for field in fields:
+        if field in COLUMNAR_SKIP:
+            continue
+        values = [entry.get(field) for entry in entries]
+        try:
+            distinct = {value: None for value in values}
+        except TypeError:
+            columns[field] = values
+            continue
+        if len(distinct) == 1:
+            columns[field] = {"const": values[0]}
+        elif len(distinct) * 4 <= count:
+            codes = {value: i for i, value in enumerate(distinct)}
+            columns[field] = {"values": list(distinct), "codes": [codes[value] for value in values]}
+        else:
+            columns[field] = values
+    return json.dumps({"count": count, "columns": columns}, separators=(",", ":"))
+
+
+class StreamClient:
+    """Read position of one connected SSE client in the broadcaster's ring."""
+
+    __slots__ = ("id", "cursor", "connected_at", "remote_addr", "format")
+
+    def __init__(self, client_id: int, cursor: int, remote_addr: Optional[str] = None,
+                 format: str = "rows") -> None:
+        self.id = client_id
+        self.cursor = cursor
+        self.connected_at = time.time()
+        self.remote_addr = remote_addr
+        self.format = format
+
+
+class LogBroadcaster:
+    """Fans out log batches to SSE clients from one shared ring buffer.
+
+    Each published batch is encoded into an SSE frame once and stored in a
+    fixed-size ring under an increasing event id. Clients only keep a cursor
+    into the ring and sleep on a condition variable until a new frame arrives,
+    so idle streams cost nothing but a keep-alive every heartbeat seconds.
+    A client that falls more than max_backlog frames behind is evicted with a
+    "reset" event; a reconnecting client resumes after its Last-Event-ID as
+    long as that frame is still in the ring.
+
+    publish_entries() coalesces entries: they are collected for up to
+    batch_window seconds (or until batch_size entries are waiting) and sent
+    as one frame, so a burst of lines costs one serialization per batch
+    instead of one per file event. Each batch is encoded once per format in
+    use; clients that asked for columnar frames before any were encoded get
+    the row frame instead.
+    """
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY, max_backlog: int = DEFAULT_MAX_BACKLOG,
+                 heartbeat: float = DEFAULT_HEARTBEAT, batch_window: float = DEFAULT_BATCH_WINDOW,
+                 batch_size: int = DEFAULT_BATCH_SIZE) -> None:
+        self.capacity = capacity
+        self.max_backlog = min(max_backlog, capacity)
+        self.heartbeat = heartbeat
+        self.batch_window = batch_window
+        self.batch_size = max(1, batch_size)
+        # Per event id: the row frame and, when columnar clients are connected, the columnar one
+        self._frames: List[Optional[Tuple[str, Optional[str]]]] = [None] * capacity
+        self._next_id = 1
+        self._cond = threading.Condition()
+        self._clients: Dict[int, StreamClient] = {}
+        self._client_ids = 0
+        self._columnar_clients = 0
+        self.evicted = 0
+
+        self._pending: List[Dict[str, Any]] = []
+        self._pending_since: Optional[float] = None
+        self._pending_cond = threading.Condition()
+        self._flusher: Optional[threading.Thread] = None
+
+    @property
+    def last_id(self) -> int:
+        return self._next_id - 1
+
+    @property
+    def oldest_id(self) -> int:
+        return max(1, self._next_id - self.capacity)
+
+    def publish(self, data: str, columnar: Optional[str] = None) -> int:
+        """Stores an already serialized JSON payload and wakes all clients."""
+        with self._cond:
+            event_id = self._next_id
+            self._frames[event_id % self.capacity] = (
+                f"id: {event_id}\ndata: {data}\n\n",
+                f"id: {event_id}\ndata: {columnar}\n\n" if columnar is not None else None,
+            )
+            self._next_id = event_id + 1
+            self._cond.notify_all()
+        return event_id
+
+    def publish_entries(self, entries: List[Dict[str, Any]]) -> None:
+        """Queues entries for the next batch."""
+        if not entries:
+            return
+        with self._pending_cond:
+            self._pending.extend(entries)
+            if self.batch_window <= 0 or len(self._pending) >= self.batch_size:
+                self._flush_pending()
+                return
+            if self._pending_since is None:
+                self._pending_since = time.monotonic()
+                self._pending_cond.notify()
+            if self._flusher is None:
+                self._flusher = threading.Thread(
+                    target=self._run_flusher, name="log-stream-batcher", daemon=True
+                )
+                self._flusher.start()
+
+    def flush(self) -> None:
+        """Sends the entries waiting for the current batch window right away."""
+        with self._pending_cond:
+            self._flush_pending()
+
+    def _flush_pending(self) -> None:
+        # Called with _pending_cond held, so batches are published in order
+        entries, self._pending = self._pending, []
+        self._pending_since = None
+        for start in range(0, len(entries), self.batch_size):
+            batch = entries[start:start + self.batch_size]
+            columnar = encode_columnar(batch) if self._columnar_clients else None
+            self.publish(json.dumps(batch, separators=(",", ":")), columnar)
+
+    def _run_flusher(self) -> None:
+        with self._pending_cond:
+            while True:
+                if self._pending_since is None:
+                    self._pending_cond.wait()
+                    continue
+                remaining = self._pending_since + self.batch_window - time.monotonic()
+                if remaining > 0:
+                    self._pending_cond.wait(remaining)
+                    continue
+                self._flush_pending()
+
+    def _register(self, last_event_id: Optional[int], remote_addr: Optional[str],
+                  format: str) -> StreamClient:
+        with self._cond:
+            self._client_ids += 1
+            cursor = self._next_id
+            if last_event_id is not None and last_event_id < self._next_id:
+                cursor = last_event_id + 1
+            client = StreamClient(self._client_ids, cursor, remote_addr, format)
+            self._clients[client.id] = client
+            if format == "columnar":
+                self._columnar_clients += 1
+            return client
+
+    def _unregister(self, client: StreamClient) -> None:
+        with self._cond:
+            if self._clients.pop(client.id, None) is not None and client.format == "columnar":
+                self._columnar_clients -= 1
+
+    def _next_frames(self, client: StreamClient) -> Optional[List[str]]:
+        """Waits for frames after the client's cursor; returns None if the client must be reset."""
+        with self._cond:
+            if client.cursor >= self._next_id:
+                self._cond.wait(self.heartbeat)
+
+            if client.cursor < self.oldest_id or self._next_id - client.cursor > self.max_backlog:
+                self.evicted += 1
+                return None
+
+            columnar = client.format == "columnar"
+            frames = []
+            for event_id in range(client.cursor, self._next_id):
+                frame = self._frames[event_id % self.capacity]
+                if frame is not None:
+                    frames.append(frame[1] or frame[0] if columnar else frame[0])
+            client.cursor = self._next_id
+            return frames
+
+    def stream(self, last_event_id: Optional[int] = None, remote_addr: Optional[str] = None,
+               format: str = "rows") -> Iterator[str]:
+        """Generator of SSE text for one client, in one of FORMATS."""
+        client = self._register(last_event_id, remote_addr, format if format in FORMATS else "rows")
+        try:
+            yield "retry: 3000\n"
+            yield "data: {\"connected\": true}\n\n"
+
+            while True:
+                frames = self._next_frames(client)
+                if frames is None:
+                    # Too far behind: tell the client to reload instead of replaying a gap
+                    reset = json.dumps({"last_id": self.last_id})
+                    yield f"id: {self.last_id}\nevent: reset\ndata: {reset}\n\n"
+                    return
+                if frames:
+                    yield "".join(frames)
+                else:
+                    yield ": keep-alive\n\n"
+        finally:
+            self._unregister(client)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "clients": len(self._clients),
+                "last_id": self.last_id,
+                "oldest_id": self.oldest_id,
+                "capacity": self.capacity,
+                "evicted": self.evicted,
+                "columnar_clients": self._columnar_clients,
+                "batch_window": self.batch_window,
+                "batch_size": self.batch_size,
+                "pending": len(self._pending),
+                "lagging": {
+                    client.id: self._next_id - client.cursor
+                    for client in self._clients.values() if client.cursor < self._next_id
+                },
+            }
@@ -0,0 +1,189 @@
+import json
+import logging
+import os
+import socket
+import socketserver
+import threading
+import time
+from typing import Any, BinaryIO, Callable, Dict, List, Optional
+from core.log_rotation import LogRotator
+from core.log_sink import node_name, parse_address
+
+# Bytes read from a connection at a time
+READ_CHUNK = 1 << 16
+# A line longer than this is cut off instead of being buffered further
+MAX_LINE = 1 << 20
+
+
+class IngestFile:
+    """Append handle of one node's session log, rotated like a local session log."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.lock = threading.Lock()
+        self.rotator = LogRotator(path)
+        self.stream: Optional[BinaryIO] = None
+
+    def write(self, data: bytes) -> None:
+        with self.lock:
+            if self.stream is None:
+                self.stream = open(self.path, "ab", buffering=0)
+            elif self.rotator.enabled and self.rotator.needs_check():
+                stat = os.fstat(self.stream.fileno())
+                self.rotator.checked(stat.st_size)
+                if self.rotator.due(stat.st_size):
+                    self.stream.close()
+                    self.rotator.rotate(stat.st_ino)
+                    self.stream = open(self.path, "ab", buffering=0)
+            self.stream.write(data)
+            self.rotator.wrote(len(data))
+
+    def close(self) -> None:
+        with self.lock:
+            if self.stream is not None:
+                self.stream.close()
+                self.stream = None
+
+
+class LogIngestServer:
+    """Receives JSON log lines from core.log_sink and appends them to per-node session logs.
+
+    Each line is written to logs/<date>_<session>_<node>.log, named after the
+    session and node it carries, so collected logs show up as sessions of
+    their own and go through the same tailing, stream, search and stats as
+    local files. on_write is called with the path after every write, so the
+    caller can read the new lines without waiting for a file system event.
+
+    After writing, the server replies with the number of bytes of the
+    connection it has written so far and a newline, which the sink waits for
+    before it drops a batch or spool file.
+    """
+
+    def __init__(self, address: str, logs_dir: str,
+                 on_write: Optional[Callable[[str], None]] = None) -> None:
+        self.family, self.address = parse_address(address)
+        self.logs_dir = str(logs_dir)
+        self.on_write = on_write
+        self._files: Dict[str, IngestFile] = {}
+        self._lock = threading.Lock()
+        self._server: Optional[socketserver.BaseServer] = None
+        self.connections = 0
+        self.lines = 0
+
+    def start(self) -> None:
+        ingest = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self) -> None:
+                ingest._handle(self.request)
+
+        if self.family == getattr(socket, "AF_UNIX", None):
+            # A socket file left by an earlier run would make bind() fail
+            if os.path.exists(self.address):
+                os.remove(self.address)
+            base: Any = socketserver.ThreadingUnixStreamServer
+        else:
+            base = socketserver.ThreadingTCPServer
+
+        class Server(base):
+            allow_reuse_address = True
+            daemon_threads = True
+
+        self._server = Server(self.address, Handler)
+        threading.Thread(target=self._server.serve_forever, name="log-ingest", daemon=True).start()
+        logging.info(f"Log ingest listening on {self.address}")
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+        with self._lock:
+            for ingest_file in self._files.values():
+                ingest_file.close()
+
+    def _handle(self, sock: socket.socket) -> None:
+        with self._lock:
+            self.connections += 1
+        partial = b""
+        # Set while the rest of a line longer than MAX_LINE is dropped up to its newline
+        discarding = False
+        received = handled = acked = 0
+        target: Optional[str] = None
+        try:
+            while True:
+                chunk = sock.recv(READ_CHUNK)
+                if not chunk:
+                    break
+                received += len(chunk)
+                if discarding:
+                    newline = chunk.find(b"\n")
+                    if newline < 0:
+                        continue
+                    chunk = chunk[newline + 1:]
+                    discarding = False
+                    # Lines dropped for being too long count as handled too
+                    handled = received - len(chunk)
+                data = partial + chunk
+                end = data.rfind(b"\n")
+                if end >= 0:
+                    target = self._write_lines(data[:end + 1].splitlines(keepends=True), target)
+                    partial = data[end + 1:]
+                    handled = received - len(partial)
+                else:
+                    partial = data
+                if len(partial) > MAX_LINE:
+                    partial = b""
+                    discarding = True
+                if handled > acked:
+                    sock.sendall(b"%d\n" % handled)
+                    acked = handled
+        except OSError:
+            pass
+        finally:
+            with self._lock:
+                self.connections -= 1
+
+    def _write_lines(self, lines: List[bytes], target: Optional[str]) -> Optional[str]:
+        """Appends lines to their sessions' files, one write per file; returns the last target."""
+        groups: Dict[str, List[bytes]] = {}
+        for line in lines:
+            if not line.strip():
+                continue
+            target = self._target(line) or target or self._target_name(None, None)
+            groups.setdefault(target, []).append(line)
+        for name, group in groups.items():
+            path = os.path.join(self.logs_dir, name)
+            self._file(path).write(b"".join(group))
+            with self._lock:
+                self.lines += len(group)
+            if self.on_write is not None:
+                self.on_write(path)
+        return target
+
+    def _target(self, line: bytes) -> Optional[str]:
+        try:
+            data = json.loads(line)
+        except ValueError:
+            return None
+        if not isinstance(data, dict):
+            return None
+        return self._target_name(data.get("session"), data.get("node"))
+
+    def _target_name(self, session: Any, node: Any) -> str:
+        session = node_name(str(session)) if session else time.strftime("%Y%m%d")
+        if session[:8].isdigit():
+            date = f"{session[:4]}-{session[4:6]}-{session[6:8]}"
+        else:
+            date = time.strftime("%Y-%m-%d")
+        return f"{date}_{session}_{node_name(str(node or 'remote'))}.log"
+
+    def _file(self, path: str) -> IngestFile:
+        with self._lock:
+            ingest_file = self._files.get(path)
+            if ingest_file is None:
+                ingest_file = self._files[path] = IngestFile(path)
+            return ingest_file
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"connections": self.connections, "lines": self.lines, "files": len(self._files)}
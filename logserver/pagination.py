@@ -0,0 +1,192 @@
+import mmap
+import os
+import threading
+from bisect import bisect_right
+from itertools import accumulate
+from typing import Any, Dict, List, Optional, Tuple
+from core.log_format import parse_line
+from core.log_rotation import open_shared
+
+# Every STRIDE-th line start is recorded, so locating any line scans at most STRIDE lines
+STRIDE = 1000
+SCAN_CHUNK = 1 << 20
+DEFAULT_PAGE_SIZE = 500
+MAX_PAGE_SIZE = 5000
+
+
+class LineOffsetIndex:
+    """Sparse index of line start offsets for one log file.
+
+    checkpoints[k] is the byte offset where line k * STRIDE + 1 starts. The
+    index is extended incrementally as the file grows and rebuilt when the
+    file is truncated or replaced.
+    """
+
+    def __init__(self, path: str, stride: int = STRIDE) -> None:
+        self.path = path
+        self.stride = stride
+        self.inode: Optional[int] = None
+        self.checkpoints: List[int] = [0]
+        self.scanned_upto = 0
+        self.lines = 0
+        self._lock = threading.Lock()
+
+    def refresh(self, mm: Any, size: int, inode: int) -> None:
+        """Extends the index over complete lines up to size."""
+        with self._lock:
+            if inode != self.inode or size < self.scanned_upto:
+                self.inode = inode
+                self.checkpoints = [0]
+                self.scanned_upto = 0
+                self.lines = 0
+
+            pos = self.scanned_upto
+            while pos < size:
+                end = min(pos + SCAN_CHUNK, size)
+                last_newline = mm.rfind(b"\n", pos, end)
+                if last_newline == -1:
+                    # A line longer than the chunk: extend to its end
+                    last_newline = mm.find(b"\n", end, size)
+                    if last_newline == -1:
+                        break
+                chunk = mm[pos:last_newline + 1]
+                lengths = list(accumulate(map(len, chunk.split(b"\n")[:-1])))
+
+                # Line i of the chunk ends at lengths[i] + i + 1 bytes into it
+                first = self.stride - self.lines % self.stride - 1
+                for i in range(first, len(lengths), self.stride):
+                    self.checkpoints.append(pos + lengths[i] + i + 1)
+
+                self.lines += len(lengths)
+                pos += len(chunk)
+            self.scanned_upto = pos
+
+    def offset_of_line(self, mm: Any, line: int) -> int:
+        """Byte offset where the given 1-based line starts."""
+        line = max(1, min(line, self.lines + 1))
+        k = (line - 1) // self.stride
+        pos = self.checkpoints[k]
+        for _ in range((line - 1) - k * self.stride):
+            pos = mm.find(b"\n", pos, self.scanned_upto) + 1
+        return pos
+
+    def line_at(self, mm: Any, offset: int) -> int:
+        """1-based number of the line starting at (or containing) offset."""
+        k = bisect_right(self.checkpoints, offset) - 1
+        return k * self.stride + mm[self.checkpoints[k]:offset].count(b"\n") + 1
+
+
+_indexes: Dict[str, LineOffsetIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def line_index(path: str) -> LineOffsetIndex:
+    with _indexes_lock:
+        index = _indexes.get(path)
+        if index is None:
+            index = _indexes[path] = LineOffsetIndex(path)
+        return index
+
+
+def forget(path: str) -> None:
+    with _indexes_lock:
+        _indexes.pop(path, None)
+
+
+def _lines_before(mm: Any, end: int, limit: int) -> List[Tuple[int, bytes]]:
+    lines = []
+    pos = end
+    while len(lines) < limit and pos > 0:
+        start = mm.rfind(b"\n", 0, pos - 1) + 1
+        lines.append((start, mm[start:pos - 1]))
+        pos = start
+    lines.reverse()
+    return lines
+
+
+def _lines_after(mm: Any, start: int, end: int, limit: int) -> List[Tuple[int, bytes]]:
+    lines = []
+    pos = start
+    while len(lines) < limit and pos < end:
+        newline = mm.find(b"\n", pos, end)
+        if newline == -1:
+            break
+        lines.append((pos, mm[pos:newline]))
+        pos = newline + 1
+    return lines
+
+
+def read_page(path: str, before: Optional[int] = None, after: Optional[int] = None,
+              line: Optional[int] = None, limit: int = DEFAULT_PAGE_SIZE,
+              name: Optional[str] = None) -> Dict[str, Any]:
+    """Reads one page of parsed log entries from a file.
+
+    Without a cursor the newest `limit` lines are returned (read backwards from
+    the end of the file). `before` returns the lines ending before a byte
+    offset, `after` the lines starting at one, and `line` the lines starting
+    at a 1-based line number. Only complete lines are returned. The response
+    carries the cursors for the neighbouring pages. Entries are labelled with
+    name, the file's own name by default.
+    """
+    name = name or os.path.basename(path)
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    page: Dict[str, Any] = {
+        "file": name, "entries": [], "before": 0, "after": 0,
+        "has_more_before": False, "has_more_after": False, "size": 0, "lines": 0,
+    }
+
+    with open_shared(path) as f:
+        stat = os.fstat(f.fileno())
+        size = stat.st_size
+        page["size"] = size
+        if size == 0:
+            return page
+
+        with mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ) as mm:
+            # Ignore a line that is still being written
+            complete = mm.rfind(b"\n", 0, size) + 1
+
+            index = line_index(path)
+            index.refresh(mm, complete, stat.st_ino)
+            page["lines"] = index.lines
+
+            if line is not None:
+                after = index.offset_of_line(mm, line)
+            if after is not None:
+                lines = _lines_after(mm, min(max(after, 0), complete), complete, limit)
+            else:
+                end = complete if before is None else min(max(before, 0), complete)
+                # Align a cursor that points into the middle of a line to that line's start
+                if end and mm[end - 1:end] != b"\n":
+                    end = mm.rfind(b"\n", 0, end) + 1
+                lines = _lines_before(mm, end, limit)
+
+            if lines:
+                first_offset = lines[0][0]
+                last_end = lines[-1][0] + len(lines[-1][1]) + 1
+                first_line = index.line_at(mm, first_offset)
+            else:
+                if after is not None:
+                    first_offset = last_end = after
+                else:
+                    first_offset = last_end = complete if before is None else end
+                first_line = 0
+
+    entries = []
+    for i, (offset, raw) in enumerate(lines):
+        text = raw.decode("utf-8", errors="replace").rstrip("\r")
+        if not text.strip():
+            continue
+        entry = parse_line(text, name)
+        entry["offset"] = offset
+        entry["line"] = first_line + i
+        entries.append(entry)
+
+    page.update({
+        "entries": entries,
+        "before": first_offset,
+        "after": last_end,
+        "has_more_before": first_offset > 0,
+        "has_more_after": last_end < complete,
+    })
+    return page
@@ -0,0 +1,522 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+import logging
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+from core.log_format import parse_line, TIMESTAMP_FORMAT
+from core.log_rotation import is_archive, open_shared, parse_log_name
+from logserver.segments import SegmentStore
+
+# Lines per indexed block; a query reads whole candidate blocks to verify matches
+BLOCK_LINES = 64
+MAX_TOKEN_LENGTH = 40
+TOKEN_RE = re.compile(r"[a-z0-9_]{2,}")
+# Pseudo-token of the blocks with a word longer than MAX_TOKEN_LENGTH (never produced by TOKEN_RE)
+LONG_TOKEN = "*"
+# Bytes read from a log file at a time while indexing it
+INDEX_CHUNK_BYTES = 4 * 1024 * 1024
+# Bumped when the layout changes; an index of another version is rebuilt
+INDEX_VERSION = 1
+
+LEVEL_BITS: Dict[str, int] = {"debug": 1, "info": 2, "warning": 4, "error": 8, "none": 16}
+ALL_LEVELS = sum(LEVEL_BITS.values())
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    name TEXT PRIMARY KEY,
+    inode INTEGER,
+    indexed_upto INTEGER NOT NULL DEFAULT 0,
+    lines INTEGER NOT NULL DEFAULT 0,
+    last_ts REAL
+);
+CREATE TABLE IF NOT EXISTS blocks (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    file TEXT NOT NULL,
+    start INTEGER NOT NULL,
+    end INTEGER NOT NULL,
+    first_line INTEGER NOT NULL,
+    line_count INTEGER NOT NULL,
+    levels INTEGER NOT NULL,
+    min_ts REAL,
+    max_ts REAL
+);
+CREATE INDEX IF NOT EXISTS blocks_by_file ON blocks (file, start);
+CREATE TABLE IF NOT EXISTS tokens (
+    id INTEGER PRIMARY KEY,
+    token TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS postings (
+    token INTEGER NOT NULL,
+    block INTEGER NOT NULL,
+    PRIMARY KEY (token, block)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS postings_by_block ON postings (block);
+CREATE TABLE IF NOT EXISTS token_suffixes (
+    suffix TEXT NOT NULL,
+    token INTEGER NOT NULL,
+    PRIMARY KEY (suffix, token)
+) WITHOUT ROWID;
+"""
+
+_last_text_ts: Tuple[str, Optional[float]] = ("", None)
+
+
+def parse_timestamp(value: Any) -> Optional[float]:
+    """Converts an epoch number or a "YYYY-mm-dd HH:MM:SS" string to an epoch timestamp."""
+    global _last_text_ts
+    if value is None or value == "":
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    if value == _last_text_ts[0]:
+        return _last_text_ts[1]
+    try:
+        ts: Optional[float] = time.mktime(time.strptime(value[:19], TIMESTAMP_FORMAT))
+    except ValueError:
+        ts = None
+    _last_text_ts = (value, ts)
+    return ts
+
+
+def tokenize(text: str) -> Set[str]:
+    words = set()
+    for token in TOKEN_RE.findall(text.lower()):
+        if len(token) > MAX_TOKEN_LENGTH:
+            words.add(LONG_TOKEN)
+            token = token[:MAX_TOKEN_LENGTH]
+        words.add(token)
+    return words
+
+
+def suffixes(token: str) -> Iterator[str]:
+    """Proper suffixes of a token that a query word can match (at least 2 characters)."""
+    for i in range(1, len(token) - 1):
+        yield token[i:]
+
+
+class SearchIndex:
+    """Persistent inverted index over the log files in one directory.
+
+    Files are split into blocks of BLOCK_LINES complete lines. Every block
+    records its byte range, first line number, the levels and time range of
+    its lines and, through the postings table, the words that occur in it.
+    A query looks up the blocks containing every word of the query, drops
+    blocks excluded by the level/file/time filters and then verifies the
+    remaining lines, so results are identical to a full substring scan.
+    Words are indexed up to MAX_TOKEN_LENGTH characters; the suffixes of
+    every token are indexed too, so a query word that may start inside a
+    token is found without scanning the vocabulary.
+
+    update() indexes whatever was appended since the last call and rebuilds
+    a file from scratch when it was truncated or replaced. Rotated segments
+    keep their blocks through rename(); compressed segments never change, so
+    they are only read (decompressed) to index lines not indexed before.
+    """
+
+    def __init__(self, logs_dir: str, db_path: Optional[str] = None,
+                 segments: Optional[SegmentStore] = None) -> None:
+        self.logs_dir = str(logs_dir)
+        self.segments = segments or SegmentStore(self.logs_dir)
+        self.db_path = db_path or os.path.join(self.logs_dir, ".search_index.sqlite")
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        if self._db.execute("PRAGMA user_version").fetchone()[0] != INDEX_VERSION:
+            self._db.executescript(
+                "DROP TABLE IF EXISTS files; DROP TABLE IF EXISTS blocks; "
+                "DROP TABLE IF EXISTS tokens; DROP TABLE IF EXISTS postings; "
+                "DROP TABLE IF EXISTS token_suffixes;"
+            )
+            self._db.execute(f"PRAGMA user_version = {INDEX_VERSION}")
+        self._db.executescript(SCHEMA)
+        self._pending: Set[str] = set()
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+
+    # Indexing
+
+    def log_files(self) -> List[str]:
+        return sorted(f for f in os.listdir(self.logs_dir) if parse_log_name(f) is not None)
+
+    def _file_row(self, name: str) -> Optional[Tuple[int, int, int, Optional[float]]]:
+        return self._db.execute(
+            "SELECT inode, indexed_upto, lines, last_ts FROM files WHERE name = ?", (name,)
+        ).fetchone()
+
+    def remove(self, name: str) -> None:
+        """Drops a file and all of its blocks from the index."""
+        name = os.path.basename(name)
+        with self._lock, self._db:
+            self._remove_blocks(name, 0)
+            self._db.execute("DELETE FROM files WHERE name = ?", (name,))
+
+    def rename(self, old: str, new: str) -> bool:
+        """Moves a file's blocks to its new name, e.g. when a log is rotated or compressed."""
+        old, new = os.path.basename(old), os.path.basename(new)
+        with self._lock, self._db:
+            if self._file_row(old) is None:
+                return False
+            self.remove(new)
+            self._db.execute("UPDATE files SET name = ? WHERE name = ?", (new, old))
+            self._db.execute("UPDATE blocks SET file = ? WHERE file = ?", (new, old))
+        return True
+
+    def _remove_blocks(self, name: str, from_offset: int) -> None:
+        block_ids = [row[0] for row in self._db.execute(
+            "SELECT id FROM blocks WHERE file = ? AND start >= ?", (name, from_offset)
+        )]
+        for i in range(0, len(block_ids), 500):
+            chunk = block_ids[i:i + 500]
+            marks = ",".join("?" * len(chunk))
+            self._db.execute(f"DELETE FROM postings WHERE block IN ({marks})", chunk)
+            self._db.execute(f"DELETE FROM blocks WHERE id IN ({marks})", chunk)
+
+    def update(self, path: str) -> int:
+        """Indexes new complete lines of a log file; returns the number of lines added."""
+        name = os.path.basename(path)
+        path = os.path.join(self.logs_dir, name)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            self.remove(name)
+            return 0
+
+        with self._lock:
+            row = self._file_row(name)
+            size, file_inode = stat.st_size, stat.st_ino
+            if is_archive(name):
+                if row and row[0] == stat.st_ino:
+                    return 0
+                # Renamed from the uncompressed segment: index whatever it had left
+                path = self.segments.path(name)
+                size = os.path.getsize(path)
+                file_inode = row[0] if row else stat.st_ino
+            inode, indexed_upto, line_no, last_ts = row if row else (file_inode, 0, 0, None)
+
+            if row and (inode != file_inode or size < indexed_upto):
+                # Truncated or replaced: start over
+                self.remove(name)
+                inode, indexed_upto, line_no, last_ts = file_inode, 0, 0, None
+
+            # Merge a trailing partial block with the new lines, so blocks stay full
+            tail = self._db.execute(
+                "SELECT start, first_line FROM blocks WHERE file = ? AND line_count < ? "
+                "ORDER BY start DESC LIMIT 1", (name, BLOCK_LINES)
+            ).fetchone()
+
+            if size <= indexed_upto:
+                if is_archive(name) and row:
+                    # Fully indexed: from now on the archive is skipped without reading it
+                    self._db.execute(
+                        "UPDATE files SET inode = ? WHERE name = ?", (stat.st_ino, name)
+                    )
+                    self._db.commit()
+                return 0
+
+            if tail:
+                start, first_line = tail
+                line_no = first_line - 1
+                previous = self._db.execute(
+                    "SELECT max_ts FROM blocks WHERE file = ? AND start < ? "
+                    "ORDER BY start DESC LIMIT 1",
+                    (name, start)
+                ).fetchone()
+                last_ts = previous[0] if previous else None
+            else:
+                start = indexed_upto
+
+            # Reads and commits INDEX_CHUNK_BYTES at a time; lines short of a full
+            # block are carried over to the next chunk, so only the last block is partial
+            added = 0
+            offset = start
+            remaining = size - start
+            buffer = b""
+            with open_shared(path) as f:
+                f.seek(start)
+                while remaining > 0:
+                    data = f.read(min(INDEX_CHUNK_BYTES, remaining))
+                    if not data:
+                        break
+                    remaining -= len(data)
+                    buffer += data
+                    lines = buffer[:buffer.rfind(b"\n") + 1].split(b"\n")[:-1]
+                    if remaining > 0:
+                        lines = lines[:len(lines) - len(lines) % BLOCK_LINES]
+                    if not lines:
+                        continue
+
+                    with self._db:
+                        if tail:
+                            self._remove_blocks(name, start)
+                            tail = None
+                        for i in range(0, len(lines), BLOCK_LINES):
+                            chunk = lines[i:i + BLOCK_LINES]
+                            block_size = sum(len(line) + 1 for line in chunk)
+                            last_ts = self._add_block(
+                                name, offset, offset + block_size, line_no + 1, chunk, last_ts
+                            )
+                            offset += block_size
+                            line_no += len(chunk)
+                            added += len(chunk)
+
+                        self._db.execute(
+                            "INSERT OR REPLACE INTO files "
+                            "(name, inode, indexed_upto, lines, last_ts) VALUES (?, ?, ?, ?, ?)",
+                            (name, stat.st_ino, offset, line_no, last_ts)
+                        )
+                    buffer = buffer[sum(len(line) + 1 for line in lines):]
+            return added
+
+    def _add_block(self, name: str, start: int, end: int, first_line: int,
+                   raw_lines: List[bytes], last_ts: Optional[float]) -> Optional[float]:
+        levels = 0
+        min_ts = max_ts = None
+        words: Set[str] = set()
+        for raw in raw_lines:
+            line = raw.decode("utf-8", errors="replace").rstrip("\r")
+            if not line.strip():
+                continue
+            entry = parse_line(line, name)
+            levels |= LEVEL_BITS.get(entry.get("level", "none"), LEVEL_BITS["none"])
+            ts = parse_timestamp(entry.get("ts", entry.get("timestamp")))
+            if ts is None:
+                ts = last_ts
+            last_ts = ts
+            if ts is not None:
+                min_ts = ts if min_ts is None else min(min_ts, ts)
+                max_ts = ts if max_ts is None else max(max_ts, ts)
+            words |= tokenize(line)
+
+        cursor = self._db.execute(
+            "INSERT INTO blocks (file, start, end, first_line, line_count, levels, min_ts, max_ts) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (name, start, end, first_line, len(raw_lines), levels or LEVEL_BITS["none"],
+             min_ts, max_ts)
+        )
+        block_id = cursor.lastrowid
+        self._add_tokens(words)
+        self._db.executemany(
+            "INSERT OR IGNORE INTO postings (token, block) "
+            "SELECT id, ? FROM tokens WHERE token = ?",
+            ((block_id, w) for w in words)
+        )
+        return last_ts
+
+    def _add_tokens(self, words: Set[str]) -> None:
+        """Adds the words missing from the vocabulary, with their suffixes."""
+        known: Set[str] = set()
+        listed = list(words)
+        for i in range(0, len(listed), 500):
+            chunk = listed[i:i + 500]
+            known.update(row[0] for row in self._db.execute(
+                f"SELECT token FROM tokens WHERE token IN ({','.join('?' * len(chunk))})", chunk
+            ))
+        new = words - known
+        if not new:
+            return
+        self._db.executemany("INSERT INTO tokens (token) VALUES (?)", ((w,) for w in new))
+        self._db.executemany(
+            "INSERT OR IGNORE INTO token_suffixes (suffix, token) "
+            "SELECT ?, id FROM tokens WHERE token = ?",
+            ((suffix, w) for w in new if w != LONG_TOKEN for suffix in suffixes(w))
+        )
+
+    def sync(self) -> None:
+        """Brings the index in line with the directory: new, grown, truncated and deleted files."""
+        files = set(self.log_files())
+        with self._lock:
+            known = {row[0] for row in self._db.execute("SELECT name FROM files")}
+        for name in known - files:
+            self.remove(name)
+        for name in sorted(files):
+            self.update(name)
+
+    def schedule(self, path: str) -> None:
+        """Queues a file for the background indexer."""
+        with self._cond:
+            self._pending.add(os.path.basename(path))
+            self._cond.notify()
+
+    def start(self) -> None:
+        """Starts the background indexer, beginning with a full sync."""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="search-indexer", daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        try:
+            self.sync()
+        except Exception as e:
+            logging.error(f"Error building search index: {str(e)}")
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                names, self._pending = self._pending, set()
+            for name in sorted(names):
+                try:
+                    self.update(name)
+                except Exception as e:
+                    logging.error(f"Error indexing log file {name}: {str(e)}")
+
+    # Queries
+
+    def _candidate_tokens(self, query: str) -> List[List[int]]:
+        """Token ids that may satisfy each word of the query.
+
+        A word in the middle of the query must match a whole indexed token; a
+        word touching the end of the query may be a prefix of a longer token,
+        and one touching the start a suffix, found through token_suffixes. A
+        word that may start inside a token can also lie past the indexed part
+        of a truncated token, so it matches the blocks with long words too.
+        """
+        groups = []
+        for match in TOKEN_RE.finditer(query):
+            word = match.group()[:MAX_TOKEN_LENGTH]
+            open_start = match.start() == 0
+            open_end = match.end() == len(query)
+            if not open_start and not open_end:
+                rows = self._db.execute("SELECT id FROM tokens WHERE token = ?", (word,))
+            elif not open_start:
+                rows = self._db.execute(
+                    "SELECT id FROM tokens WHERE token >= ? AND token < ?", (word, word + "\uffff")
+                )
+            elif not open_end:
+                rows = self._db.execute(
+                    "SELECT id FROM tokens WHERE token = ? "
+                    "UNION SELECT token FROM token_suffixes WHERE suffix = ? "
+                    "UNION SELECT id FROM tokens WHERE token = ?",
+                    (word, word, LONG_TOKEN)
+                )
+            else:
+                rows = self._db.execute(
+                    "SELECT id FROM tokens WHERE token >= ? AND token < ? "
+                    "UNION SELECT token FROM token_suffixes WHERE suffix >= ? AND suffix < ? "
+                    "UNION SELECT id FROM tokens WHERE token = ?",
+                    (word, word + "\uffff", word, word + "\uffff", LONG_TOKEN)
+                )
+            groups.append([row[0] for row in rows])
+        return groups
+
+    def _candidate_blocks(self, query: str, files: Optional[List[str]], level_mask: int,
+                          since: Optional[float], until: Optional[float],
+                          before_block: Optional[int]) -> Iterator[Tuple[int, str, int, int, int]]:
+        conditions = ["(levels & ?) != 0"]
+        params: List[Any] = [level_mask]
+        if files:
+            conditions.append(f"file IN ({','.join('?' * len(files))})")
+            params.extend(files)
+        if since is not None:
+            conditions.append("(max_ts IS NULL OR max_ts >= ?)")
+            params.append(since)
+        if until is not None:
+            conditions.append("(min_ts IS NULL OR min_ts <= ?)")
+            params.append(until)
+        if before_block is not None:
+            conditions.append("id <= ?")
+            params.append(before_block)
+
+        for token_ids in sorted(self._candidate_tokens(query), key=len):
+            if not token_ids:
+                return
+            placeholders = ",".join("?" * len(token_ids))
+            conditions.append(
+                f"id IN (SELECT block FROM postings WHERE token IN ({placeholders}))"
+            )
+            params.extend(token_ids)
+
+        sql = (f"SELECT id, file, start, end, first_line FROM blocks "
+               f"WHERE {' AND '.join(conditions)} ORDER BY id DESC")
+        yield from self._db.execute(sql, params).fetchall()
+
+    def search(self, query: str, files: Optional[Iterable[str]] = None,
+               levels: Optional[Iterable[str]] = None, since: Optional[float] = None,
+               until: Optional[float] = None, limit: int = 100,
+               cursor: Optional[str] = None) -> Dict[str, Any]:
+        """Finds lines containing the query (case-insensitive), newest blocks first.
+
+        Returns the matching lines with file, line number and byte offset, and a
+        cursor for the next page (None when there are no more results).
+        """
+        query = query.lower()
+        file_list = [os.path.basename(f) for f in files] if files else None
+        level_set = {level.lower() for level in levels} if levels else None
+        level_mask = ALL_LEVELS
+        if level_set:
+            level_mask = sum(LEVEL_BITS.get(level, 0) for level in level_set)
+
+        before_block = before_line = None
+        if cursor:
+            try:
+                block_part, line_part = cursor.split(":", 1)
+                before_block, before_line = int(block_part), int(line_part)
+            except ValueError:
+                pass
+
+        results: List[Dict[str, Any]] = []
+        next_cursor = None
+        last_block = None
+        with self._lock:
+            blocks = list(self._candidate_blocks(
+                query, file_list, level_mask, since, until, before_block
+            ))
+
+        for block_id, name, start, end, first_line in blocks:
+            matches = self._scan_block(name, start, end, first_line, query, level_set, since, until)
+            if block_id == before_block and before_line is not None:
+                matches = [m for m in matches if m["line"] < before_line]
+            for match in reversed(matches):
+                if len(results) == limit:
+                    next_cursor = f"{last_block}:{results[-1]['line']}"
+                    break
+                results.append(match)
+                last_block = block_id
+            if next_cursor:
+                break
+
+        return {"results": results, "next": next_cursor}
+
+    def _scan_block(self, name: str, start: int, end: int, first_line: int, query: str,
+                    level_set: Optional[Set[str]], since: Optional[float],
+                    until: Optional[float]) -> List[Dict[str, Any]]:
+        try:
+            with open_shared(self.segments.path(name)) as f:
+                f.seek(start)
+                data = f.read(end - start)
+        except OSError:
+            return []
+
+        matches = []
+        offset = start
+        for i, raw in enumerate(data.split(b"\n")[:-1]):
+            line_offset = offset
+            offset += len(raw) + 1
+            line = raw.decode("utf-8", errors="replace").rstrip("\r")
+            if query not in line.lower():
+                continue
+            entry = parse_line(line, name) if (level_set or since or until) else None
+            if entry is not None:
+                if level_set and entry.get("level") not in level_set:
+                    continue
+                ts = parse_timestamp(entry.get("ts", entry.get("timestamp")))
+                if ts is not None and ((since and ts < since) or (until and ts > until)):
+                    continue
+            matches.append({
+                "file": name,
+                "line": first_line + i,
+                "offset": line_offset,
+                "content": line.strip(),
+            })
+        return matches
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
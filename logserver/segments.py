@@ -0,0 +1,244 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from core.log_rotation import is_archive, open_log, parse_log_name, segment_order
+from logserver.pagination import read_page, forget as forget_line_index, DEFAULT_PAGE_SIZE
+
+# Total size of decompressed segments kept in the cache directory
+DEFAULT_CACHE_BYTES = 256 * 1024 * 1024
+READ_CHUNK = 1 << 20
+
+
+class SegmentStore:
+    """The session logs of one directory as ordered lists of segments.
+
+    A session is its active file <base>.log plus the rotated segments
+    <base>.<n>.log[.gz|.zst], oldest (lowest n) first. Compressed segments
+    are decompressed once into <logs>/.segments so pages and search blocks
+    can be read from them like from any other file; the cache keeps the most
+    recently used segments within cache_bytes.
+    """
+
+    def __init__(self, logs_dir: str, cache_bytes: int = DEFAULT_CACHE_BYTES) -> None:
+        self.logs_dir = str(logs_dir)
+        self.cache_dir = os.path.join(self.logs_dir, ".segments")
+        self.cache_bytes = cache_bytes
+        self._cached: "OrderedDict[str, int]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def sessions(self) -> Dict[str, List[str]]:
+        """Maps each session name (<base>.log) to its segment names, oldest first."""
+        sessions: Dict[str, List[str]] = {}
+        for name in os.listdir(self.logs_dir):
+            parsed = parse_log_name(name)
+            if parsed is not None:
+                sessions.setdefault(f"{parsed[0]}.log", []).append(name)
+        for names in sessions.values():
+            names.sort(key=segment_order)
+        return sessions
+
+    def segments(self, name: str) -> List[str]:
+        """Segments of the session a file name belongs to, oldest first."""
+        parsed = parse_log_name(name)
+        if parsed is None:
+            return []
+        return self.sessions().get(f"{parsed[0]}.log", [])
+
+    def path(self, name: str) -> str:
+        """A plain file holding the segment's uncompressed lines."""
+        if not is_archive(name):
+            return os.path.join(self.logs_dir, name)
+
+        archive = os.path.join(self.logs_dir, name)
+        cached = os.path.join(self.cache_dir, name)
+        with self._lock:
+            mtime = os.stat(archive).st_mtime
+            try:
+                stat = os.stat(cached)
+                fresh = stat.st_mtime == mtime
+            except OSError:
+                fresh = False
+            if not fresh:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                # Per process, so two log servers decompressing the same segment don't collide
+                tmp_path = f"{cached}.{os.getpid()}.tmp"
+                try:
+                    with open_log(archive) as src, open(tmp_path, "wb") as dst:
+                        while True:
+                            chunk = src.read(READ_CHUNK)
+                            if not chunk:
+                                break
+                            dst.write(chunk)
+                    os.utime(tmp_path, (mtime, mtime))
+                    os.replace(tmp_path, cached)
+                except BaseException:
+                    if os.path.exists(tmp_path):
+                        os.remove(tmp_path)
+                    raise
+                forget_line_index(cached)
+            self._cached[name] = os.path.getsize(cached)
+            self._cached.move_to_end(name)
+            self._evict(keep=name)
+        return cached
+
+    def _evict(self, keep: str) -> None:
+        total = sum(self._cached.values())
+        for name in list(self._cached):
+            if total <= self.cache_bytes:
+                break
+            if name == keep:
+                continue
+            total -= self._cached.pop(name)
+            self._remove_cached(name)
+
+    def _remove_cached(self, name: str) -> None:
+        cached = os.path.join(self.cache_dir, name)
+        forget_line_index(cached)
+        try:
+            os.remove(cached)
+        except OSError:
+            pass
+
+    def forget(self, name: str) -> None:
+        """Drops cached data of a segment that was deleted."""
+        with self._lock:
+            self._cached.pop(name, None)
+            self._remove_cached(name)
+
+    def open(self, name: str) -> Any:
+        """Opens a segment for streaming its uncompressed bytes."""
+        return open_log(os.path.join(self.logs_dir, name))
+
+    def iter_bytes(self, names: List[str]) -> Iterator[bytes]:
+        """The uncompressed bytes of the given segments, one after the other."""
+        for name in names:
+            try:
+                f = self.open(name)
+            except OSError:
+                continue
+            with f:
+                while True:
+                    chunk = f.read(READ_CHUNK)
+                    if not chunk:
+                        break
+                    yield chunk
+
+    # Pages across segments
+
+    def read_page(self, name: str, before: Any = None, after: Any = None,
+                  line: Optional[int] = None, limit: int = DEFAULT_PAGE_SIZE) -> Dict[str, Any]:
+        """Reads one page of a session, continuing into the neighbouring segments.
+
+        Cursors inside the active file are plain byte offsets, as for a single
+        file; cursors inside a rotated segment are "<n>:<offset>". line counts
+        within the active file.
+        """
+        parsed = parse_log_name(name)
+        segments = self.segments(name)
+        if parsed is None or not segments:
+            raise FileNotFoundError(name)
+        session = f"{parsed[0]}.log"
+        # A segment name on its own is read as a single file
+        if name != session:
+            segments = [name]
+
+        size = sum(self._size(segment) for segment in segments)
+        if after is not None or line is not None:
+            if line is None:
+                index, offset = self._parse_cursor(segments, after)
+            else:
+                index, offset = len(segments) - 1, None
+            page = self._read_forward(segments, session, index, offset, line, limit)
+        else:
+            index, offset = self._parse_cursor(segments, before)
+            page = self._read_backward(segments, session, index, offset, limit)
+        page["file"] = session if name == session else name
+        page["size"] = size
+        page["segments"] = len(segments)
+        return page
+
+    def _size(self, name: str) -> int:
+        try:
+            return os.path.getsize(os.path.join(self.logs_dir, name))
+        except OSError:
+            return 0
+
+    def _parse_cursor(self, segments: List[str], cursor: Any) -> Tuple[int, Optional[int]]:
+        """Segment index and byte offset of a cursor; None, the end of the active file."""
+        last = len(segments) - 1
+        if cursor is None or cursor == "":
+            return last, None
+        text = str(cursor)
+        seq, _, offset = text.rpartition(":")
+        try:
+            offset_value = int(offset)
+        except ValueError:
+            return last, None
+        if not seq:
+            return last, offset_value
+        for i, segment in enumerate(segments):
+            parsed = parse_log_name(segment)
+            if parsed is not None and str(parsed[1]) == seq:
+                return i, offset_value
+        return last, None
+
+    def _cursor(self, segments: List[str], index: int, offset: int) -> Any:
+        seq = parse_log_name(segments[index])[1]
+        return offset if seq is None else f"{seq}:{offset}"
+
+    def _read(self, segment: str, session: str, **kwargs: Any) -> Dict[str, Any]:
+        page = read_page(self.path(segment), name=session, **kwargs)
+        if segment != session:
+            for entry in page["entries"]:
+                entry["segment"] = segment
+        return page
+
+    def _read_backward(self, segments: List[str], session: str, index: int,
+                       offset: Optional[int], limit: int) -> Dict[str, Any]:
+        entries: List[Dict[str, Any]] = []
+        last_page = None
+        end_index = index
+        while True:
+            page = self._read(segments[index], session, before=offset, limit=limit - len(entries))
+            if last_page is None:
+                last_page = page
+            entries = page["entries"] + entries
+            if page["has_more_before"] or index == 0 or len(entries) >= limit:
+                break
+            index -= 1
+            offset = None
+
+        return {
+            "entries": entries,
+            "before": self._cursor(segments, index, page["before"]),
+            "after": self._cursor(segments, end_index, last_page["after"]),
+            "has_more_before": page["has_more_before"] or index > 0,
+            "has_more_after": last_page["has_more_after"] or end_index < len(segments) - 1,
+            "lines": last_page["lines"],
+        }
+
+    def _read_forward(self, segments: List[str], session: str, index: int, offset: Optional[int],
+                      line: Optional[int], limit: int) -> Dict[str, Any]:
+        entries: List[Dict[str, Any]] = []
+        first_page = None
+        start_index = index
+        while True:
+            page = self._read(segments[index], session, after=offset if line is None else None,
+                              line=line, limit=limit - len(entries))
+            if first_page is None:
+                first_page = page
+            entries += page["entries"]
+            if page["has_more_after"] or index == len(segments) - 1 or len(entries) >= limit:
+                break
+            index += 1
+            offset, line = 0, None
+
+        return {
+            "entries": entries,
+            "before": self._cursor(segments, start_index, first_page["before"]),
+            "after": self._cursor(segments, index, page["after"]),
+            "has_more_before": first_page["has_more_before"] or start_index > 0,
+            "has_more_after": page["has_more_after"] or index < len(segments) - 1,
+            "lines": page["lines"],
+        }
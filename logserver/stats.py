@@ -0,0 +1,293 @@
+import os
+import re
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+from core.log_format import parse_line
+from core.log_rotation import open_log
+
+# (bucket seconds, number of buckets) from finest to coarsest: one day of minutes, 30 days of hours
+DEFAULT_TIERS: Tuple[Tuple[int, int], ...] = ((60, 1440), (3600, 720))
+# Distinct route/status pairs and error messages kept per bucket; the rest count as OTHER
+MAX_ROUTES_PER_BUCKET = 500
+MAX_ERRORS_PER_BUCKET = 100
+MAX_MESSAGE_LENGTH = 200
+OTHER = "(other)"
+READ_CHUNK = 1 << 20
+
+LEVEL_NAMES: Tuple[str, ...] = ("debug", "info", "warning", "error", "critical", "other")
+LEVEL_INDEX = {name: i for i, name in enumerate(LEVEL_NAMES)}
+
+REQUEST_RE = re.compile(
+    r"^Route: (?P<route>.*?) \| Method: (?P<method>\S+) \| Status: (?P<status>\S+)"
+)
+
+RouteKey = Tuple[str, str]
+Tiers = Tuple[Tuple[int, int], ...]
+# (tier, start, level counts, route counts, error counts) of one bucket
+Bucket = Tuple[int, int, List[int], Dict[RouteKey, int], Dict[str, int]]
+
+
+class BucketRing:
+    """Counters for a fixed number of consecutive time buckets, reused round-robin."""
+
+    def __init__(self, seconds: int, count: int) -> None:
+        self.seconds = seconds
+        self.count = count
+        self.starts = [-1] * count
+        self.levels = [[0] * len(LEVEL_NAMES) for _ in range(count)]
+        self.routes: List[Dict[RouteKey, int]] = [{} for _ in range(count)]
+        self.errors: List[Dict[str, int]] = [{} for _ in range(count)]
+
+    @property
+    def span(self) -> int:
+        return self.seconds * self.count
+
+    def slot(self, ts: float) -> Optional[int]:
+        """Index of the bucket holding ts, cleared first if it held an older bucket.
+
+        None if ts is older than the ring.
+        """
+        start = int(ts // self.seconds) * self.seconds
+        index = (start // self.seconds) % self.count
+        current = self.starts[index]
+        if current != start:
+            if current > start:
+                return None
+            self.starts[index] = start
+            self.levels[index] = [0] * len(LEVEL_NAMES)
+            self.routes[index] = {}
+            self.errors[index] = {}
+        return index
+
+    def add(self, ts: float, level: int, route: Optional[RouteKey], error: Optional[str],
+            count: int = 1) -> None:
+        index = self.slot(ts)
+        if index is None:
+            return
+        self.levels[index][level] += count
+        if route is not None:
+            _increment(self.routes[index], route, count, MAX_ROUTES_PER_BUCKET, (OTHER, OTHER))
+        if error is not None:
+            _increment(self.errors[index], error, count, MAX_ERRORS_PER_BUCKET, OTHER)
+
+    def buckets(self, since: float, until: float) -> Iterable[int]:
+        """Indexes of the filled buckets starting in [since, until), oldest first."""
+        first = int(since // self.seconds) * self.seconds
+        for start in range(first, int(until), self.seconds):
+            index = (start // self.seconds) % self.count
+            if self.starts[index] == start:
+                yield index
+
+
+def _increment(counts: Dict[Any, int], key: Any, count: int, limit: int, other: Any) -> None:
+    if key not in counts and len(counts) >= limit:
+        key = other
+    counts[key] = counts.get(key, 0) + count
+
+
+class LogStats:
+    """Rolling counts of log lines, kept up to date as lines are tailed.
+
+    Each tier is a BucketRing: a line adds one to its level's counter in the
+    bucket of its timestamp, request lines (written by log_request) also to
+    their route and status, and error lines to their message. Old buckets are
+    overwritten, so memory stays fixed no matter how much is logged, and a
+    query only adds up the buckets in its range.
+    """
+
+    def __init__(self, tiers: Tiers = DEFAULT_TIERS) -> None:
+        self.tiers = [BucketRing(seconds, count) for seconds, count in tiers]
+        self._lock = threading.Lock()
+        self._epochs: Dict[str, float] = {}
+        self.lines = 0
+        self.backfilling = False
+
+    def _epoch(self, entry: Dict[str, Any]) -> Optional[float]:
+        ts = entry.get("ts")
+        if isinstance(ts, (int, float)):
+            return float(ts)
+        timestamp = entry.get("timestamp")
+        if not timestamp or len(timestamp) < 19:
+            return None
+        # Text timestamps are local time; converting once per minute is enough
+        minute = timestamp[:16]
+        epoch = self._epochs.get(minute)
+        if epoch is None:
+            try:
+                epoch = time.mktime(time.strptime(minute, "%Y-%m-%d %H:%M"))
+            except ValueError:
+                return None
+            if len(self._epochs) > 4096:
+                self._epochs.clear()
+            self._epochs[minute] = epoch
+        try:
+            return epoch + int(timestamp[17:19])
+        except ValueError:
+            return epoch
+
+    def add_entries(self, entries: Iterable[Dict[str, Any]]) -> None:
+        """Counts parsed log entries (see core.log_format.parse_line)."""
+        with self._lock:
+            for entry in entries:
+                level = entry.get("level")
+                if level == "none":
+                    continue
+                ts = self._epoch(entry)
+                if ts is None:
+                    continue
+                message = entry.get("message") or ""
+                route = None
+                if entry.get("route") is not None and entry.get("status") is not None:
+                    route = (str(entry["route"]), str(entry["status"]))
+                elif message.startswith("Route: "):
+                    match = REQUEST_RE.match(message)
+                    if match is not None:
+                        route = (match.group("route"), match.group("status"))
+                error = None
+                if level in ("error", "critical"):
+                    error = message.split("\n", 1)[0][:MAX_MESSAGE_LENGTH]
+                level_index = LEVEL_INDEX.get(level, LEVEL_INDEX["other"])
+                for ring in self.tiers:
+                    ring.add(ts, level_index, route, error)
+                self.lines += 1
+
+    def add_lines(self, lines: Iterable[str], file_name: str = "") -> None:
+        # Parsed in batches outside the lock, so a long backfill does not hold up queries
+        batch = []
+        for line in lines:
+            batch.append(parse_line(line, file_name))
+            if len(batch) >= 10000:
+                self.add_entries(batch)
+                batch = []
+        self.add_entries(batch)
+
+    def export(self) -> List[Bucket]:
+        """Filled buckets, for merging into another LogStats."""
+        with self._lock:
+            return [
+                (tier, ring.starts[i], ring.levels[i], ring.routes[i], ring.errors[i])
+                for tier, ring in enumerate(self.tiers)
+                for i in range(ring.count) if ring.starts[i] >= 0
+            ]
+
+    def merge(self, buckets: List[Bucket]) -> None:
+        with self._lock:
+            for tier, start, levels, routes, errors in buckets:
+                ring = self.tiers[tier]
+                index = ring.slot(start)
+                if index is None:
+                    continue
+                counts = ring.levels[index]
+                for i, count in enumerate(levels):
+                    counts[i] += count
+                for route, count in routes.items():
+                    _increment(
+                        ring.routes[index], route, count, MAX_ROUTES_PER_BUCKET, (OTHER, OTHER)
+                    )
+                for message, count in errors.items():
+                    _increment(ring.errors[index], message, count, MAX_ERRORS_PER_BUCKET, OTHER)
+
+    def query(self, since: float, until: float, step: Optional[int] = None,
+              top: int = 10) -> Dict[str, Any]:
+        """Counts between since and until, as a series of step-second buckets plus totals.
+
+        Uses the finest tier that still holds since; step is rounded up to a
+        multiple of that tier's bucket size.
+        """
+        now = time.time()
+        ring = next((r for r in self.tiers if now - since <= r.span), self.tiers[-1])
+        since = max(since, now - ring.span)
+        step = max(ring.seconds, -(-int(step or ring.seconds) // ring.seconds) * ring.seconds)
+        first = int(since // step) * step
+
+        series: Dict[int, List[int]] = {}
+        totals = [0] * len(LEVEL_NAMES)
+        routes: Dict[RouteKey, int] = {}
+        errors: Dict[str, int] = {}
+        with self._lock:
+            for index in ring.buckets(since, until):
+                start = ring.starts[index]
+                row_start = first + (start - first) // step * step
+                row = series.setdefault(row_start, [0] * len(LEVEL_NAMES))
+                for i, count in enumerate(ring.levels[index]):
+                    row[i] += count
+                    totals[i] += count
+                for route, count in ring.routes[index].items():
+                    routes[route] = routes.get(route, 0) + count
+                for message, count in ring.errors[index].items():
+                    errors[message] = errors.get(message, 0) + count
+
+        by_route: Dict[str, Dict[str, int]] = {}
+        for (route, status), count in routes.items():
+            by_route.setdefault(route, {})[status] = count
+        top_routes = sorted(by_route.items(), key=lambda item: -sum(item[1].values()))
+        return {
+            "since": first,
+            "until": int(until),
+            "step": step,
+            "buckets": [
+                {"start": start, "levels": dict(zip(LEVEL_NAMES, row))}
+                for start, row in sorted(series.items())
+            ],
+            "levels": dict(zip(LEVEL_NAMES, totals)),
+            "routes": [
+                {"route": route, "statuses": statuses, "count": sum(statuses.values())}
+                for route, statuses in top_routes[:top]
+            ],
+            "errors": [
+                {"message": message, "count": count}
+                for message, count in sorted(errors.items(), key=lambda item: -item[1])[:top]
+            ],
+            "backfilling": self.backfilling,
+        }
+
+    def backfill(self, files: List[Tuple[str, Optional[int]]], workers: int = 0) -> None:
+        """Counts the lines of (path, byte limit) pairs, in worker processes if workers > 1."""
+        self.backfilling = True
+        try:
+            if workers > 1 and len(files) > 1:
+                with ProcessPoolExecutor(max_workers=workers) as pool:
+                    tiers = [self.tier_spec()] * len(files)
+                    for lines, buckets in pool.map(_count_file, files, tiers):
+                        self.merge(buckets)
+                        with self._lock:
+                            self.lines += lines
+            else:
+                for path, limit in files:
+                    self.add_lines(_read_lines(path, limit), os.path.basename(path))
+        finally:
+            self.backfilling = False
+
+    def tier_spec(self) -> Tiers:
+        return tuple((ring.seconds, ring.count) for ring in self.tiers)
+
+
+def _read_lines(path: str, limit: Optional[int]) -> Iterator[str]:
+    """Lines of a log file or compressed segment, up to limit bytes."""
+    try:
+        with open_log(path) as f:
+            remaining = limit
+            partial = b""
+            while remaining is None or remaining > 0:
+                chunk = f.read(READ_CHUNK if remaining is None else min(READ_CHUNK, remaining))
+                if not chunk:
+                    break
+                if remaining is not None:
+                    remaining -= len(chunk)
+                lines = (partial + chunk).split(b"\n")
+                partial = lines.pop()
+                for line in lines:
+                    yield line.decode("utf-8", "replace").rstrip("\r")
+            if partial:
+                yield partial.decode("utf-8", "replace")
+    except OSError:
+        return
+
+
+def _count_file(item: Tuple[str, Optional[int]], tiers: Tiers) -> Tuple[int, List[Bucket]]:
+    path, limit = item
+    stats = LogStats(tiers)
+    stats.add_lines(_read_lines(path, limit), os.path.basename(path))
+    return stats.lines, stats.export()
@@ -0,0 +1,194 @@
+import logging
+import os
+import threading
+from typing import Callable, Dict, List, Optional, Set
+from core.log_rotation import open_shared
+
+# Bytes read from a file per call while catching up
+READ_CHUNK = 1 << 20
+# A partial line longer than this is passed on as it is instead of waiting for its newline
+MAX_PARTIAL = 1 << 20
+
+
+class TailedFile:
+    """Open handle and read position of one tailed file."""
+
+    __slots__ = ("path", "handle", "inode", "position", "partial")
+
+    def __init__(self, path: str, position: int = 0, inode: Optional[int] = None) -> None:
+        self.path = path
+        self.handle = None
+        self.inode = inode
+        self.position = position
+        self.partial = b""
+
+    def close(self) -> None:
+        if self.handle is not None:
+            self.handle.close()
+            self.handle = None
+
+
+class LogTailer:
+    """Follows appended lines of the files in a log directory.
+
+    Every file keeps one open handle, so a modify event costs one read of
+    the new bytes instead of an open and a seek. Only complete lines are
+    passed on; a line still being written stays buffered until its newline
+    arrives. Modify events only mark a file as dirty and wake the tailer
+    thread, so a burst of events for one file is handled with one read.
+
+    Before reading, the handle is compared with the path: a shorter file
+    was truncated and is read again from the start, a different inode means
+    the file was replaced, so the old handle is read to its end before the
+    new file is opened. Handles are opened with open_shared, so on Windows
+    they don't keep the app from rotating or compressing the file.
+    """
+
+    def __init__(self, on_lines: Callable[[str, List[str]], None],
+                 on_read: Optional[Callable[[str], None]] = None) -> None:
+        self.on_lines = on_lines
+        self.on_read = on_read
+        self._files: Dict[str, TailedFile] = {}
+        self._dirty: Set[str] = set()
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        # Held while reading, so a rename or forget never races a read of the same file
+        self._read_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self.lines = 0
+        self.truncations = 0
+        self.replacements = 0
+
+    def track(self, path: str, position: Optional[int] = None) -> None:
+        """Starts following a file from position (its current end by default), unless followed."""
+        with self._read_lock, self._lock:
+            if path in self._files:
+                return
+            try:
+                stat = os.stat(path)
+            except OSError:
+                return
+            start = stat.st_size if position is None else position
+            self._files[path] = TailedFile(path, start, stat.st_ino)
+
+    def notify(self, path: str) -> None:
+        """Marks a file as changed; the tailer thread reads it shortly."""
+        with self._cond:
+            self._dirty.add(path)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="log-tailer", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def rename(self, old: str, new: str) -> None:
+        """Keeps following a file under its new name, e.g. after it was rotated."""
+        with self._read_lock, self._lock:
+            tailed = self._files.pop(old, None)
+            if tailed is not None:
+                tailed.path = new
+                self._files.pop(new, None)
+                self._files[new] = tailed
+            if old in self._dirty:
+                self._dirty.discard(old)
+                self._dirty.add(new)
+        self.poll(new)
+
+    def forget(self, path: str) -> None:
+        """Reads what is left of a deleted or replaced file and stops following it."""
+        self.poll(path, final=True)
+        with self._read_lock, self._lock:
+            tailed = self._files.pop(path, None)
+            self._dirty.discard(path)
+        if tailed is not None:
+            tailed.close()
+
+    def poll(self, path: str, final: bool = False) -> None:
+        """Reads the new complete lines of one file right away."""
+        with self._read_lock:
+            with self._lock:
+                tailed = self._files.get(path)
+                if tailed is None:
+                    if final:
+                        return
+                    tailed = self._files[path] = TailedFile(path)
+            lines = self._read(tailed, final)
+            if lines:
+                # Still under the read lock, so lines of one file are passed on in order
+                self.lines += len(lines)
+                self.on_lines(path, lines)
+        if self.on_read is not None:
+            self.on_read(path)
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._dirty:
+                    self._cond.wait()
+                paths, self._dirty = self._dirty, set()
+            for path in paths:
+                try:
+                    self.poll(path)
+                except Exception:
+                    logging.exception(f"Error tailing log file {path}")
+
+    def _read(self, tailed: TailedFile, final: bool) -> List[str]:
+        lines: List[str] = []
+        try:
+            stat = os.stat(tailed.path)
+        except OSError:
+            stat = None
+
+        if tailed.handle is not None and stat is not None and stat.st_ino != tailed.inode:
+            # Replaced under the same name: finish the old file, then start on the new one
+            self.replacements += 1
+            self._drain(tailed, lines, final=True)
+            tailed.close()
+            tailed.position, tailed.partial = 0, b""
+        if tailed.handle is None:
+            if stat is None:
+                return lines
+            try:
+                tailed.handle = open_shared(tailed.path)
+            except OSError:
+                return lines
+            opened = os.fstat(tailed.handle.fileno())
+            if tailed.inode is not None and opened.st_ino != tailed.inode:
+                tailed.position, tailed.partial = 0, b""
+            tailed.inode = opened.st_ino
+
+        if os.fstat(tailed.handle.fileno()).st_size < tailed.position:
+            self.truncations += 1
+            tailed.position, tailed.partial = 0, b""
+        self._drain(tailed, lines, final)
+        return lines
+
+    def _drain(self, tailed: TailedFile, lines: List[str], final: bool) -> None:
+        tailed.handle.seek(tailed.position)
+        while True:
+            chunk = tailed.handle.read(READ_CHUNK)
+            if not chunk:
+                break
+            tailed.position += len(chunk)
+            data = tailed.partial + chunk
+            end = data.rfind(b"\n")
+            if end < 0:
+                tailed.partial = data
+            else:
+                lines.extend(line.decode("utf-8", "replace") for line in data[:end].split(b"\n"))
+                tailed.partial = data[end + 1:]
+            if len(tailed.partial) > MAX_PARTIAL:
+                lines.append(tailed.partial.decode("utf-8", "replace"))
+                tailed.partial = b""
+        if final and tailed.partial:
+            lines.append(tailed.partial.decode("utf-8", "replace"))
+            tailed.partial = b""
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "files": len(self._files),
+                "open": sum(1 for tailed in self._files.values() if tailed.handle is not None),
+                "lines": self.lines,
+                "truncations": self.truncations,
+                "replacements": self.replacements,
+            }
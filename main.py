@@ -1,4 +1,5 @@
 import os
+import time
 from dotenv import load_dotenv
 load_dotenv()
 
@@ -10,7 +11,8 @@ from core.logger import (
 if IS_NEW_SESSION:
     log_info(f"Starting Flask server with session ID: {SESSION_ID}")
 
-from flask import Flask, jsonify, request, session
+from flask import Flask, Response, jsonify, request, session, g
+from core.metrics import metrics, finish_request
 app = Flask(__name__, 
     static_folder="routes",  
     static_url_path="",
@@ -21,19 +23,23 @@ app.config["SECRET_KEY"] = os.getenv("SECRET_KEY", "fallback_secret")
 debug_mode = os.getenv("DEBUG", "False").lower() == "true"
 port = int(os.getenv("PORT", 5000))
 
-log_debug(f"Flask configuration: debug={debug_mode}, port={port}")
-log_debug(f"Static folder: {app.static_folder}")
-log_debug(f"Template folder: {app.template_folder}")
+log_debug("Flask configuration: debug=%s, port=%s", debug_mode, port)
+log_debug("Static folder: %s", app.static_folder)
+log_debug("Template folder: %s", app.template_folder)
 
 @app.before_request
 def log_before_request():
-    if not request.path.startswith(('/static/', '/favicon.ico')):
-        log_debug(f"Request received: {request.method} {request.path} from {request.remote_addr}")
+    g.request_started = time.perf_counter()
 
 @app.after_request
 def log_after_request(response):
+    started = g.get('request_started')
+    elapsed = time.perf_counter() - started if started else None
+    finish_request(response.status_code, elapsed)
     if not request.path.startswith(('/static/', '/favicon.ico')):
-        log_request(request.path, request.method, response.status_code)
+        latency_ms = round(elapsed * 1000, 3) if elapsed is not None else None
+        # The one access record of the request
+        log_request(request.path, request.method, response.status_code, latency_ms)
     return response
 
 from core.router import register_routes
@@ -42,6 +48,10 @@ from core.engine import setup
 setup(app)
 register_routes(app)
 
+from core.reloader import HOT_RELOAD, RouteReloader
+if HOT_RELOAD:
+    RouteReloader(app).start()
+
 @app.errorhandler(404)
 def not_found(error):
     log_error(error)
@@ -63,6 +73,10 @@ def debug_routes():
         })
     return jsonify(routes)
 
+@app.route('/debug/metrics')
+def debug_metrics():
+    return Response(metrics.render_prometheus(), mimetype="text/plain; version=0.0.4")
+
 @app.route('/login', methods=['GET', 'POST'])
 def login():
     if request.method == 'POST':
@@ -83,9 +97,23 @@ def logout():
     return jsonify({"success": True, "message": "Logged out"})
 
 if __name__ == "__main__":
-    log_info(f"Starting Flask server on port {port} (debug={debug_mode})")
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run the Flask router")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WORKERS", 0)),
+                        help="serve with N pre-forked worker processes "
+                             "instead of the development server")
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=port)
+    args = parser.parse_args()
+
     try:
-        app.run(host='0.0.0.0', debug=debug_mode, port=port, use_reloader=True)
+        if args.workers > 0:
+            from core.server import serve
+            serve(app, args.host, args.port, args.workers)
+        else:
+            log_info(f"Starting Flask server on port {args.port} (debug={debug_mode})")
+            app.run(host=args.host, debug=debug_mode, port=args.port, use_reloader=not HOT_RELOAD)
     except Exception as e:
         log_error(f"Error starting Flask server: {e}")
         raise
\ No newline at end of file
@@ -0,0 +1,69 @@
+import os
+from pathlib import Path
+from typing import Tuple
+
+import pytest
+from flask import Flask
+
+from core.manifest import RouteManifest
+from core.output_cache import CachePolicy, MemoryBackend, OutputCache, route_version
+
+POLICY = CachePolicy(ttl=60)
+
+
+@pytest.fixture
+def routes(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> RouteManifest:
+    """An unwatched manifest of a routes tree with a root layout and one page, /news."""
+    monkeypatch.setattr("core.manifest.ROUTE_CHECK_INTERVAL", 0)
+    (tmp_path / "_layout.html").write_text("<html><body>one {{ content }}</body></html>")
+    news = tmp_path / "news"
+    news.mkdir()
+    (news / "page.html").write_text("<p>first</p>")
+    manifest = RouteManifest(str(tmp_path))
+    manifest.build()
+    return manifest
+
+
+def _touch_later(path: Path, text: str) -> None:
+    """Rewrites a file with an mtime clearly after the previous one."""
+    mtime = os.stat(path).st_mtime
+    path.write_text(text)
+    os.utime(path, (mtime + 10, mtime + 10))
+
+
+def _get(cache: OutputCache, manifest: RouteManifest) -> Tuple[str, bytes]:
+    """Serves /news through the cache; returns the X-Cache state and the body."""
+    page = Path(manifest.routes_dir, "news", "page.html")
+    layout = Path(manifest.routes_dir, "_layout.html")
+
+    def render() -> bytes:
+        return layout.read_bytes() + page.read_bytes()
+
+    with Flask(__name__).test_request_context("/news"):
+        response = cache.serve(POLICY, route_version(None, "news", manifest), {}, render)
+        return response.headers["X-Cache"], response.get_data()
+
+
+def test_editing_page_misses_cache_without_watcher(routes: RouteManifest) -> None:
+    cache = OutputCache(MemoryBackend())
+    assert not routes.is_live
+
+    assert _get(cache, routes)[0] == "MISS"
+    assert _get(cache, routes)[0] == "HIT"
+
+    _touch_later(Path(routes.routes_dir, "news", "page.html"), "<p>second</p>")
+    state, body = _get(cache, routes)
+    assert state == "MISS"
+    assert b"second" in body
+
+
+def test_editing_layout_misses_cache_without_watcher(routes: RouteManifest) -> None:
+    cache = OutputCache(MemoryBackend())
+
+    assert _get(cache, routes)[0] == "MISS"
+    assert _get(cache, routes)[0] == "HIT"
+
+    _touch_later(Path(routes.routes_dir, "_layout.html"), "<html><body>two</body></html>")
+    state, body = _get(cache, routes)
+    assert state == "MISS"
+    assert b"two" in body
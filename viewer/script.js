@@ -27,10 +27,29 @@ document.addEventListener('DOMContentLoaded', () => {
     let currentFile = null;
     let entryCount = 0;
     let eventSource = null;
+    let lastEventId = null;
     let autoScroll = true;
     let currentFilter = 'all';
     let logEntries = [];
+    let visibleEntries = [];
     let logFiles = [];
+    let olderCursor = null;
+    let loadingOlder = false;
+    const PAGE_SIZE = 500;
+
+    // Virtualized list: only the rows around the viewport exist in the DOM. Entries
+    // beyond MAX_ENTRIES are dropped from memory, oldest first.
+    const MAX_ENTRIES = 50000;
+    const ROW_ESTIMATE = 52;
+    const OVERSCAN = 15;
+    let viewport = null;
+    let rowWindow = null;
+    let renderedEntries = [];
+    let offsets = new Float64Array(1024);
+    let layoutDirty = true;
+    let renderScheduled = false;
+    let scrollPending = false;
+    let rowGap = null;
     
     // Initialize
     init();
@@ -97,6 +116,21 @@ document.addEventListener('DOMContentLoaded', () => {
         clearLogsBtn.addEventListener('click', () => {
             clearLogs();
         });
+
+        // Render the rows scrolled into view, and load older history when scrolled to the top
+        logContainer.addEventListener('scroll', () => {
+            scheduleRender();
+            if (logContainer.scrollTop < 50) {
+                loadOlderLogs();
+            }
+        });
+
+        window.addEventListener('resize', () => {
+            // Wrapped rows change height with the width
+            logEntries.forEach(entry => { entry.height = null; });
+            layoutDirty = true;
+            scheduleRender();
+        });
     }
 
     /**
@@ -107,7 +141,9 @@ document.addEventListener('DOMContentLoaded', () => {
             eventSource.close();
         }
 
-        eventSource = new EventSource('/api/stream');
+        // Resume after the last event we saw, so nothing is lost across reconnects
+        const streamUrl = '/api/stream?format=columnar' + (lastEventId ? `&lastEventId=${lastEventId}` : '');
+        eventSource = new EventSource(streamUrl);
         
         eventSource.onopen = () => {
             updateConnectionStatus(true);
@@ -115,6 +151,9 @@ document.addEventListener('DOMContentLoaded', () => {
         };
         
         eventSource.onmessage = (event) => {
+            if (event.lastEventId) {
+                lastEventId = event.lastEventId;
+            }
             const data = JSON.parse(event.data);
             
             if (data.connected) {
@@ -122,12 +161,18 @@ document.addEventListener('DOMContentLoaded', () => {
                 return;
             }
             
-            // Process log entries
-            data.forEach(entry => {
-                processLogEntry(entry);
-            });
+            // Batches arrive as columns (or as an array of entries from older servers)
+            addEntries(Array.isArray(data) ? data : decodeColumnar(data));
         };
         
+        // The server dropped us for falling too far behind: reload instead of replaying the gap
+        eventSource.addEventListener('reset', (event) => {
+            lastEventId = event.lastEventId || null;
+            if (currentFile) {
+                loadLogs(currentFile);
+            }
+        });
+        
         eventSource.onerror = () => {
             updateConnectionStatus(false);
             updateStatus('Connection lost. Reconnecting...');
@@ -229,22 +274,14 @@ document.addEventListener('DOMContentLoaded', () => {
         updateStatus(`Loading logs from ${filename}...`);
         logContainer.innerHTML = '<div class="loading pulsate">Loading logs...</div>';
         
-        fetch(`/api/logs?file=${filename}`)
+        // Newest page first; older pages are fetched on demand by loadOlderLogs
+        fetch(`/api/logs?file=${encodeURIComponent(filename)}&limit=${PAGE_SIZE}`)
             .then(response => response.json())
-            .then(entries => {
+            .then(page => {
                 clearLogs();
-                entries.forEach(entry => {
-                    processLogEntry(entry, false); // Don't scroll for initial load
-                });
-                updateStatus(`Loaded ${entries.length} log entries`);
-                
-                // Update counters
-                updateEntryCount();
-                
-                // Scroll to bottom after initial load
-                if (autoScroll) {
-                    scrollToBottom();
-                }
+                olderCursor = page.has_more_before ? page.before : null;
+                addEntries(page.entries);
+                updateStatus(`Loaded ${page.entries.length} of ${page.lines} log entries`);
             })
             .catch(error => {
                 logContainer.innerHTML = `<div class="error">Error loading logs: ${error.message}</div>`;
@@ -254,15 +291,154 @@ document.addEventListener('DOMContentLoaded', () => {
     }
 
     /**
-     * Process a log entry and add it to the display
+     * Load the page of entries preceding the oldest one shown
      */
-    function processLogEntry(entry, scroll = true) {
-        // Skip entries from other files if a file is selected
-        if (currentFile && entry.file && entry.file !== currentFile) {
+    function loadOlderLogs() {
+        if (olderCursor === null || loadingOlder || !currentFile) return;
+        if (logEntries.length >= MAX_ENTRIES) {
+            updateStatus(`Showing the newest ${MAX_ENTRIES} entries; download the log for older ones`);
             return;
         }
         
-        // Create log entry element
+        loadingOlder = true;
+        const filename = currentFile;
+        updateStatus('Loading older entries...');
+        
+        fetch(`/api/logs?file=${encodeURIComponent(filename)}&before=${olderCursor}&limit=${PAGE_SIZE}`)
+            .then(response => response.json())
+            .then(page => {
+                if (filename !== currentFile) return;
+                
+                addEntries(page.entries, true);
+                
+                olderCursor = page.has_more_before ? page.before : null;
+                updateStatus(olderCursor === null ? 'Reached the start of the file' : `Loaded ${page.entries.length} older entries`);
+            })
+            .catch(error => {
+                updateStatus(`Error loading older logs: ${error.message}`);
+                console.error('Error loading older logs:', error);
+            })
+            .finally(() => {
+                loadingOlder = false;
+            });
+    }
+
+    /**
+     * Add entries to the in-memory ring (at the end, or before the oldest one for older pages)
+     */
+    function addEntries(entries, prepend = false) {
+        const added = [];
+        entries.forEach(entry => {
+            // Skip entries from other files if a file is selected
+            if (currentFile && entry.file && entry.file !== currentFile) {
+                return;
+            }
+            added.push(storeEntry(entry));
+        });
+        if (added.length === 0) return;
+        
+        ensureViewport();
+        const matching = added.filter(matchesFilters);
+        if (prepend) {
+            logEntries = added.concat(logEntries);
+            visibleEntries = matching.concat(visibleEntries);
+            // Keep the entries that were on screen in place
+            computeLayout();
+            logContainer.scrollTop += matching.length * ROW_ESTIMATE;
+        } else {
+            added.forEach(entry => logEntries.push(entry));
+            matching.forEach(entry => visibleEntries.push(entry));
+            trimEntries();
+            layoutDirty = true;
+            scrollPending = autoScroll;
+        }
+        
+        entryCount = logEntries.length;
+        scheduleRender();
+    }
+
+    /**
+     * Drop the oldest entries beyond MAX_ENTRIES
+     */
+    function trimEntries() {
+        const excess = logEntries.length - MAX_ENTRIES;
+        if (excess <= 0) return;
+        
+        let droppedVisible = 0;
+        let droppedHeight = 0;
+        for (let i = 0; i < excess; i++) {
+            if (logEntries[i].visible) {
+                droppedVisible++;
+                droppedHeight += logEntries[i].height || ROW_ESTIMATE;
+            }
+        }
+        logEntries.splice(0, excess);
+        visibleEntries.splice(0, droppedVisible);
+        olderCursor = null;
+        if (!autoScroll) {
+            logContainer.scrollTop -= droppedHeight;
+        }
+    }
+
+    /**
+     * Turn an entry from the server into the object kept in memory
+     */
+    function storeEntry(entry) {
+        const message = entry.message || entry.raw || '';
+        return {
+            entry: entry,
+            message: message,
+            text: ((entry.timestamp || '') + ' ' + (entry.level || '') + ' ' + message).toLowerCase(),
+            level: entry.level || 'none',
+            file: entry.file || currentFile,
+            visible: false,
+            height: null,
+            element: null
+        };
+    }
+
+    /**
+     * Expand a columnar batch ({count, columns}) into entries
+     */
+    function decodeColumnar(frame) {
+        const entries = [];
+        for (let i = 0; i < frame.count; i++) {
+            entries.push({});
+        }
+        Object.keys(frame.columns).forEach(field => {
+            const column = frame.columns[field];
+            for (let i = 0; i < frame.count; i++) {
+                let value;
+                if (Array.isArray(column)) {
+                    value = column[i];
+                } else if ('const' in column) {
+                    value = column.const;
+                } else {
+                    value = column.values[column.codes[i]];
+                }
+                if (value !== null && value !== undefined) {
+                    entries[i][field] = value;
+                }
+            }
+        });
+        return entries;
+    }
+
+    /**
+     * Whether a stored entry passes the level filter and the search text
+     */
+    function matchesFilters(stored) {
+        const searchText = logSearch.value.toLowerCase();
+        stored.visible = (currentFilter === 'all' || stored.level === currentFilter) &&
+            (searchText === '' || stored.text.includes(searchText));
+        return stored.visible;
+    }
+
+    /**
+     * Create the DOM row for a stored entry
+     */
+    function createRow(stored) {
+        const entry = stored.entry;
         const template = document.importNode(logEntryTemplate.content, true);
         const logEntry = template.querySelector('.log-entry');
         
@@ -284,15 +460,15 @@ document.addEventListener('DOMContentLoaded', () => {
         
         // Set file name
         if (entry.file) {
-            logEntry.querySelector('.log-file').textContent = entry.file;
+            // Lines collected from other app nodes name the node and pre-fork worker
+            const origin = entry.node ? ` · ${entry.node}${entry.worker != null ? '#' + entry.worker : ''}` : '';
+            logEntry.querySelector('.log-file').textContent = entry.file + origin;
         } else {
             logEntry.querySelector('.log-file').remove();
         }
         
-        // Set message
-        let message = entry.message || entry.raw || '';
-        
         // Check for tracebacks
+        const message = stored.message;
         if (message.includes('Traceback (most recent call last)')) {
             const parts = message.split('Traceback (most recent call last)');
             logEntry.querySelector('.log-message').textContent = parts[0];
@@ -304,32 +480,108 @@ document.addEventListener('DOMContentLoaded', () => {
         } else {
             logEntry.querySelector('.log-message').textContent = message;
         }
-        
-        // Apply current filter
-        if (currentFilter !== 'all' && entry.level !== currentFilter) {
-            logEntry.classList.add('hidden');
+        return logEntry;
+    }
+
+    /**
+     * Render on the next animation frame, once however many batches arrive before it
+     */
+    function scheduleRender() {
+        if (renderScheduled) return;
+        renderScheduled = true;
+        requestAnimationFrame(render);
+    }
+
+    /**
+     * Recompute the top offset of every visible entry from measured or estimated heights
+     */
+    function computeLayout() {
+        const count = visibleEntries.length;
+        if (offsets.length < count + 1) {
+            offsets = new Float64Array(Math.max(count + 1, offsets.length * 2));
         }
+        let top = 0;
+        for (let i = 0; i < count; i++) {
+            offsets[i] = top;
+            top += visibleEntries[i].height || ROW_ESTIMATE;
+        }
+        offsets[count] = top;
+        viewport.style.height = `${top}px`;
+        layoutDirty = false;
+    }
+
+    /**
+     * Index of the visible entry at a vertical position
+     */
+    function entryAt(y) {
+        let low = 0;
+        let high = visibleEntries.length;
+        while (low < high) {
+            const mid = (low + high) >> 1;
+            if (offsets[mid + 1] <= y) {
+                low = mid + 1;
+            } else {
+                high = mid;
+            }
+        }
+        return low;
+    }
+
+    /**
+     * Put the rows around the viewport into the DOM and measure them
+     */
+    function render() {
+        renderScheduled = false;
+        if (!viewport) return;
+        if (layoutDirty) computeLayout();
+        const stickToBottom = scrollPending;
+        scrollPending = false;
+        if (stickToBottom) scrollToBottom();
+        
+        const count = visibleEntries.length;
+        const scrollTop = Math.max(0, logContainer.scrollTop - viewport.offsetTop);
+        const first = entryAt(scrollTop);
+        const start = Math.max(0, first - OVERSCAN);
+        const end = Math.min(count, entryAt(scrollTop + logContainer.clientHeight) + OVERSCAN + 1);
+        
+        // Reuse the rows that stay in view; let the others go
+        const rows = visibleEntries.slice(start, end);
+        renderedEntries.forEach(stored => {
+            if (!stored.visible || rows.indexOf(stored) === -1) stored.element = null;
+        });
+        const fragment = document.createDocumentFragment();
+        rows.forEach(stored => {
+            fragment.appendChild(stored.element || (stored.element = createRow(stored)));
+        });
+        rowWindow.replaceChildren(fragment);
+        rowWindow.style.transform = `translateY(${offsets[start]}px)`;
+        renderedEntries = rows;
         
-        // Add to log container
-        logContainer.appendChild(logEntry);
-        
-        // Store entry for searching/filtering
-        logEntries.push({
-            element: logEntry,
-            text: (entry.timestamp || '') + ' ' + (entry.level || '') + ' ' + message,
-            level: entry.level || 'none',
-            file: entry.file || currentFile
+        // Replace estimates with real heights; rows above the first one on screen move the content
+        if (rowGap === null && rows.length) {
+            rowGap = parseFloat(getComputedStyle(rows[0].element).marginBottom) || 0;
+        }
+        let shift = 0;
+        rows.forEach((stored, i) => {
+            const height = stored.element.offsetHeight + rowGap;
+            if (height !== stored.height) {
+                if (start + i < first) shift += height - (stored.height || ROW_ESTIMATE);
+                stored.height = height;
+                layoutDirty = true;
+            }
         });
+        if (layoutDirty) {
+            computeLayout();
+            rowWindow.style.transform = `translateY(${offsets[start]}px)`;
+            if (stickToBottom) {
+                scrollToBottom();
+            } else if (shift) {
+                logContainer.scrollTop += shift;
+            }
+        }
         
-        // Update entry count
-        entryCount++;
         updateEntryCount();
         
-        // Auto-scroll
-        if (scroll && autoScroll) {
-            scrollToBottom();
-        }
-        
         // Remove welcome message if present
         const welcomeMessage = logContainer.querySelector('.welcome-message');
         if (welcomeMessage) {
@@ -341,35 +593,10 @@ document.addEventListener('DOMContentLoaded', () => {
      * Filter log entries based on search text
      */
     function filterLogs() {
-        const searchText = logSearch.value.toLowerCase();
-        let visibleCount = 0;
-        
-        logEntries.forEach(entry => {
-            // Check if entry matches search and filter
-            const matchesSearch = searchText === '' || entry.text.toLowerCase().includes(searchText);
-            const matchesFilter = currentFilter === 'all' || entry.level === currentFilter;
-            
-            // Show/hide based on matches
-            entry.element.classList.toggle('hidden', !(matchesSearch && matchesFilter));
-            
-            // Count visible entries
-            if (matchesSearch && matchesFilter) {
-                visibleCount++;
-            }
-        });
-        
-        // Update counter
-        const hiddenCount = entryCount - visibleCount;
-        if (hiddenCount > 0) {
-            entryCounter.textContent = `${visibleCount} of ${entryCount} entries`;
-        } else {
-            entryCounter.textContent = `${entryCount} entries`;
-        }
-        
-        // If auto-scroll enabled, scroll to bottom
-        if (autoScroll) {
-            scrollToBottom();
-        }
+        visibleEntries = logEntries.filter(matchesFilters);
+        layoutDirty = true;
+        scrollPending = autoScroll;
+        scheduleRender();
     }
 
     /**
@@ -390,16 +617,43 @@ document.addEventListener('DOMContentLoaded', () => {
      */
     function clearLogs() {
         logContainer.innerHTML = '';
+        viewport = null;
+        ensureViewport();
+        
         logEntries = [];
+        visibleEntries = [];
+        renderedEntries = [];
+        olderCursor = null;
         entryCount = 0;
+        layoutDirty = true;
         updateEntryCount();
     }
 
+    /**
+     * Create the scrollable area the rendered rows are positioned in
+     */
+    function ensureViewport() {
+        if (viewport && viewport.parentNode === logContainer) return;
+        viewport = document.createElement('div');
+        viewport.className = 'log-viewport';
+        rowWindow = document.createElement('div');
+        rowWindow.className = 'log-window';
+        viewport.appendChild(rowWindow);
+        logContainer.appendChild(viewport);
+        renderedEntries = [];
+        layoutDirty = true;
+    }
+
     /**
      * Update the entry counter
      */
     function updateEntryCount() {
-        entryCounter.textContent = `${entryCount} entries`;
+        const visibleCount = visibleEntries.length;
+        if (visibleCount < entryCount) {
+            entryCounter.textContent = `${visibleCount} of ${entryCount} entries`;
+        } else {
+            entryCounter.textContent = `${entryCount} entries`;
+        }
     }
 
     /**